@@ -3,18 +3,29 @@
 
 import os
 import sys
+import math
 import time
 import json
-import signal
 import argparse
+import statistics
+import multiprocessing as mp
+from multiprocessing.connection import wait
 import numpy as np
 import pandas as pd
 
 sys.path.append("../src")
 from synthesizer import SynthDriver
+from stats import PHASES
 
-def timeout(sig, frame):
-    raise TimeoutError("benchmark timeout")
+# graph sizes reported per benchmark, from the last step that recorded them
+SIZES = ["IDGNodes", "IDGEdges", "DAGNodes", "DAGEdges", "DAGExprs"]
+
+def positive_int(value: str) -> int:
+    """ argparse type of counts that must be at least 1 """
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {n}")
+    return n
 
 def load_data(data: str) -> dict:
     with open(data, "r", encoding="utf-8") as f:
@@ -23,38 +34,119 @@ def load_data(data: str) -> dict:
     data = {"input": [], "output": []}
     examples = raw_data["Examples"]
     for ex in examples:
-        data['input'] += ex["Input"]
         data['output'].append(ex["Output"])
 
-    data["input"] = [data["input"]]
+    # one list per input column
+    data["input"] = [list(column) for column in zip(*(ex["Input"] for ex in examples))]
     return data
 
-def run_bench(benchmark: str) -> list:
-    """ run a benchmark """
+def run_bench(benchmark: str, order_examples: bool = True) -> tuple:
+    """ run a benchmark, returning (status, time, stats) """
     # load spec data
     spec = load_data(benchmark)
 
-    # set signal handler
-    signal.signal(signal.SIGALRM, timeout)
-
-    # setup time and timer
+    # setup time
     status = None
     end = -1
-    signal.alarm(1)
-    start = time.time()
+    synth = SynthDriver(stats=True, order_examples=order_examples)
+    start = time.perf_counter()
     try:
-        synth = SynthDriver()
         idg = synth.gen_input_data_graph(spec['input'])
         dag = synth.gen_dag(spec['input'], spec['output'], idg)
         formula = synth.extract_formula(dag)
-        end = time.time() - start
+        end = time.perf_counter() - start
         status = 'success'
-    except TimeoutError as e:
-        status = 'timeout'
     except Exception as e:
         status = 'fail'
 
-    return (status, end)
+    return (status, end, synth.stats.to_dict())
+
+def _worker(benchmark: str, order_examples: bool, conn):
+    """ Entry point of a worker process: run one trial and report back """
+    conn.send(run_bench(benchmark, order_examples))
+    conn.close()
+
+def run_trials(trials: list, jobs: int, timeout: float, order_examples: bool = True) -> dict:
+    """ Run (name, spec path) trials in worker processes
+
+        At most `jobs` workers run at once. A worker still running `timeout`
+        seconds after it started is killed and its trial is a timeout, so a
+        runaway spec cannot hold up the suite. Returns {name: [(status,
+        time, stats), ...]}
+    """
+    results = {name: [] for name, _ in trials}
+    pending = list(reversed(trials))
+    running = {}
+    while pending or running:
+        # fill the free worker slots
+        while pending and len(running) < jobs:
+            name, path = pending.pop()
+            recv, send = mp.Pipe(duplex=False)
+            proc = mp.Process(target=_worker, args=(path, order_examples, send), daemon=True)
+            proc.start()
+            send.close()
+            running[recv] = (name, proc, time.monotonic() + timeout)
+
+        # wait for a result or the nearest deadline
+        nearest = min(deadline for _, _, deadline in running.values())
+        ready = wait(list(running), timeout=max(0, nearest - time.monotonic()))
+
+        for conn in list(running):
+            name, proc, deadline = running[conn]
+            if conn in ready:
+                try:
+                    results[name].append(conn.recv())
+                except EOFError:
+                    # the worker died without reporting
+                    results[name].append(('fail', -1, None))
+            elif time.monotonic() >= deadline:
+                proc.kill()
+                results[name].append(('timeout', -1, None))
+            else:
+                continue
+
+            proc.join()
+            conn.close()
+            del running[conn]
+
+    return results
+
+def summarize(trials: list) -> list:
+    """ Collapse the trials of a benchmark into [result, time, min, median, p95]
+
+        A benchmark only succeeds if every trial does; times are over the
+        successful trials
+    """
+    statuses = set(status for status, _, _ in trials)
+    if statuses == {'success'}:
+        times = sorted(t for _, t, _ in trials)
+        p95 = times[math.ceil(0.95 * len(times)) - 1]
+        median = statistics.median(times)
+        return ['success', median, times[0], median, p95]
+
+    status = 'timeout' if 'timeout' in statuses else 'fail'
+    return [status, -1, -1, -1, -1]
+
+def stats_columns(trials: list) -> list:
+    """ Per-phase times and calls, graph sizes, then the example order, of the
+        last successful trial
+    """
+    stats = None
+    for status, _, trial_stats in trials:
+        if status == 'success':
+            stats = trial_stats
+    if stats is None:
+        return [-1] * (2 * len(PHASES) + len(SIZES)) + [""]
+
+    row = []
+    for phase in PHASES:
+        row += [stats["phases"][phase]["time"], stats["phases"][phase]["calls"]]
+
+    sizes = {}
+    for step in stats["steps"]:
+        sizes.update({k: v for k, v in step.items() if k in SIZES})
+    order = " ".join(map(str, stats["info"].get("example_order", [])))
+    return row + [sizes.get(size, -1) for size in SIZES] + [order]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -73,11 +165,38 @@ if __name__ == "__main__":
                 default="benchmark.csv",
                 help="Filename (csv) to save benchmark results to"
     )
+    parser.add_argument(
+                "--jobs",
+                dest="jobs",
+                type=positive_int,
+                default=1,
+                help="Number of benchmarks to run in parallel (default: 1)"
+    )
+    parser.add_argument(
+                "--timeout",
+                dest="timeout",
+                type=float,
+                default=1.0,
+                help="Wall-clock timeout per trial in seconds (default: 1.0)"
+    )
+    parser.add_argument(
+                "--repeat",
+                dest="repeat",
+                type=positive_int,
+                default=1,
+                help="Number of trials per benchmark (default: 1)"
+    )
+    parser.add_argument(
+                "--row-order",
+                dest="row_order",
+                action="store_true",
+                help="Intersect the examples in spec order rather than the planned order"
+    )
     args = parser.parse_args()
 
     if os.path.isdir(args.bench):
         print(f"[+] Benchmark path: {os.path.abspath(args.bench)}")
-        benchmark_results = []
+        benchmarks = []
         for bench in os.listdir(args.bench):
             # each benchmark should be a directory
             # with spec.json and meta.json
@@ -86,16 +205,34 @@ if __name__ == "__main__":
                 continue
 
             if "spec.json" in os.listdir(os.path.join(args.bench, bench)):
-                print(f"[+] {bench}")
-                status, delay = run_bench(os.path.join(args.bench, bench, "spec.json"))
-                benchmark_results.append([bench, status, delay])
+                benchmarks.append(bench)
+
+        print(f"[+] {len(benchmarks)} benchmarks x {args.repeat} trials on {args.jobs} workers")
+        trials = [
+            (bench, os.path.join(args.bench, bench, "spec.json"))
+            for _ in range(args.repeat)
+            for bench in benchmarks
+        ]
+        results = run_trials(trials, args.jobs, args.timeout, not args.row_order)
+
+        benchmark_results = []
+        for bench in benchmarks:
+            row = [bench] + summarize(results[bench]) + [args.repeat]
+            row += stats_columns(results[bench])
+            print(f"[+] {bench}: {row[1]}")
+            benchmark_results.append(row)
 
         # use a dataframe for analysis
+        numeric = ["Time", "MinTime", "MedianTime", "P95Time", "Trials"]
+        for phase in PHASES:
+            numeric += [f"Time[{phase}]", f"Calls[{phase}]"]
+        numeric += SIZES
         df = pd.DataFrame(
-                    np.array(benchmark_results),
-                    columns=["Benchmark", "Result", "Time"]
+                    np.array(benchmark_results, dtype=object),
+                    columns=["Benchmark", "Result"] + numeric + ["Order"]
             )
-        df["Time"] = pd.to_numeric(df["Time"])
+        for column in numeric:
+            df[column] = pd.to_numeric(df[column])
 
         # pull out distinct trial sets
         successful = df[df['Result'] == 'success']
@@ -0,0 +1,373 @@
+""" Measure how the cost of each synthesis phase grows with the spec """
+# eval/scaling.py
+
+import re
+import sys
+import csv
+import json
+import math
+import time
+import random
+import argparse
+import statistics
+
+sys.path.append("../src")
+from synthesizer import SynthDriver
+from graphs.graph_cache import GraphCache
+from budget import Budget
+from stats import PHASES
+
+# phases timed separately; rank runs inside extract_formula's search
+STAGES = [phase for phase in PHASES if phase != "rank"]
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+# the curves measure() can sweep
+AXES = ["length", "rows", "output", "density"]
+
+def positive_int(value: str) -> int:
+    """ argparse type of sizes and counts that must be at least 1, as in
+        run-benchmarks.py
+    """
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {n}")
+    return n
+
+def _word(rng: random.Random, length: int) -> str:
+    """ A capitalized word of random letters """
+    length = max(1, length)
+    return rng.choice(LETTERS).upper() + "".join(rng.choice(LETTERS) for _ in range(length - 1))
+
+def _digits(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("0123456789") for _ in range(max(1, length)))
+
+def _jitter(rng: random.Random, length: int) -> int:
+    """ length give or take one, so the rows of a spec differ in length """
+    return max(2, length + rng.randint(-1, 1))
+
+def gen_name(rng: random.Random, length: int, word: int = None) -> tuple:
+    """ "First Middle Last" -> "Last, F."
+
+        Without word, a first and a last name share the length. With it,
+        every name is about word letters long and middle names fill the
+        rest
+    """
+    if word is None:
+        first = _word(rng, _jitter(rng, (length - 1) // 2))
+        last = _word(rng, _jitter(rng, length - 1 - len(first)))
+        return f"{first} {last}", f"{last}, {first[0]}."
+
+    names = [_word(rng, _jitter(rng, word)) for _ in range(2)]
+    while sum(len(n) + 1 for n in names) <= length:
+        names.insert(-1, _word(rng, _jitter(rng, word)))
+    return " ".join(names), f"{names[-1]}, {names[0][0]}."
+
+def gen_address(rng: random.Random, length: int, word: int = None) -> tuple:
+    """ "12 Oak Elm St, City, ST 12345" -> "City"
+
+        Longer addresses get more street words, so the token density grows
+        with the length rather than the length of the tokens. Street words
+        are about word letters long when it is given
+    """
+    number = _digits(rng, rng.randint(1, 4))
+    city = _word(rng, _jitter(rng, 6))
+    state = _word(rng, 2).upper()
+    tail = f" St, {city}, {state} {_digits(rng, 5)}"
+
+    street = []
+    while len(number) + sum(len(w) + 1 for w in street) + len(tail) < length or not street:
+        street.append(_word(rng, rng.randint(3, 8) if word is None else word))
+    return f"{number} {' '.join(street)}{tail}", city
+
+def gen_phone(rng: random.Random, length: int, word: int = None) -> tuple:
+    """ "+1 (123) 456-7890 x12" -> "123-456-7890"
+
+        The extension takes up whatever length the number does not, in
+        dash separated groups of word digits when it is given
+    """
+    area, exchange, line = _digits(rng, 3), _digits(rng, 3), _digits(rng, 4)
+    inp = f"+1 ({area}) {exchange}-{line}"
+    if length > len(inp) + 2:
+        extension = _digits(rng, _jitter(rng, length - len(inp) - 2))
+        if word is not None:
+            extension = "-".join(extension[i:i + word] for i in range(0, len(extension), word))
+        inp += f" x{extension}"
+    return inp, f"{area}-{exchange}-{line}"
+
+SHAPES = {
+    "name": gen_name,
+    "address": gen_address,
+    "phone": gen_phone
+}
+
+def _repeat(out: str, length: int) -> str:
+    """ out repeated, space separated, to about length characters """
+    return " ".join([out] * max(1, round((length + 1) / (len(out) + 1))))
+
+def token_density(s: str) -> float:
+    """ Runs of letters or digits per character """
+    return len(re.findall(r"[A-Za-z]+|[0-9]+", s)) / max(1, len(s))
+
+def gen_spec(shape: str, length: int, rows: int, seed: int = 0,
+             output: int = None, word: int = None) -> tuple:
+    """ ([input column], outputs) of a synthetic spec
+
+        output sets the length of the outputs, which repeat the output of
+        the shape; the name and address outputs otherwise follow the input
+        length and the phone number is fixed. word sets the length of the
+        words the inputs are made of, and so their token density.
+        Deterministic in its arguments: the same arguments always give the
+        same spec
+    """
+    key = f"{shape}:{length}:{rows}:{seed}"
+    if output is not None or word is not None:
+        key += f":{output}:{word}"
+    rng = random.Random(key)
+    examples = [SHAPES[shape](rng, length, word) for _ in range(rows)]
+    outputs = [out if output is None else _repeat(out, output) for _, out in examples]
+    return [[inp for inp, _ in examples]], outputs
+
+def run_spec(inp_data: list, output_data: list, time_budget: float = None) -> dict:
+    """ Synthesize a spec once, returning the time of each stage
+
+        A fresh, disabled graph cache keeps gen_graph_str from being
+        skipped on repeated strings
+    """
+    synth = SynthDriver(stats=True, graph_cache=GraphCache(max_entries=0))
+    if time_budget is not None:
+        synth.budget = Budget(seconds=time_budget)
+
+    start = time.perf_counter()
+    idg = synth.gen_input_data_graph(inp_data)
+    dag = synth.gen_dag(inp_data, output_data, idg)
+    try:
+        formula = synth.extract_formula(dag)
+    except RuntimeError:
+        formula = None
+    total = time.perf_counter() - start
+
+    times = {stage: synth.stats.phases[stage]["time"] for stage in STAGES}
+    # the search ranks nodes as it goes, count it with extraction
+    times["extract_formula"] += synth.stats.phases["rank"]["time"]
+    times["total"] = total
+    return {
+        "times": times,
+        "complete": formula is not None and not synth.uncovered,
+        "sizes": {**(synth.stats.last("IDG") or {}), **(synth.stats.last("DAG") or {})}
+    }
+
+def measure(shape: str, axis: str, sizes: list, length: int, rows: int,
+            repeat: int = 3, seed: int = 0, time_budget: float = None) -> list:
+    """ One row per size along axis, with the median time of each stage
+        over the repeats
+
+        The size of a "length" point is the input length, of a "rows" point
+        the row count, of an "output" point the output length and of a
+        "density" point the word length of the inputs
+    """
+    points = []
+    for size in sizes:
+        inp_data, output_data = gen_spec(
+            shape,
+            size if axis == "length" else length,
+            size if axis == "rows" else rows,
+            seed,
+            output=size if axis == "output" else None,
+            word=size if axis == "density" else None
+        )
+        runs = [run_spec(inp_data, output_data, time_budget) for _ in range(repeat)]
+
+        inputs = inp_data[0]
+        point = {
+            "shape": shape,
+            "axis": axis,
+            "size": size,
+            "rows": len(inputs),
+            "input_length": statistics.mean(len(s) for s in inputs),
+            "output_length": statistics.mean(len(s) for s in output_data),
+            "token_density": statistics.mean(token_density(s) for s in inputs),
+            "complete": all(run["complete"] for run in runs)
+        }
+        for stage in STAGES + ["total"]:
+            point[stage] = statistics.median(run["times"][stage] for run in runs)
+        point.update(runs[-1]["sizes"])
+        points.append(point)
+        print(f"[+] {shape} {axis}={size}: {point['total']:.4f}s")
+    return points
+
+def fit_exponent(xs: list, ys: list) -> dict:
+    """ Least-squares fit of y = c * x**k on a log-log scale
+
+        Returns the exponent k, the constant c and r2 of the fit, or None
+        values when fewer than two points have a positive x and y
+    """
+    pairs = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if x > 0 and y > 0]
+    if len(pairs) < 2 or len(set(x for x, _ in pairs)) < 2:
+        return {"exponent": None, "constant": None, "r2": None, "points": len(pairs)}
+
+    log_x, log_y = zip(*pairs)
+    slope, intercept = statistics.linear_regression(log_x, log_y)
+    mean_y = statistics.mean(log_y)
+    total = sum((y - mean_y) ** 2 for y in log_y)
+    residual = sum((y - (slope * x + intercept)) ** 2 for x, y in pairs)
+    return {
+        "exponent": slope,
+        "constant": math.exp(intercept),
+        "r2": 1 - residual / total if total else 1.0,
+        "points": len(pairs)
+    }
+
+def fit_curves(points: list) -> dict:
+    """ {shape: {axis: {stage: fit}}} over the points of each curve
+
+        The x of a length, output or density curve is the mean input
+        length, output length or token density actually generated, that
+        of a rows curve the number of rows
+    """
+    x = {"length": "input_length", "rows": "rows", "output": "output_length", "density": "token_density"}
+    fits = {}
+    for shape, axis in sorted(set((p["shape"], p["axis"]) for p in points)):
+        curve = [p for p in points if p["shape"] == shape and p["axis"] == axis]
+        xs = [p[x[axis]] for p in curve]
+        fits.setdefault(shape, {})[axis] = {
+            stage: fit_exponent(xs, [p[stage] for p in curve])
+            for stage in STAGES + ["total"]
+        }
+    return fits
+
+def write_csv(points: list, path: str):
+    columns = []
+    for point in points:
+        columns += [k for k in point if k not in columns]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, restval=-1)
+        writer.writeheader()
+        writer.writerows(points)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                        prog="scaling.py",
+                        description="Measure how BlinkFilLO's synthesis phases scale"
+            )
+    parser.add_argument(
+                "--shapes",
+                dest="shapes",
+                nargs="+",
+                choices=list(SHAPES),
+                default=list(SHAPES),
+                help="Kinds of synthetic strings to generate (default: all)"
+    )
+    parser.add_argument(
+                "--lengths",
+                dest="lengths",
+                type=positive_int,
+                nargs="+",
+                default=[10, 20, 40, 80, 160],
+                help="Input lengths of the length curves (default: 10 20 40 80 160)"
+    )
+    parser.add_argument(
+                "--rows",
+                dest="rows",
+                type=positive_int,
+                nargs="+",
+                default=[2, 4, 8, 16, 32],
+                help="Row counts of the row curves (default: 2 4 8 16 32)"
+    )
+    parser.add_argument(
+                "--outputs",
+                dest="outputs",
+                type=positive_int,
+                nargs="+",
+                default=[10, 20, 40, 80],
+                help="Output lengths of the output curves (default: 10 20 40 80)"
+    )
+    parser.add_argument(
+                "--words",
+                dest="words",
+                type=positive_int,
+                nargs="+",
+                default=[16, 8, 4, 2, 1],
+                help="Word lengths of the density curves, shorter is denser (default: 16 8 4 2 1)"
+    )
+    parser.add_argument(
+                "--axes",
+                dest="axes",
+                nargs="+",
+                choices=AXES,
+                default=AXES,
+                help="Curves to measure (default: all)"
+    )
+    parser.add_argument(
+                "--length",
+                dest="length",
+                type=positive_int,
+                default=20,
+                help="Input length held fixed along the other curves (default: 20)"
+    )
+    parser.add_argument(
+                "--row-count",
+                dest="row_count",
+                type=positive_int,
+                default=3,
+                help="Row count held fixed along the other curves (default: 3)"
+    )
+    parser.add_argument(
+                "--repeat",
+                dest="repeat",
+                type=positive_int,
+                default=3,
+                help="Runs per point, the median is kept (default: 3)"
+    )
+    parser.add_argument(
+                "--seed",
+                dest="seed",
+                type=int,
+                default=0,
+                help="Seed of the spec generator (default: 0)"
+    )
+    parser.add_argument(
+                "--time-budget",
+                dest="time_budget",
+                type=float,
+                default=None,
+                help="Seconds each run may spend before synthesis stops early"
+    )
+    parser.add_argument(
+                "--csv",
+                dest="csv",
+                default="scaling.csv",
+                help="Filename (csv) to save the scaling curves to"
+    )
+    parser.add_argument(
+                "--json",
+                dest="json",
+                default="scaling.json",
+                help="Filename (json) to save the curves and fitted exponents to"
+    )
+    args = parser.parse_args()
+
+    sizes = {"length": args.lengths, "rows": args.rows, "output": args.outputs, "density": args.words}
+    points = []
+    for shape in args.shapes:
+        for axis in args.axes:
+            points += measure(shape, axis, sizes[axis], args.length, args.row_count,
+                              args.repeat, args.seed, args.time_budget)
+    fits = fit_curves(points)
+
+    for shape, axes in fits.items():
+        for axis, stages in axes.items():
+            exponents = ", ".join(
+                f"{stage}={fit['exponent']:.2f}" for stage, fit in stages.items()
+                if fit["exponent"] is not None
+            )
+            print(f"[+] {shape} by {axis}: {exponents}")
+
+    incomplete = [p for p in points if not p["complete"]]
+    if incomplete:
+        print(f"[!] {len(incomplete)} points did not synthesize a program for every row")
+
+    print(f"[+] Saving curves to: {args.csv}, {args.json}")
+    write_csv(points, args.csv)
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump({"config": vars(args), "points": points, "fits": fits}, f, indent=2)
@@ -0,0 +1,78 @@
+""" Time and memory budgets for anytime synthesis """
+# src/budget.py
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where memory budgets are not enforced
+    resource = None
+
+def peak_memory() -> int:
+    """ Peak resident set size of the process in bytes, 0 when unknown """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def current_memory() -> int:
+    """ Resident set size of the process in bytes right now
+
+        Read from /proc where there is one. Elsewhere this falls back to
+        the peak, which is all getrusage reports
+    """
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_memory()
+
+class BudgetExceeded(Exception):
+    """ Raised by Budget.check once the budget has run out """
+
+class Budget:
+    """ Wall time and memory a synthesis may spend
+
+        seconds: wall time from the creation of the budget
+        memory: growth in bytes of the resident set size over its size
+                when the budget was created
+
+        The graph loops call check() cooperatively, which raises
+        BudgetExceeded once either limit is passed. Reading the memory
+        use is a system call, so it is only done every few checks
+    """
+    MEMORY_CHECK_EVERY = 64
+
+    def __init__(self, seconds: float = None, memory: int = None):
+        self.seconds = seconds
+        self.memory = memory
+        self._deadline = None if seconds is None else time.perf_counter() + seconds
+        # the peak never comes down, so a process that once used more
+        # memory would leave a budget over it nothing to measure
+        self._memory_limit = None if memory is None else current_memory() + memory
+        self._checks = 0
+        self._exceeded = False
+
+    def __repr__(self):
+        return f"Budget(seconds={self.seconds}, memory={self.memory})"
+
+    def expired(self) -> bool:
+        """ Whether the budget has run out """
+        if self._exceeded:
+            return True
+
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            self._exceeded = True
+        elif self._memory_limit is not None:
+            self._checks += 1
+            if self._checks % self.MEMORY_CHECK_EVERY == 0 and current_memory() > self._memory_limit:
+                self._exceeded = True
+        return self._exceeded
+
+    def check(self):
+        """ Raise BudgetExceeded once the budget has run out """
+        if self.expired():
+            raise BudgetExceeded(repr(self))
@@ -0,0 +1,144 @@
+""" Persistent cache of synthesized programs """
+# src/cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from language.base_tokens import BaseTokens
+from language.expressions import StringExpr
+
+# bump when the stored program format or the synthesis semantics change
+CACHE_FORMAT = 2
+
+def token_version() -> str:
+    """ Fingerprint of the base token set programs are expressed over """
+    tokens = [(tok.name, tok.value.pattern) for tok in BaseTokens]
+    return hashlib.sha256(
+        json.dumps([CACHE_FORMAT, tokens]).encode("utf-8")
+    ).hexdigest()
+
+def spec_fingerprint(inp_data: list, output_data: list, mode: dict = None) -> str:
+    """ Content address of a spec: its input columns and examples, and the
+        settings of the synthesis (see SynthDriver.mode), which can pick a
+        different program for the same spec
+    """
+    return hashlib.sha256(
+        json.dumps([inp_data, output_data, mode], ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+class ProgramCache:
+    """ File-backed cache from spec fingerprint to extracted program
+
+        Entries live in an sqlite database in cache_dir and hold the formula
+        and the serialized StringExpr. The cache is bounded by the total
+        size of its entries and evicts the least recently used ones. The
+        database is wiped when it was written against a different base
+        token set
+    """
+    def __init__(self, cache_dir: str, max_bytes: int = 64 * 1024 * 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "programs.sqlite")
+        self.max_bytes = max_bytes
+
+        self._db = sqlite3.connect(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS programs ("
+            "fingerprint TEXT PRIMARY KEY, formula TEXT, program TEXT, "
+            "size INTEGER, last_used REAL)"
+        )
+
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'version'"
+        ).fetchone()
+        if row is None or row[0] != token_version():
+            self.clear()
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                (token_version(),)
+            )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM programs").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def size(self) -> int:
+        """ Total size in bytes of the cached entries """
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM programs"
+        ).fetchone()[0]
+
+    def get(self, inp_data: list, output_data: list, table=None, mode: dict = None):
+        """ Look up a spec, returning (formula, StringExpr) or None
+
+            The positions of the program are encoded over table, the
+            PositionTable of the synthesis asking for it
+        """
+        key = spec_fingerprint(inp_data, output_data, mode)
+        row = self._db.execute(
+            "SELECT formula, program FROM programs WHERE fingerprint = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self._db.execute(
+            "UPDATE programs SET last_used = ? WHERE fingerprint = ?",
+            (time.time(), key)
+        )
+        self._db.commit()
+
+        formula, program = row
+        return formula, StringExpr.from_dict(json.loads(program), table)
+
+    def put(self, inp_data: list, output_data: list, formula: str, program: StringExpr, mode: dict = None):
+        """ Store the program synthesized for a spec under some settings """
+        key = spec_fingerprint(inp_data, output_data, mode)
+        program = json.dumps(program.to_dict(), ensure_ascii=False)
+        size = len(key) + len(formula.encode("utf-8")) + len(program.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO programs VALUES (?, ?, ?, ?, ?)",
+            (key, formula, program, size, time.time())
+        )
+        self._evict()
+        self._db.commit()
+
+    def clear(self):
+        """ Drop every cached entry """
+        self._db.execute("DELETE FROM programs")
+        self._db.commit()
+
+    def close(self):
+        """ Close the underlying database """
+        self._db.close()
+
+    def _evict(self):
+        """ Evict least recently used entries until the cache fits """
+        excess = self.size - self.max_bytes
+        if excess <= 0:
+            return
+
+        rows = self._db.execute(
+            "SELECT fingerprint, size FROM programs ORDER BY last_used ASC"
+        )
+        evicted = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+
+        self._db.executemany("DELETE FROM programs WHERE fingerprint = ?", evicted)
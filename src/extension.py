@@ -1,5 +1,6 @@
-import uno
 import json
+from synthesizer import SynthDriver
+from cache import ProgramCache
 
 # TODO:
 # my_extension/
@@ -12,15 +13,19 @@ import json
 # zip -r blinkfiLO_extension.oxt META-INF/ extension.py description.xml unopkg.xml
 
 class CalcHandler:
-    def __init__(self, host="localhost", port=3000):
+    def __init__(self, host="localhost", port=3000, cache_dir=None, document=None, time_budget=10.0):
         """
-        Initialize the LibreOffice Calc handler by connecting to the running LibreOffice instance.
+        Initialize the LibreOffice Calc handler by connecting to the running LibreOffice instance,
+        or around an already open document. Synthesis settles for the examples it got through
+        after time_budget seconds, so a hard selection cannot hang the UI.
         """
         self.host = host
         self.port = port
-        self.document = self.connect_to_calc()
+        self.document = document if document is not None else self.connect_to_calc()
         self.incomplete_cells = []
         self.formula = ""
+        self.cache = ProgramCache(cache_dir) if cache_dir else None
+        self.time_budget = time_budget
 
     def connect_to_calc(self):
         # Manually allow libreoffice to listen for UNO command
@@ -30,6 +35,9 @@ class CalcHandler:
         """
         Connect to the running LibreOffice instance and get the current document.
         """
+        # only available inside LibreOffice's python
+        import uno
+
         local_context = uno.getComponentContext()
         resolver = local_context.ServiceManager.createInstanceWithContext(
             "com.sun.star.bridge.UnoUrlResolver", local_context
@@ -49,27 +57,41 @@ class CalcHandler:
     def read_selected_data(self):
         """
         Read data from the current selection in the active sheet.
+
+        The whole selection is read with a single getDataArray call, one UNO
+        round trip instead of one per cell. getDataArray gives the raw value
+        of number cells (dates, formatted numbers and long integers all come
+        back as floats), so those cells are read again for the string Calc
+        shows, as text cells already are.
+
+        That costs two round trips per number cell. UNO has no bulk read of
+        formatted strings: getFormulaArray gives unformatted numbers and date
+        serials, and the cells found by queryContentCells are still read one
+        by one, so a selection of mostly numbers stays per cell.
         """
-        sheet = self.document.CurrentController.ActiveSheet
         selection = self.document.CurrentController.getSelection()
         
         if selection.supportsService("com.sun.star.sheet.SheetCellRange"):
             start_column = selection.RangeAddress.StartColumn
-            end_column = selection.RangeAddress.EndColumn
             start_row = selection.RangeAddress.StartRow
-            end_row = selection.RangeAddress.EndRow
+
+            # rows of values, empty cells are ""
+            rows = selection.getDataArray()
 
             selected_data = []
-            for col in range(start_column, end_column + 1):
+            for i, column in enumerate(zip(*rows)):
+                col = start_column + i
                 col_data = []
-                for row in range(start_row, end_row + 1):
-                    cell = sheet.getCellByPosition(col, row)
-                    if cell.String == "":
+                for j, value in enumerate(column):
+                    row = start_row + j
+                    if isinstance(value, float):
+                        value = selection.getCellByPosition(i, j).String
+                    if value == "":
                         empty_coord = (col,row + 1)
                         corresponding_input_coord = (col -1, row + 1)
                         pair = {"Input": corresponding_input_coord, "Output": empty_coord}
                         self.incomplete_cells.append(pair) # Save empty cells to write to later
-                    col_data.append(cell.String)
+                    col_data.append(value)
                 selected_data.append(col_data)
 
             print("\nEMPTY OUTPUT CELLS: ", self.incomplete_cells)
@@ -116,11 +138,41 @@ class CalcHandler:
         jsonified_data = self.jsonify_data(data)
         self.save_json_file(jsonified_data)
 
+    def synthesize(self):
+        """
+        Synthesize the formula for the current selection, reusing a cached program for a spec seen before.
+        """
+        data = self.read_selected_data()
+        examples = json.loads(self.jsonify_data(data))["Examples"]
+        example_inputs = [ex["Input"][0] for ex in examples]
+
+        # examples first, since the driver pairs inputs and outputs in order
+        inputs = example_inputs + [i for i in data[0] if i != "" and i not in example_inputs]
+        outputs = [ex["Output"] for ex in examples]
+
+        synth = SynthDriver(time_budget=self.time_budget)
+        self.formula = synth.synthesize([inputs], outputs, self.cache)
+        if synth.uncovered:
+            print("\nOUT OF TIME, EXAMPLES NOT USED: ", [examples[i] for i in synth.uncovered])
+        return self.formula
+
+    @staticmethod
+    def column_letter(col):
+        """
+        Column index to its grid letters: 0 -> A, 25 -> Z, 26 -> AA, 701 -> ZZ, 702 -> AAA.
+        """
+        letters = ""
+        col += 1
+        while col > 0:
+            col, rem = divmod(col - 1, 26)
+            letters = chr(rem + 65) + letters  # 65 is ASCII for 'A'
+        return letters
+
     def get_cell_ref_by_position(self, coord):
         col, row = coord
         
-        # convert col index to grid letter 0 -> A, 1 -> B, etc
-        col_letter = chr(col + 65)  # 65 is ASCII for 'A'
+        # convert col index to grid letters 0 -> A, 1 -> B, etc
+        col_letter = self.column_letter(col)
         
         # convert row index to grid row number 0 -> 1, 1 -> 2
         row_number = row
@@ -145,11 +197,45 @@ class CalcHandler:
         cell = sheet.getCellByPosition(col, row)
         cell.Formula = formula  # Assign the formula to the cell
 
-    def write_to_calc(self):
+    @staticmethod
+    def contiguous_ranges(cells):
+        """
+        Group (col, row) cells into runs of consecutive rows of one column.
+
+        Returns [(col, first row, [cells of the run]), ...].
+        """
+        ranges = []
+        for col, row in sorted(set(cells)):
+            last = ranges[-1] if ranges else None
+            if last and last[0] == col and last[1] + len(last[2]) == row:
+                last[2].append((col, row))
+            else:
+                ranges.append((col, row, [(col, row)]))
+        return ranges
+
+    def write_to_calc(self, as_formula=False):
+        """
+        Fill the empty output cells with the formula for their input cell.
+
+        Contiguous cells of a column are written as one range with a single
+        setDataArray call, or setFormulaArray to enter live formulas.
+        """
+        formulas = {}
         for pair in self.incomplete_cells:
-            formula = self.formula
-            formula = formula.replace("<input>", self.get_cell_ref_by_position( (pair["Input"][0], pair["Input"][1]) ))
-            # formula = "=" + formula
-            print(f"\nFormula for cell pair {pair}: ", formula)
-            self.write_string_to_cell(formula, pair["Output"][0], pair["Output"][1] - 1)
-            # self.write_formula_to_cell(formula, pair["Output"][0], pair["Output"][1] - 1)
\ No newline at end of file
+            formula = self.formula.replace("<input>", self.get_cell_ref_by_position(pair["Input"]))
+            if as_formula:
+                formula = "=" + formula
+            col, row = pair["Output"]
+            formulas[(col, row - 1)] = formula
+
+        ranges = self.contiguous_ranges(formulas)
+        sheet = self.document.Sheets.getByIndex(0)
+        for col, row, cells in ranges:
+            cell_range = sheet.getCellRangeByPosition(col, row, col, row + len(cells) - 1)
+            values = tuple((formulas[cell],) for cell in cells)
+            if as_formula:
+                cell_range.setFormulaArray(values)
+            else:
+                cell_range.setDataArray(values)
+
+        print(f"\nWrote {len(formulas)} cells in {len(ranges)} ranges")
\ No newline at end of file
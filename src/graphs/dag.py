@@ -1,11 +1,13 @@
 """ Definition for the DAG used in synthesis """
 # graphs/dag.py
+import heapq
+from collections.abc import Mapping
 from .input_data_graph import InputDataGraph
 import language.expressions as EXPRS
 
 class DAG:
     """ Directed Acyclic Graph to compactly store expressions in the language """
-    def __init__(self, string_to_id, num_nodes: int = 0):
+    def __init__(self, string_to_id, num_nodes: int = 0, positions=None):
         self._nodes = list(range(num_nodes))
         self._start_node = 0
         self._final_node = num_nodes
@@ -14,6 +16,8 @@ class DAG:
         self._ranks = {} # mapping edges to a rank (weights)
 
         self.string_to_id = string_to_id # function pointer to string map
+        # ids for the position expressions of substring expressions
+        self.positions = positions if positions is not None else EXPRS.PositionTable()
 
     def __repr__(self):
         """ A better repr for a DAG """
@@ -40,6 +44,16 @@ class DAG:
         """ get the learned mapping for the DAG """
         return self._mapping
 
+    @property
+    def num_edges(self) -> int:
+        """ get the number of edges """
+        return sum(len(self._mapping[n]) for n in self._mapping)
+
+    @property
+    def num_exprs(self) -> int:
+        """ get the number of expressions over all edges """
+        return sum(len(e) for n in self._mapping for e in self._mapping[n].values())
+
     @property
     def ranks(self) -> dict:
         """ get the node rankings """
@@ -69,7 +83,15 @@ class DAG:
 
     # Public Methdods
     def learn(self, input_data: list, output: str, idg: InputDataGraph):
-        """ Learn the mapping function on input/output example """
+        """ Learn the mapping function on input/output example
+
+            input_data holds the strings of the example's input row, one per
+            input column
+        """
+        # nodes are the 1-indexed positions between characters of the output
+        self._nodes = list(range(1, len(output) + 2))
+        self._start_node = 1
+        self._final_node = len(output) + 1
         for i in range(len(output)):
             for j in range(i+1, len(output)+1):
                 # init edges
@@ -84,7 +106,7 @@ class DAG:
 
                 os = output[i:j]
                 self._mapping[i+1][j+1] = set([EXPRS.ConstStringExpr(os)])
-                for vk in input_data:
+                for column, vk in enumerate(input_data):
                     if os not in vk:
                         continue
                     l = vk.index(os) + 1
@@ -95,22 +117,152 @@ class DAG:
                                         l,
                                         r,
                                         self.string_to_id(vk),
-                                        idg
+                                        idg,
+                                        self.positions,
+                                        column
                                 )
                     self._mapping[i+1][j+1].add(substr)
 
     def rank(self):
-        """ Rank nodes in the DAG """
+        """ Rank the edges of the DAG by the weight of their best expression """
         for n1 in self.mapping:
             self._ranks[n1] = {}
             for n2 in self.mapping[n1]:
-                self._ranks[n1][n2] = 0
-                for expr in self.mapping[n1][n2]:
-                    if isinstance(expr, EXPRS.SubStringExpr):
-                        weight = len(expr) * 1.5
-                    elif isinstance(expr, EXPRS.ConstStringExpr):
-                        weight = len(expr) * 0.1
-                    self._ranks[n1][n2] = weight
+                self._ranks[n1][n2] = max(map(DAG.weight, self.mapping[n1][n2]), default=0)
+
+    def _best_to_final(self) -> dict:
+        """ (weight, edges) of the best path from every node that reaches
+            the final node, the heaviest and then the shortest
+
+            Nodes are finished in post-order of an iterative depth first
+            search from the start node, so every successor is done first
+        """
+        ranks = self.ranks
+        best = {self._final_node: (0, 0)}
+        visited = {self._start_node}
+        stack = [(self._start_node, iter(self._mapping.get(self._start_node, ())))]
+        while stack:
+            node, successors = stack[-1]
+            for n2 in successors:
+                if n2 not in visited:
+                    visited.add(n2)
+                    stack.append((n2, iter(self._mapping.get(n2, ()))))
+                    break
+            else:
+                stack.pop()
+                scores = [
+                    (ranks[node][n2] + best[n2][0], best[n2][1] + 1)
+                    for n2 in self._mapping.get(node, ()) if n2 in best
+                ]
+                if scores and node != self._final_node:
+                    best[node] = min(scores, key=DAG._path_order)
+        return best
+
+    @staticmethod
+    def _path_order(score: tuple) -> tuple:
+        """ Sort key of a (weight, edges) score: heaviest first, then the
+            fewest edges. Weights are rounded so that sums of the same
+            weights in another order tie
+        """
+        weight, edges = score
+        return (-round(weight, 9), edges)
+
+    @staticmethod
+    def _expr_order(expr) -> tuple:
+        """ Sort key of the expressions on an edge that tie on weight, by
+            the formula they would produce
+        """
+        if isinstance(expr, EXPRS.SubStringExpr):
+            return (0, expr.column, expr.v, repr(expr.best_positions()))
+        return (1, expr.const_str)
+
+    def best_paths(self):
+        """ Lazily yield the expression paths from start to final, best first
+
+            A path picks one expression on each edge and scores the sum of
+            their weights. The expressions on an edge from start to final
+            come first, as a single expression for the whole output, then
+            the other paths by score. Paths of equal score come shortest
+            first and then by the expressions they pick, so the order does
+            not depend on set iteration order.
+
+            Paths are popped from a heap of partial paths keyed by their
+            score so far plus the best completion from their last node,
+            which is exact, so complete paths come out in order. The
+            choices leaving a node are sorted once, the first time a path
+            reaches it, and a popped choice only pushes its next sibling and
+            the first choice after it, so the first path costs about one
+            longest path pass and every further path a few heap operations
+        """
+        if self.empty:
+            return
+
+        best = self._best_to_final()
+        if self._start_node not in best:
+            return
+        if self._start_node == self._final_node:
+            yield []
+            return
+
+        start, final = self._start_node, self._final_node
+        choices = {}
+        def _choices(node):
+            """ (score, weight, target, expr) of every way out of node, best
+                first; score is the (direct, weight, edges) of the best path
+                through the choice to the final node
+            """
+            if node not in choices:
+                options = [
+                    (
+                        (node != start or n2 != final, DAG.weight(expr) + best[n2][0], best[n2][1] + 1),
+                        DAG.weight(expr), n2, expr
+                    )
+                    for n2, exprs in self._mapping[node].items() if n2 in best
+                    for expr in exprs
+                ]
+                options.sort(key=lambda option: (_key(0, 0, option[0]), DAG._expr_order(option[3])))
+                choices[node] = options
+            return choices[node]
+
+        def _key(weight, edges, score):
+            indirect, w, e = score
+            return (indirect,) + DAG._path_order((weight + w, edges + e))
+
+        # entries are (key, tie, node, weight and edges so far, path, choice
+        # index); paths are linked (prefix, expr) pairs so they share their
+        # prefixes. Ties pop in push order, which follows the sorted choices
+        tie = 0
+        heap = [(_key(0, 0, _choices(start)[0][0]), tie, start, 0, 0, None, 0)]
+        while heap:
+            _, _, node, weight, edges, path, i = heapq.heappop(heap)
+            options = _choices(node)
+            _, w, n2, expr = options[i]
+
+            if i + 1 < len(options):
+                tie += 1
+                heapq.heappush(heap, (_key(weight, edges, options[i + 1][0]), tie, node, weight, edges, path, i + 1))
+
+            step = (path, expr)
+            if n2 == final:
+                exprs = []
+                while step is not None:
+                    step, expr = step
+                    exprs.append(expr)
+                exprs.reverse()
+                yield exprs
+                continue
+
+            tie += 1
+            heapq.heappush(heap, (
+                _key(weight + w, edges + 1, _choices(n2)[0][0]), tie, n2, weight + w, edges + 1, step, 0
+            ))
+
+    @staticmethod
+    def weight(expr) -> float:
+        """ Rank weight of a single expression, substrings over constants """
+        if isinstance(expr, EXPRS.SubStringExpr):
+            return len(expr) * 1.5
+        return len(expr) * 0.1
 
     def to_dot(self, path: str) -> bool:
         """ Generate a dot (graphviz) file for the dag """
@@ -121,73 +273,508 @@ class DAG:
                     f.write(f"\"{n1}\" -> \"{n2}\" [label = \"{self._mapping[n1][n2]}\"];\n")
             f.write("}\n")
 
+    @property
+    def empty(self) -> bool:
+        """ True when no path leads from the start node to the final node """
+        return self._start_node not in self._mapping
+
+    @staticmethod
+    def _intersect_exprs(substr1: set, substr2: set) -> set:
+        """ Intersect the expression sets on a pair of edges """
+        intersection = []
+        for s1 in substr1:
+            for s2 in substr2:
+                # equality over constant strings
+                if isinstance(s1, EXPRS.ConstStringExpr) and \
+                isinstance(s2, EXPRS.ConstStringExpr):
+                    if s1 == s2:
+                        intersection.append(s1)
+
+                # intersect defined by substringexpr
+                else:
+                    sub_int = EXPRS.SubStringExpr.intersect(s1,s2)
+                    if sub_int:
+                        intersection.append(sub_int)
+        return set(intersection)
+
     @staticmethod
-    def intersect(dag_1: 'DAG', dag_2: 'DAG') -> 'DAG':
-        """ intersect two DAGs, construct a new DAG """
+    def intersect(dag_1: 'DAG', dag_2: 'DAG', budget=None) -> 'DAG':
+        """ intersect two DAGs, construct a new DAG
+
+            The product is built from a worklist that expands outward from
+            the start pair, so node pairs that can never be reached are never
+            visited. Pairs that cannot reach the final pair are then pruned.
+            If nothing survives, the new DAG is empty: no program is
+            consistent with the examples of both DAGs. With a Budget, it is
+            checked once per expanded pair and may raise BudgetExceeded.
+
+            Node pairs get dense int ids, as in IDG.intersect, so the nodes
+            of a DAG intersected over many examples stay flat: the start
+            pair is 0 and the final pair 1
+        """
         # create a new, empty DAG
         new_dag = DAG(
-                    string_to_id=dag_1.string_to_id
+                    string_to_id=dag_1.string_to_id,
+                    positions=dag_1.positions
                 )
-        # cartesian product of nodes from two dags
-        new_nodes_src = [(i,j) for i in dag_1.edges for j in dag_2.edges]
-        # set the start node to the first intersected node
-        new_dag.start_node = new_nodes_src[0]
-        # intersect
-        for node_src in new_nodes_src:
-            n1_src, n2_src = node_src
-            edges_1 = dag_1.mapping[n1_src]
-            edges_2 = dag_2.mapping[n2_src]
-
-            # cartesian product of all nodes on the source node edge
-            new_nodes_dst = [(i,j) for i in edges_1 for j in edges_2]
-            for node_dst in new_nodes_dst:
-                n1_dst, n2_dst = node_dst
-
-                # retrieve substring expression labels for each edge
-                substr1 = dag_1.mapping[n1_src][n1_dst]
-                substr2 = dag_2.mapping[n2_src][n2_dst]
-
-                # perform the intersection
-                intersection = []
-                for s1 in substr1:
-                    for s2 in substr2:
-                        # equality over constant strings
-                        if isinstance(s1, EXPRS.ConstStringExpr) and \
-                        isinstance(s2, EXPRS.ConstStringExpr):
-                            if s1 == s2:
-                                intersection.append(s1)
-
-                        # intersect defined by substringexpr
-                        else:
-                            sub_int = EXPRS.SubStringExpr.intersect(s1,s2)
-                            if sub_int:
-                                intersection.append(sub_int)
-
-                # a non-empty intersection is produced
-                if intersection:
-                    if node_src not in new_dag.edges:
-                        new_dag.nodes.append(node_src)
-                        new_dag.edges[node_src] = {}
-                        new_dag.mapping[node_src] = {}
-
-                    if node_dst not in new_dag.edges[node_src]:
-                        new_dag.nodes.append(node_dst)
-                        new_dag.edges[node_src][node_dst] = {}
-                        new_dag.mapping[node_src][node_dst] = {}
-
-                    new_dag.mapping[node_src][node_dst] = set(intersection)
-
-        # prune nodes without edges
-        non_empty_nodes = set([])
-        for node in new_dag.mapping:
-            if len(new_dag.mapping[node]) != 0:
-                non_empty_nodes.add(node)
-            else:
-                continue
+        pairs = [(dag_1.start_node, dag_2.start_node), (dag_1.final_node, dag_2.final_node)]
+        pair_ids = {pair: i for i, pair in enumerate(pairs)}
+        start, final = pair_ids[pairs[0]], pair_ids[pairs[-1]]
+        new_dag.start_node = start
+        new_dag.final_node = final
+
+        # forward: intersect the edges leaving each reachable pair
+        mapping = {}
+        visited = set([start])
+        worklist = [start]
+        while worklist:
+            if budget is not None:
+                budget.check()
+            node_src = worklist.pop()
+            n1_src, n2_src = pairs[node_src]
+            for n1_dst, substr1 in dag_1.mapping.get(n1_src, {}).items():
+                for n2_dst, substr2 in dag_2.mapping.get(n2_src, {}).items():
+                    intersection = DAG._intersect_exprs(substr1, substr2)
+                    # a non-empty intersection is produced
+                    if not intersection:
+                        continue
 
-            for node2 in new_dag.mapping[node]:
-                non_empty_nodes.add(node2)
+                    node_dst = pair_ids.get((n1_dst, n2_dst))
+                    if node_dst is None:
+                        node_dst = pair_ids[(n1_dst, n2_dst)] = len(pairs)
+                        pairs.append((n1_dst, n2_dst))
+                    if node_src not in mapping:
+                        mapping[node_src] = {}
+                    mapping[node_src][node_dst] = intersection
 
-        new_dag.final_node = max(non_empty_nodes)
-        new_dag.nodes = list(non_empty_nodes & set(new_dag.nodes))
+                    if node_dst not in visited:
+                        visited.add(node_dst)
+                        worklist.append(node_dst)
+
+        DAG._fill_alive(new_dag, mapping, final in visited)
         return new_dag
+
+    @staticmethod
+    def _fill_alive(new_dag: 'DAG', mapping: dict, reached: bool):
+        """ Fill new_dag with the edges of mapping between nodes that can
+            reach its final node; reached tells if the final node is there
+        """
+        start, final = new_dag.start_node, new_dag.final_node
+
+        # backward: keep only pairs that can reach the final pair
+        parents = {}
+        for node_src in mapping:
+            for node_dst in mapping[node_src]:
+                if node_dst not in parents:
+                    parents[node_dst] = []
+                parents[node_dst].append(node_src)
+
+        alive = set()
+        worklist = [final] if reached else []
+        while worklist:
+            node = worklist.pop()
+            if node in alive:
+                continue
+            alive.add(node)
+            worklist.extend(parents.get(node, []))
+
+        if start not in alive:
+            return
+
+        for node_src in mapping:
+            if node_src not in alive:
+                continue
+
+            for node_dst in mapping[node_src]:
+                if node_dst not in alive:
+                    continue
+
+                if node_src not in new_dag.edges:
+                    new_dag.edges[node_src] = set()
+                    new_dag.mapping[node_src] = {}
+
+                new_dag.edges[node_src].add(node_dst)
+                new_dag.mapping[node_src][node_dst] = mapping[node_src][node_dst]
+
+        new_dag.nodes = [node for node in mapping if node in alive] + [final]
+
+class LazyDAG(DAG):
+    """ Intersection of two DAGs whose edges are computed on demand
+
+        Holds its operands rather than their product. The edges leaving a
+        node pair are intersected the first time something looks the node
+        up, through mapping, edges or ranks, and are kept from then on.
+        Extracting a path only expands the pairs the search reaches, and
+        a chain of lazy intersections over many examples only expands a
+        pair of an inner product when the outer one reaches it.
+
+        Unlike DAG.intersect, pairs that cannot reach the final pair are
+        not pruned up front; the path search skips them. materialize()
+        builds the pruned DAG.intersect result, which nodes, num_edges,
+        num_exprs and to_dot report on.
+
+        The best path is searched best first over node pairs, guided by the
+        sum of the best path weights of the eager DAGs at the leaves of the
+        chain, so only pairs on the search frontier are expanded. With a
+        Budget, every expansion checks it, during the search too
+    """
+    def __init__(self, dag_1: DAG, dag_2: DAG, budget=None):
+        # keep lazy operands on the left, so expanding a node walks down
+        # the chain without recursion
+        if isinstance(dag_2, LazyDAG) and not isinstance(dag_1, LazyDAG):
+            dag_1, dag_2 = dag_2, dag_1
+        super().__init__(string_to_id=dag_1.string_to_id, positions=dag_1.positions)
+        self._left = dag_1
+        self._right = dag_2
+        self._budget = budget
+
+        # node pairs by dense int id, as in DAG.intersect, and their ids
+        self._pairs = [(dag_1.start_node, dag_2.start_node), (dag_1.final_node, dag_2.final_node)]
+        self._pair_ids = {pair: i for i, pair in enumerate(self._pairs)}
+        self._start_node = self._pair_ids[self._pairs[0]]
+        self._final_node = self._pair_ids[self._pairs[-1]]
+
+        # {node: {successor: expressions}} of the expanded nodes
+        self._out_edges = {}
+        self._weights = {}
+        self._empty = None
+        self._witness = None
+        self._materialized = None
+
+        self._mapping = _NodeView(self, self._out)
+        self._edges = _NodeView(self, lambda node: set(self._out(node)))
+        self._ranks = _NodeView(self, self._rank)
+
+    @property
+    def nodes(self) -> list:
+        """ nodes of the materialized DAG """
+        return self.materialize().nodes
+
+    @property
+    def num_edges(self) -> int:
+        """ number of edges of the materialized DAG """
+        return self.materialize().num_edges
+
+    @property
+    def num_exprs(self) -> int:
+        """ number of expressions of the materialized DAG """
+        return self.materialize().num_exprs
+
+    @property
+    def num_expanded(self) -> int:
+        """ number of node pairs whose edges have been intersected """
+        return len(self._out_edges)
+
+    @property
+    def ranks(self) -> Mapping:
+        """ get the edge rankings, computed per node on demand """
+        return self._ranks
+
+    @property
+    def empty(self) -> bool:
+        """ True when no path leads from the start node to the final node
+
+            Searched depth first, expanding nodes until the final node is
+            found
+        """
+        if self._empty is None:
+            parents = {self._start_node: None}
+            stack = [self._start_node]
+            self._empty = True
+            while stack:
+                node = stack.pop()
+                if node == self._final_node:
+                    self._empty = False
+                    break
+                for n2 in self._out(node):
+                    if n2 not in parents:
+                        parents[n2] = node
+                        stack.append(n2)
+
+            if not self._empty:
+                self._witness = self._trace(parents)
+        return self._empty
+
+    def _trace(self, parents: dict) -> list:
+        """ The nodes from start to final along parent links """
+        nodes = [self._final_node]
+        while parents[nodes[-1]] is not None:
+            nodes.append(parents[nodes[-1]])
+        nodes.reverse()
+        return nodes
+
+    @staticmethod
+    def _pick_order(expr) -> tuple:
+        return (-DAG.weight(expr), DAG._expr_order(expr))
+
+    def _pick(self, nodes: list) -> list:
+        """ The best expression on each edge along a path of nodes """
+        return [min(self._out(n1)[n2], key=LazyDAG._pick_order) for n1, n2 in zip(nodes, nodes[1:])]
+
+    def witness(self) -> list:
+        """ Expressions along the path that showed the DAG is not empty
+
+            A consistent program that needs no further expansion, for when
+            the budget runs out during the search for the best one
+        """
+        if self.empty:
+            return None
+        return self._pick(self._witness)
+
+    def rank(self):
+        """ Edges are ranked as their nodes are expanded """
+
+    def _bounds(self):
+        """ Upper bound on the (weight, edges) of the best path from a node
+            pair to the final pair, None when a pair cannot reach it
+
+            A path of the product projects onto a path in every eager DAG
+            at the leaves of the chain, and an intersected expression
+            weighs no more than the heaviest of the expressions it came
+            from, so the sum of the leaves' best weights bounds its weight.
+            The bound is consistent, so a best first search on it settles
+            every node the first time it is popped. Edges are bounded by 0
+        """
+        leaves = {}
+        stack = [self]
+        while stack:
+            dag = stack.pop()
+            if isinstance(dag, LazyDAG):
+                stack += [dag._left, dag._right]
+            elif id(dag) not in leaves:
+                leaves[id(dag)] = dag._best_to_final()
+
+        memo = {}
+        def _bound(node):
+            if node in memo:
+                return memo[node]
+
+            weight = 0
+            parts = [(self, node)]
+            while parts:
+                dag, part = parts.pop()
+                if isinstance(dag, LazyDAG):
+                    pair = dag._pair(part)
+                    if pair is None:
+                        weight = None
+                        break
+                    parts += [(dag._left, pair[0]), (dag._right, pair[1])]
+                    continue
+                best = leaves[id(dag)].get(part)
+                if best is None:
+                    weight = None
+                    break
+                weight += best[0]
+
+            memo[node] = None if weight is None else (weight, 0)
+            return memo[node]
+        return _bound
+
+    def _best_path(self) -> list:
+        """ Expressions of the best path, searched best first
+
+            Partial paths are keyed by their weight plus the bound on the
+            rest, heaviest and then shortest first. A node is expanded when
+            it is first popped and the search stops at the final node, so
+            nodes the bound rules out are never expanded. Paths that tie
+            are told apart by their expressions from the start on, as
+            best_paths does
+        """
+        if self.empty:
+            return None
+
+        start, final = self._start_node, self._final_node
+        out = self._out(start)
+        if final in out:
+            # a single expression for the whole output wins, as in best_paths
+            return self._pick([start, final])
+
+        def _keys(node) -> list:
+            """ Sort keys of the expressions along the path to node """
+            keys = []
+            while parents[node] is not None:
+                parent = parents[node]
+                keys.append(LazyDAG._pick_order(min(self._out(parent)[node], key=LazyDAG._pick_order)))
+                node = parent
+            keys.reverse()
+            return keys
+
+        bound = self._bounds()
+        weights = {start: (0, 0)}
+        parents = {start: None}
+        done = set()
+        tie = 0
+        heap = [(DAG._path_order(bound(start)), tie, start)]
+        final_key = None
+        while heap:
+            key, _, node = heapq.heappop(heap)
+            if final_key is not None and key != final_key:
+                break
+            if node in done:
+                continue
+            done.add(node)
+            if node == final:
+                # paths still on the heap with the same key tie with it
+                final_key = key
+                continue
+
+            weight, edges = weights[node]
+            ranks = self._rank(node)
+            for n2 in self._out(node):
+                rest = bound(n2)
+                if rest is None:
+                    continue
+                score = (weight + ranks[n2], edges + 1)
+                if n2 in weights:
+                    order, current = DAG._path_order(score), DAG._path_order(weights[n2])
+                    if order == current:
+                        step = LazyDAG._pick_order(min(self._out(node)[n2], key=LazyDAG._pick_order))
+                        if _keys(node) + [step] < _keys(n2):
+                            parents[n2] = node
+                    if order >= current or n2 in done:
+                        continue
+
+                weights[n2] = score
+                parents[n2] = node
+                tie += 1
+                heapq.heappush(heap, (DAG._path_order((score[0] + rest[0], score[1])), tie, n2))
+
+        if final_key is None:
+            return None
+        return self._pick(self._trace(parents))
+
+    def best_paths(self):
+        """ Lazily yield the expression paths from start to final, best first
+
+            The first path comes from the best first search, which only
+            expands the pairs it needs. Any further path enumerates the
+            materialized DAG, expanding every reachable pair
+        """
+        first = self._best_path()
+        if first is None:
+            return
+        yield first
+
+        for path in self.materialize().best_paths():
+            if path != first:
+                yield path
+
+    def detach_budget(self):
+        """ Stop checking the budget, e.g. to finish extracting a path """
+        stack = [self]
+        while stack:
+            dag = stack.pop()
+            if isinstance(dag, LazyDAG):
+                dag._budget = None
+                stack += [dag._left, dag._right]
+
+    def materialize(self) -> DAG:
+        """ The DAG that DAG.intersect would have built, expanding every
+            node reachable from the start
+        """
+        if self._materialized is None:
+            dag = DAG(string_to_id=self.string_to_id, positions=self.positions)
+            dag.start_node = self._start_node
+            dag.final_node = self._final_node
+
+            mapping = {}
+            reached = set([self._start_node])
+            worklist = [self._start_node]
+            while worklist:
+                node = worklist.pop()
+                out = self._out(node)
+                if out:
+                    mapping[node] = out
+                for n2 in out:
+                    if n2 not in reached:
+                        reached.add(n2)
+                        worklist.append(n2)
+
+            DAG._fill_alive(dag, mapping, self._final_node in reached)
+            self._materialized = dag
+        return self._materialized
+
+    def to_dot(self, path: str) -> bool:
+        """ Generate a dot (graphviz) file for the materialized dag """
+        return self.materialize().to_dot(path)
+
+    def _out(self, node) -> dict:
+        """ {successor: expressions} of a node pair, intersected on first use """
+        if node in self._out_edges:
+            return self._out_edges[node]
+
+        # walk down the lazy operands to one that knows its part of the pair
+        chain = []
+        dag = self
+        while isinstance(dag, LazyDAG) and node not in dag._out_edges:
+            pair = dag._pair(node)
+            if pair is None:
+                return {}
+            chain.append((dag, node))
+            dag, node = dag._left, pair[0]
+        out = dag._out_edges[node] if isinstance(dag, LazyDAG) else dag.mapping.get(node, {})
+
+        # and intersect back up
+        for dag, node in reversed(chain):
+            out = dag._expand(node, out)
+        return out
+
+    def _pair(self, node) -> tuple:
+        """ The (left, right) nodes of a node id, None for an unknown node """
+        if isinstance(node, int) and 0 <= node < len(self._pairs):
+            return self._pairs[node]
+        return None
+
+    def _expand(self, node: int, left: dict) -> dict:
+        """ Intersect the edges leaving the pair, given those of the left node """
+        if self._budget is not None:
+            self._budget.check()
+
+        right = self._right.mapping.get(self._pairs[node][1], {})
+        pair_ids = self._pair_ids
+        out = {}
+        for n1_dst, substr1 in left.items():
+            for n2_dst, substr2 in right.items():
+                intersection = DAG._intersect_exprs(substr1, substr2)
+                if intersection:
+                    node_dst = pair_ids.get((n1_dst, n2_dst))
+                    if node_dst is None:
+                        node_dst = pair_ids[(n1_dst, n2_dst)] = len(self._pairs)
+                        self._pairs.append((n1_dst, n2_dst))
+                    out[node_dst] = intersection
+        self._out_edges[node] = out
+        return out
+
+    def _rank(self, node) -> dict:
+        """ Weight of the best expression on each edge leaving a node """
+        if node not in self._weights:
+            self._weights[node] = {
+                n2: max(map(DAG.weight, exprs), default=0)
+                for n2, exprs in self._out(node).items()
+            }
+        return self._weights[node]
+
+class _NodeView(Mapping):
+    """ Read-only view of a per-node map of a LazyDAG, computed on lookup
+
+        Nodes without edges are missing, like in the dicts of a DAG.
+        Iterating expands every node of the materialized DAG
+    """
+    def __init__(self, dag: LazyDAG, lookup):
+        self._dag = dag
+        self._lookup = lookup
+
+    def __getitem__(self, node):
+        value = self._lookup(node)
+        if not value:
+            raise KeyError(node)
+        return value
+
+    def __contains__(self, node):
+        return bool(self._dag._out(node))
+
+    def __iter__(self):
+        return iter(self._dag.materialize().mapping)
+
+    def __len__(self):
+        return len(self._dag.materialize().mapping)
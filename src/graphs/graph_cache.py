@@ -0,0 +1,116 @@
+""" Content-keyed cache of single-string input data graphs """
+# graphs/graph_cache.py
+import sys
+from collections import OrderedDict
+from .input_data_graph import InputDataGraph
+
+def _label_size(label: tuple) -> int:
+    """ Bytes of a (token, index) label: the tuple, the token, which is a
+        substring of its own for every literal, and a (k, k-n) index
+    """
+    tok, idx = label
+    size = sys.getsizeof(label) + sys.getsizeof(tok)
+    if isinstance(idx, tuple):
+        size += sys.getsizeof(idx)
+    return size
+
+class _Skeleton:
+    """ The parts of a single-string IDG that do not depend on its string id """
+    __slots__ = ("num_nodes", "labels", "offsets", "targets", "edge_label_ids", "nbytes")
+
+    def __init__(self, graph: InputDataGraph):
+        graph._compact()
+        self.num_nodes = graph._num_nodes
+        self.labels = tuple(graph._labels)
+        self.offsets = graph._offsets
+        self.targets = graph._targets
+        self.edge_label_ids = graph._edge_label_ids
+
+        self.nbytes = (
+            sys.getsizeof(self.labels) + sys.getsizeof(self.offsets) +
+            sys.getsizeof(self.targets) + sys.getsizeof(self.edge_label_ids) +
+            sum(map(sys.getsizeof, self.edge_label_ids)) +
+            sum(map(_label_size, self.labels))
+        )
+
+    def bind(self, _id: int) -> InputDataGraph:
+        """ Build the IDG of the string under a string id
+
+            The edge arrays are shared between every graph bound from the
+            skeleton; graphs only replace them, never write into them
+        """
+        graph = InputDataGraph(_id)
+        graph._num_nodes = self.num_nodes
+        graph._node_labels = [frozenset([(_id, i)]) for i in range(self.num_nodes)]
+        graph._provenance = [(i,) for i in range(self.num_nodes)]
+        graph._labels = list(self.labels)
+        graph._label_ids = None
+        graph._offsets = self.offsets
+        graph._targets = self.targets
+        graph._edge_label_ids = self.edge_label_ids
+        return graph
+
+class GraphCache:
+    """ Bounded LRU cache from string content to its single-string IDG
+
+        gen_graph_str bakes the string id into the node labels, so the
+        cache keeps an id-free skeleton of each graph and binds it to the
+        id asked for on every lookup. A string seen before, in this column,
+        another column or an earlier synthesis, skips token matching and
+        literal enumeration. The graph of a long string is far larger than
+        that of a short one, so the cache is bounded by the approximate
+        size of its entries as well as their number. Counts hits, misses
+        and evictions
+    """
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, s: str) -> bool:
+        return s in self._entries
+
+    def graph(self, s: str, _id: int) -> InputDataGraph:
+        """ The IDG of s with its nodes labeled by _id """
+        skeleton = self._entries.get(s)
+        if skeleton is not None:
+            self.hits += 1
+            self._entries.move_to_end(s)
+            return skeleton.bind(_id)
+
+        self.misses += 1
+        skeleton = _Skeleton(InputDataGraph.gen_graph_str(s))
+        if self.max_entries > 0 and skeleton.nbytes + len(s) <= self.max_bytes:
+            self._entries[s] = skeleton
+            self.nbytes += skeleton.nbytes + len(s)
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                evicted, old = self._entries.popitem(last=False)
+                self.nbytes -= old.nbytes + len(evicted)
+                self.evictions += 1
+        return skeleton.bind(_id)
+
+    def counters(self, since: dict = None) -> dict:
+        """ Hit, miss and eviction counts and the current size
+
+            Given the counters of an earlier call, the counts are those
+            since then, e.g. of one run against a cache shared by several
+        """
+        counts = {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+        if since is not None:
+            counts = {key: value - since[key] for key, value in counts.items()}
+        return {**counts, "entries": len(self._entries), "bytes": self.nbytes}
+
+    def clear(self):
+        """ Drop every entry, keeping the counters """
+        self._entries.clear()
+        self.nbytes = 0
+
+# shared by every SynthDriver that is not given its own cache
+GraphCache.default = GraphCache()
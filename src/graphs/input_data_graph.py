@@ -1,6 +1,9 @@
 """ Definitions for the InputDataGraph """
 # graphs/input_data_graph.py
+from array import array
+from collections.abc import Mapping
 from language.base_tokens import BaseTokens
+from language.tokenizer import token_spans
 
 class InputDataGraph:
     """ Graph structure representing common substructures in input data """
@@ -15,12 +18,42 @@ class InputDataGraph:
             I: V -> {(id, idx)}, labeling function/map over indeces of the nodes
             L: E -> {(t, k)}, labeling function/map over token matches of the
             edges
+
+            Nodes are dense integer ids 0..|V|-1. Edges are stored CSR-style:
+            the out edges of node v occupy slots offsets[v]:offsets[v+1] of
+            the targets array, and each slot carries a frozenset of label ids
+            into the graph's table of interned (tok, k) labels. Source tuples
+            (the nodes of the graphs a node was intersected from) are only
+            kept for to_dot
         """
         # core member variables
-        self._nodes = set()
-        self._node_labels = {}
-        self._edges = {}
-        self._edge_labels = {}
+        self._num_nodes = 0
+        self._node_labels = []
+        self._offsets = array('l', [0])
+        self._targets = array('l')
+        self._edge_label_ids = []
+
+        # label id -> (tok, k), and its inverse while labels are being added
+        self._labels = []
+        self._label_ids = {}
+
+        # node id -> source tuple, for to_dot
+        self._provenance = []
+
+        # first node of each input column and the end of the last one, None
+        # for the graph of a single column
+        self._columns = None
+
+        # {v1: {v2: set(label ids)}} while being built through the public
+        # add/label methods, None once compacted into arrays
+        self._staged = None
+
+        # lookup structures, built on first use and dropped on mutation
+        self._node_index = None
+        self._in_offsets = None
+        self._in_sources = None
+        self._in_slots = None
+        self._pos_exprs = {}
 
         # member variable for generation
         self._id = _id
@@ -28,7 +61,7 @@ class InputDataGraph:
     ### Private Methods
     def __repr__(self):
         """ A better repr when printing a graph """
-        return f"IDG:\n\t{self._edge_labels}"
+        return f"IDG:\n\t{self.edge_labels}"
 
     def _label_node(self, node: int, label: tuple) -> bool:
         """ Label a single node
@@ -48,15 +81,13 @@ class InputDataGraph:
             print("Label must be of form (id, i)")
             return False
 
-        if node not in self._nodes:
+        if not 0 <= node < self._num_nodes:
             print(f"Node {node} not in InputDataGraph")
             return False
 
-        if node not in self._node_labels:
-            self._node_labels[node] = set([])
-
         _id, i = label
-        self._node_labels[node].add((_id, i))
+        self._invalidate()
+        self._node_labels[node] = self._node_labels[node] | {(_id, i)}
         return True
 
     def _label_edge(self, edge: tuple, tok_match: tuple) -> bool:
@@ -66,11 +97,11 @@ class InputDataGraph:
 
             {
                 node1: {
-                    node2: [(tok, k), ...],
+                    node2: {(tok, k), ...},
                     ...
                 },
                 node2: {
-                    node3: [(tok, k), ...],
+                    node3: {(tok, k), ...},
                     ...
                 },
                 ...
@@ -90,53 +121,236 @@ class InputDataGraph:
             return False
 
         v1, v2 = edge
-        if v1 not in self._nodes or v2 not in self._nodes:
+        if not 0 <= v1 < self._num_nodes or not 0 <= v2 < self._num_nodes:
             print(f"Edge: {edge} not in InputDataGraph")
             return False
 
         self.add_edge(edge)
-        if v1 not in self._edge_labels:
-            self._edge_labels[v1] = {}
+        self._staged[v1][v2].add(self._intern_label(tok_match))
+        return True
 
-        if v2 not in self._edge_labels[v1]:
-            self._edge_labels[v1][v2] = []
+    def _invalidate(self):
+        """ Drop the lookup structures built over the current graph """
+        self._node_index = None
+        self._in_offsets = None
+        self._in_sources = None
+        self._in_slots = None
+        self._pos_exprs = {}
+
+    def _stage(self):
+        """ Unpack the edge arrays into a mutable map for the builder methods """
+        self._invalidate()
+        if self._staged is not None:
+            return
 
-        self._edge_labels[v1][v2].append(tok_match)
-        return True
+        self._staged = {}
+        for v1 in range(self._num_nodes):
+            for slot in range(self._offsets[v1], self._offsets[v1 + 1]):
+                if v1 not in self._staged:
+                    self._staged[v1] = {}
+                self._staged[v1][self._targets[slot]] = set(self._edge_label_ids[slot])
+
+    def _compact(self):
+        """ Pack staged edges back into the CSR arrays """
+        if self._staged is None:
+            return
+
+        staged = self._staged
+        self._staged = None
+        self._set_edges(staged)
+
+    def _set_edges(self, edges: dict):
+        """ Lay out {v1: {v2: label ids}} as CSR arrays """
+        offsets = array('l', [0])
+        targets = array('l')
+        label_ids = []
+        for v1 in range(self._num_nodes):
+            for v2, ids in edges.get(v1, {}).items():
+                if not ids:
+                    continue
+                targets.append(v2)
+                label_ids.append(frozenset(ids))
+            offsets.append(len(targets))
+
+        self._offsets = offsets
+        self._targets = targets
+        self._edge_label_ids = label_ids
+
+    def _out_edges(self, node: int):
+        """ Yield (target, label ids) for every out edge of a node """
+        self._compact()
+        for slot in range(self._offsets[node], self._offsets[node + 1]):
+            yield self._targets[slot], self._edge_label_ids[slot]
+
+    def _index_incoming(self):
+        """ Build the reverse adjacency arrays
+
+            The in edges of node v occupy in_offsets[v]:in_offsets[v+1] of
+            the in_sources and in_slots arrays. in_slots points back at the
+            forward edge slot, so labels are shared rather than copied
+        """
+        self._compact()
+        counts = [0] * (self._num_nodes + 1)
+        for v2 in self._targets:
+            counts[v2 + 1] += 1
+
+        in_offsets = array('l', counts)
+        for v in range(self._num_nodes):
+            in_offsets[v + 1] += in_offsets[v]
+
+        fill = array('l', in_offsets)
+        in_sources = array('l', [0] * len(self._targets))
+        in_slots = array('l', [0] * len(self._targets))
+        for v1 in range(self._num_nodes):
+            for slot in range(self._offsets[v1], self._offsets[v1 + 1]):
+                v2 = self._targets[slot]
+                in_sources[fill[v2]] = v1
+                in_slots[fill[v2]] = slot
+                fill[v2] += 1
+
+        self._in_offsets = in_offsets
+        self._in_sources = in_sources
+        self._in_slots = in_slots
+
+    def _source_tuple(self, node: int) -> tuple:
+        """ Flatten the provenance of a node into its source tuple """
+        prov = self._provenance[node]
+        if all(isinstance(p, int) for p in prov):
+            return prov
+
+        flat = ()
+        stack = [prov]
+        while stack:
+            p = stack.pop()
+            if all(isinstance(q, int) for q in p):
+                flat += p
+            else:
+                stack.extend(reversed(p))
+        return flat
+
+    def _intern_label(self, label: tuple) -> int:
+        """ Get the id of an edge label, adding it to the label table """
+        if self._label_ids is None:
+            self._label_ids = {l: i for i, l in enumerate(self._labels)}
+
+        if label not in self._label_ids:
+            self._label_ids[label] = len(self._labels)
+            self._labels.append(label)
+        return self._label_ids[label]
+
+    @classmethod
+    def _build(
+        cls,
+        _id: int,
+        node_labels: list,
+        provenance: list,
+        labels: list,
+        edges: dict
+    ) -> 'InputDataGraph':
+        """ Build a compacted graph straight from its parts """
+        graph = cls(_id)
+        graph._num_nodes = len(node_labels)
+        graph._node_labels = node_labels
+        graph._provenance = provenance
+        graph._labels = labels
+        graph._label_ids = None
+        graph._set_edges(edges)
+        return graph
+
+    @staticmethod
+    def _literal_occurrences(s: str) -> list[list[tuple]]:
+        """ Build an occurrence index over every substring of s
+
+            Returns occ, where occ[i][span] = (k, n) says that s[i:i+span] is
+            the kth (0-indexed) of n, possibly overlapping, occurrences of
+            that substring in s
+
+            Start positions are partitioned by their first character and
+            then refined one character at a time, which walks an implicit
+            suffix trie of s. Each class stays sorted by position, so k is
+            just the index within the class. A class of one never splits
+            again and is filled in directly, so the work is linear in the
+            number of (i, span) pairs instead of a rescan of s for each one
+        """
+        occ = [[None] * (len(s) - i + 1) for i in range(len(s))]
+        classes = [list(range(len(s)))]
+        span = 0
+        while classes:
+            span += 1
+            refined = []
+            for positions in classes:
+                # split the class on the next character of each occurrence
+                split = {}
+                for i in positions:
+                    if i + span <= len(s):
+                        split.setdefault(s[i + span - 1], []).append(i)
+
+                for members in split.values():
+                    if len(members) == 1:
+                        i = members[0]
+                        for rest in range(span, len(s) - i + 1):
+                            occ[i][rest] = (0, 1)
+                        continue
+
+                    n = len(members)
+                    for k, i in enumerate(members):
+                        occ[i][span] = (k, n)
+                    refined.append(members)
+            classes = refined
+        return occ
 
     ### Public Properties
     @property
     def nodes(self):
         """ Nodes property """
-        return self._nodes
+        return range(self._num_nodes)
 
     @property
     def node_labels(self):
-        """ Node label property """
+        """ Node label property, indexed by node id """
         return self._node_labels
 
     @property
     def edges(self):
         """ Edge property """
-        return self._edges
+        self._compact()
+        return _EdgeView(self, labeled=False)
 
     @property
     def edge_labels(self):
         """ Edge label property """
-        return self._edge_labels
+        self._compact()
+        return _EdgeView(self, labeled=True)
 
     @property
     def id(self):
         """ ID property """
         return self._id
 
+    @property
+    def num_columns(self) -> int:
+        """ Number of input columns the graph spans """
+        return 1 if self._columns is None else len(self._columns) - 1
+
+    @property
+    def num_edges(self) -> int:
+        """ Number of labeled edges """
+        self._compact()
+        return len(self._targets)
+
+    @property
+    def pos_exprs(self) -> dict:
+        """ Memo of position expressions per node, see gen_sub_str_expr """
+        return self._pos_exprs
+
     ### Public Methods
     def add_node(self, node: int):
-        """ Add a node to the graph """
-        if node in self._nodes:
-            pass
-        else:
-            self._nodes.add(node)
+        """ Add a node to the graph, growing the id space up to it """
+        self._stage()
+        while self._num_nodes <= node:
+            self._node_labels.append(frozenset())
+            self._provenance.append((self._num_nodes,))
+            self._num_nodes += 1
 
     def add_edge(self, edge: tuple):
         """ Add an ordered pair to the edges in the graph """
@@ -144,16 +358,52 @@ class InputDataGraph:
             print("Edges must be a pair")
             return
 
+        self._stage()
         v1, v2 = edge
-        if v1 > v2:
-            # no back edges expected
-            v1, v2 = v2, v1
+        if v1 not in self._staged:
+            self._staged[v1] = {}
+
+        if v2 not in self._staged[v1]:
+            self._staged[v1][v2] = set()
+
+    def find_nodes(self, label: tuple, column: int = None) -> list[int]:
+        """ Get the nodes labeled with (id, idx), optionally in one column
 
-        if v1 not in self._edges:
-            self._edges[v1] = set([v2])
+            The (id, idx) -> nodes index is built on the first lookup
+        """
+        if self._node_index is None:
+            index = {}
+            for node, labels in enumerate(self._node_labels):
+                for l in labels:
+                    if l not in index:
+                        index[l] = []
+                    index[l].append(node)
+            self._node_index = index
+
+        nodes = self._node_index.get(label, [])
+        if column is None or self._columns is None:
+            return nodes
+
+        first, end = self._columns[column], self._columns[column + 1]
+        return [node for node in nodes if first <= node < end]
+
+    def out_edges(self, node: int):
+        """ Yield (v2, {(tok, k), ...}) for every edge leaving a node """
+        for v2, ids in self._out_edges(node):
+            yield v2, frozenset(self._labels[i] for i in ids)
+
+    def in_edges(self, node: int):
+        """ Yield (v1, {(tok, k), ...}) for every edge entering a node
+
+            The reverse adjacency index is built on the first lookup
+        """
+        if self._in_offsets is None:
+            self._index_incoming()
 
-        elif v2 not in self._edges[v1]:
-            self._edges[v1].add(v2)
+        for i in range(self._in_offsets[node], self._in_offsets[node + 1]):
+            yield self._in_sources[i], frozenset(
+                self._labels[l] for l in self._edge_label_ids[self._in_slots[i]]
+            )
 
     def label_nodes(self, node: int, labels: list[tuple]):
         """ Label a node """
@@ -167,11 +417,13 @@ class InputDataGraph:
 
     def to_dot(self, path: str) -> bool:
         """ generate a dot (graphviz) graph for the IDG """
+        self._compact()
         with open(path, "w", encoding='utf-8') as f:
             f.write("digraph idg {\n")
-            for n1 in self._edge_labels:
-                for n2 in self._edge_labels[n1]:
-                    f.write(f"\"{n1}\" -> \"{n2}\" [label = \"{self._edge_labels[n1][n2]}\"];\n")
+            for n1 in self.nodes:
+                for n2, ids in self._out_edges(n1):
+                    labels = sorted(self._labels[i] for i in ids)
+                    f.write(f"\"{self._source_tuple(n1)}\" -> \"{self._source_tuple(n2)}\" [label = \"{labels}\"];\n")
             f.write("}")
 
         return True
@@ -180,102 +432,213 @@ class InputDataGraph:
     @staticmethod
     def gen_graph_str(s: str, _id: int = -1):
         """ Generate a single IDG given an input string """
-        # Init graph and get new unique string ID
-        graph = InputDataGraph(_id)
+        labels = []
+        label_ids = {}
+
+        def intern(label: tuple) -> int:
+            if label not in label_ids:
+                label_ids[label] = len(labels)
+                labels.append(label)
+            return label_ids[label]
+
         # label all the nodes
-        for i in range(0, len(s) + 3):
-            graph.add_node((i,))
-            graph.label_nodes((i,), [(_id, i)])
+        node_labels = [frozenset([(_id, i)]) for i in range(0, len(s) + 3)]
+        provenance = [(i,) for i in range(0, len(s) + 3)]
+        edges = {i: {} for i in range(0, len(s) + 3)}
 
         # label the start and end symbols
-        graph.label_edges(
-            ((0,),(1,)),
-            [(BaseTokens.StartT.name, 1)]
-        )
-        graph.label_edges(
-            ((len(s)+1,), (len(s)+2,)),
-            [(BaseTokens.EndT.name, 1)]
-        )
-
-        # Add token matches
-        for tok in BaseTokens:
-            if tok is BaseTokens.StartT or tok is BaseTokens.EndT:
-                continue
-            matches = tuple(tok.value.finditer(s))
-            n = len(matches)
-            for i, span in enumerate(matches):
-                start, end = span.start() + 1, span.end() + 1
-                graph.add_edge(((start,), (end,)))
-                graph.label_edges(
-                    ((start,), (end,)),
-                    [((tok.name), (i+1, i-n))]
-                )
+        edges[0][1] = {intern((BaseTokens.StartT.name, 1))}
+        edges[len(s)+1][len(s)+2] = {intern((BaseTokens.EndT.name, 1))}
+
+        # Add token matches, all found in one pass over s
+        for tok, spans in token_spans(s).items():
+            n = len(spans)
+            for i, (start, end) in enumerate(spans):
+                start, end = start + 1, end + 1
+                if end not in edges[start]:
+                    edges[start][end] = set()
+                edges[start][end].add(intern(((tok.name), (i+1, i-n))))
 
         # Add string literal matches
+        occurrences = InputDataGraph._literal_occurrences(s)
         for i in range(1, len(s) + 1):
             for j in range(i+1, len(s) + 2):
                 idx_l, idx_r = i-1, j-1
                 substr = s[idx_l:idx_r]
-                span = len(substr)
-                graph.add_edge(((i,), (j,)))
-
-                matches = [i for i in range(len(s)) if s.startswith(substr, i)]
-                n = len(matches)
-                for k, match in enumerate(matches):
-                    start = match
-                    end = match + span
-                    if start+1 == i and end+1 == j:
-                        graph.label_edges(
-                            ((start+1,), (end+1,)),
-                            [((substr), (k+1, k-n))]
-                        )
-        return graph
+                if j not in edges[i]:
+                    edges[i][j] = set()
+
+                k, n = occurrences[idx_l][idx_r - idx_l]
+                edges[i][j].add(intern(((substr), (k+1, k-n))))
+
+        return InputDataGraph._build(_id, node_labels, provenance, labels, edges)
+
+    @staticmethod
+    def _index_edges(graph) -> dict:
+        """ Index the edges of a graph by label id
+
+            Index of the form:
+
+            {
+                label id: [(v1, v2), ...],
+                ...
+            }
+        """
+        index = {}
+        for v1 in graph.nodes:
+            for v2, ids in graph._out_edges(v1):
+                for label in ids:
+                    if label not in index:
+                        index[label] = []
+                    index[label].append((v1, v2))
+        return index
 
     @staticmethod
-    def intersect(graph_1, graph_2):
-        """ Intersect two IDGs """
-        new_graph = InputDataGraph()
-        # O(n^4) in worst case be avearges to O(n^2) in practice
-        for vi in graph_1.edge_labels:
-            for vj in graph_2.edge_labels:
-                for vk in graph_1.edge_labels[vi]:
-                    for vl in graph_2.edge_labels[vj]:
-                        # all tokens that the graphs share on the new edge
-                        for tok in set(graph_1.edge_labels[vi][vk]) & set(graph_2.edge_labels[vj][vl]):
-                            # add nodes
-                            new_graph.add_node(vi + vj)
-                            new_graph.add_node(vk + vl)
-                            # add node label
-                            new_labels1 = graph_1.node_labels[vi] | graph_2.node_labels[vj]
-                            new_graph.label_nodes(vi + vj, new_labels1)
-
-                            new_labels2 = graph_1.node_labels[vk] | graph_2.node_labels[vl]
-                            new_graph.label_nodes(vk + vl, new_labels2)
-                            # add edges
-                            new_graph.add_edge((vi + vj, vk + vl))
-                            new_graph.label_edges((vi + vj, vk + vl), [tok])
-        return new_graph
+    def intersect(graph_1, graph_2, budget=None):
+        """ Intersect two IDGs
+
+            Hash join over edge labels: graph_2 is indexed by (tok, k) and
+            each labeled edge of graph_1 is paired only with the edges of
+            graph_2 that share that label. With a Budget, it is checked
+            once per node of graph_1 and may raise BudgetExceeded
+        """
+        index = InputDataGraph._index_edges(graph_2)
+
+        # translate label ids of graph_1 into label ids of graph_2, hashing
+        # each distinct label once rather than once per edge
+        ids_2 = {label: i for i, label in enumerate(graph_2._labels)}
+        translate = [ids_2.get(label) for label in graph_1._labels]
+
+        # nodes of the new graph are pairs of nodes, numbered on first sight
+        pair_ids = {}
+        node_labels = []
+        provenance = []
+
+        def _node(v1, v2) -> int:
+            if (v1, v2) not in pair_ids:
+                pair_ids[(v1, v2)] = len(node_labels)
+                node_labels.append(graph_1.node_labels[v1] | graph_2.node_labels[v2])
+                provenance.append((graph_1._provenance[v1], graph_2._provenance[v2]))
+            return pair_ids[(v1, v2)]
+
+        # all tokens that the graphs share on each new edge
+        shared = {}
+        for vi in graph_1.nodes:
+            if budget is not None:
+                budget.check()
+            for vk, ids in graph_1._out_edges(vi):
+                for tok in ids:
+                    if translate[tok] is None:
+                        continue
+                    for vj, vl in index.get(translate[tok], []):
+                        edge = (vi, vj, vk, vl)
+                        if edge not in shared:
+                            shared[edge] = set()
+                        shared[edge].add(tok)
+
+        # renumber the surviving labels into a table of their own
+        labels = []
+        label_ids = {}
+        edges = {}
+        for (vi, vj, vk, vl), toks in shared.items():
+            src, dst = _node(vi, vj), _node(vk, vl)
+            if src not in edges:
+                edges[src] = {}
+
+            edges[src][dst] = set()
+            for tok in toks:
+                if tok not in label_ids:
+                    label_ids[tok] = len(labels)
+                    labels.append(graph_1._labels[tok])
+                edges[src][dst].add(label_ids[tok])
+
+        return InputDataGraph._build(-1, node_labels, provenance, labels, edges)
 
 
     @staticmethod
     def union(graphs: list):
-        """ Union two IDGs """
+        """ Union the IDGs of several input columns
+
+            The column graphs are laid out side by side in one node space:
+            the nodes of column c are renumbered from the first node of
+            that column, keep their own (id, idx) labels and only have edges
+            among themselves. The CSR arrays are concatenated and edge labels
+            are moved into one shared table, so the union holds each node
+            and edge once
+        """
         if len(graphs) == 1:
             return graphs[0]
 
-        '''
-        newG = InputDataGraph()
-
-        for v1 in G1._edges:
-            for v2 in G1._edges[v1]:
-                if v1 in newG._nodes and v2 in newG._nodes:
-                    continue
+        union = InputDataGraph()
+        columns = array('l', [0])
+        offsets = array('l', [0])
+        targets = array('l')
+        for c, graph in enumerate(graphs):
+            graph._compact()
+            base = union._num_nodes
+
+            union._node_labels.extend(graph._node_labels)
+            union._provenance.extend(((c,), p) for p in graph._provenance)
+
+            # translate the label ids of this column into the shared table
+            translate = [union._intern_label(label) for label in graph._labels]
+            shared = {}
+            for ids in graph._edge_label_ids:
+                if ids not in shared:
+                    shared[ids] = frozenset(translate[i] for i in ids)
+                union._edge_label_ids.append(shared[ids])
+
+            end = len(targets)
+            for v in range(graph._num_nodes):
+                offsets.append(end + graph._offsets[v + 1])
+            targets.extend(v + base for v in graph._targets)
+
+            union._num_nodes += graph._num_nodes
+            columns.append(union._num_nodes)
+
+        union._offsets = offsets
+        union._targets = targets
+        union._columns = columns
+        return union
+
+class _EdgeView(Mapping):
+    """ Read-only {v1: {v2: ...}} view over the edge arrays of an IDG
+
+        With labeled=True the inner values are the decoded frozensets of
+        (tok, k) labels, otherwise the view maps v1 to its set of targets
+    """
+    def __init__(self, graph: InputDataGraph, labeled: bool):
+        self._graph = graph
+        self._labeled = labeled
 
-                newG.add_node(v1)
-                newG.I(v1, G1._node_labels[v1])
-                newG.add_node(v2)
-                newG.I(v2, G1._node_labels[v2])
-
-                newG.add_edge((v1, v2))
-                newG.L((v1, v2), G2._edge_labels[v1][v2])
-        '''
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __getitem__(self, node):
+        graph = self._graph
+        if not isinstance(node, int) or not 0 <= node < graph._num_nodes \
+            or graph._offsets[node] == graph._offsets[node + 1]:
+            raise KeyError(node)
+
+        if not self._labeled:
+            return set(v2 for v2, _ in graph._out_edges(node))
+
+        labels = graph._labels
+        return {
+            v2: frozenset(labels[i] for i in ids)
+            for v2, ids in graph._out_edges(node)
+        }
+
+    def __contains__(self, node):
+        graph = self._graph
+        return isinstance(node, int) and 0 <= node < graph._num_nodes \
+            and graph._offsets[node] != graph._offsets[node + 1]
+
+    def __iter__(self):
+        graph = self._graph
+        for node in range(graph._num_nodes):
+            if graph._offsets[node] != graph._offsets[node + 1]:
+                yield node
+
+    def __len__(self):
+        return sum(1 for _ in self)
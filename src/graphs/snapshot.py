@@ -0,0 +1,556 @@
+""" Compact binary snapshots of input data graphs and DAGs """
+# graphs/snapshot.py
+import sys
+import mmap
+import struct
+from array import array
+from collections.abc import Mapping, MutableSequence, Sequence
+from .input_data_graph import InputDataGraph
+from .dag import DAG, LazyDAG
+import language.expressions as EXPRS
+from language.base_tokens import BaseTokens
+
+# bump when the layout of a snapshot changes
+FORMAT_VERSION = 1
+
+MAGIC = b"BFLOSNAP"
+KIND_IDG = 1
+KIND_DAG = 2
+
+# magic, version, kind, flags, number of sections
+_HEADER = struct.Struct("<8sHBBI")
+# tag, type ('q' for int64 arrays, 'B' for bytes), offset, length in bytes
+_SECTION = struct.Struct("<4sc3xQQ")
+
+# tags of the value references stored in the int64 arrays
+_INT, _TUPLE, _STR = 0, 1, 2
+
+# expression and position kinds of the expression tables
+_CONST_STR, _SUB_STR = 0, 1
+_POS, _CONST_POS = 0, 1
+_DIRECTIONS = [EXPRS.Direction.Start, EXPRS.Direction.End]
+
+class _Writer:
+    """ Sections of a snapshot being written, with its interned tables
+
+        Strings are interned into a string table and tuples, however deeply
+        nested, into a tuple table. Both are referenced from the int64
+        arrays by value references: an int, a string id or a tuple id,
+        tagged in the low two bits
+    """
+    def __init__(self, kind: int):
+        self.kind = kind
+        self.sections = []
+        self._string_ids = {}
+        self._strings = []
+        self._tuple_ids = {}
+        self._tuples = []
+        # value references of the tuple objects encoded so far, by identity
+        self._encoded = {}
+
+    def string(self, s: str) -> int:
+        """ Id of a string in the string table """
+        if s not in self._string_ids:
+            self._string_ids[s] = len(self._strings)
+            self._strings.append(s)
+        return self._string_ids[s]
+
+    def _scalar(self, v) -> int:
+        if isinstance(v, str):
+            return (self.string(v) << 2) | _STR
+        # zigzag, so small negative ints stay small
+        return ((v << 1) if v >= 0 else ((-v << 1) - 1)) << 2 | _INT
+
+    def value(self, root) -> int:
+        """ Value reference of an int, a string or a tuple of values
+
+            Nested tuples are walked with an explicit stack, since IDG
+            provenance nests once per intersection
+        """
+        if not isinstance(root, tuple):
+            return self._scalar(root)
+
+        encoded = self._encoded
+        stack = [root]
+        while stack:
+            v = stack[-1]
+            if id(v) in encoded:
+                stack.pop()
+                continue
+
+            pending = [x for x in v if isinstance(x, tuple) and id(x) not in encoded]
+            if pending:
+                stack.extend(pending)
+                continue
+
+            stack.pop()
+            refs = tuple(
+                encoded[id(x)][0] if isinstance(x, tuple) else self._scalar(x)
+                for x in v
+            )
+            if refs not in self._tuple_ids:
+                self._tuple_ids[refs] = len(self._tuples)
+                self._tuples.append(refs)
+            # keep v alive, so its id is not reused by another tuple
+            encoded[id(v)] = ((self._tuple_ids[refs] << 2) | _TUPLE, v)
+        return encoded[id(root)][0]
+
+    def array(self, tag: str, values):
+        """ Add an int64 array section """
+        data = array("q", values)
+        if sys.byteorder != "little":
+            data.byteswap()
+        self.sections.append((tag, b"q", data.tobytes()))
+
+    def csr(self, tag: str, rows):
+        """ Add a list of int lists as offset (tag + O) and value (tag + V) arrays """
+        offsets = [0]
+        values = []
+        for row in rows:
+            values.extend(row)
+            offsets.append(len(values))
+        self.array(tag[:3] + "O", offsets)
+        self.array(tag[:3] + "V", values)
+
+    def tokens(self):
+        """ Add the base token table the snapshot was written against """
+        self.array("TOKN", [
+            self.string(s) for tok in BaseTokens for s in (tok.name, tok.value.pattern)
+        ])
+
+    def to_bytes(self) -> bytes:
+        """ Lay out the header, the directory and the sections """
+        self.csr("TUP", self._tuples)
+        blob = [s.encode("utf-8") for s in self._strings]
+        offsets = [0]
+        for b in blob:
+            offsets.append(offsets[-1] + len(b))
+        self.array("STRO", offsets)
+        self.sections.append(("STRB", b"B", b"".join(blob)))
+
+        start = _HEADER.size + _SECTION.size * len(self.sections)
+        directory = []
+        body = []
+        offset = start
+        for tag, typecode, data in self.sections:
+            # sections start 8-byte aligned, so int64 arrays can be cast in place
+            pad = -offset % 8
+            body.append(b"\0" * pad)
+            offset += pad
+            directory.append(_SECTION.pack(tag.encode("ascii"), typecode, offset, len(data)))
+            body.append(data)
+            offset += len(data)
+
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, self.kind, 0, len(self.sections))
+        return header + b"".join(directory) + b"".join(body)
+
+class _Reader:
+    """ Sections of a snapshot in a buffer, decoded on demand
+
+        On a little-endian machine the int64 arrays are memoryviews cast
+        straight over the buffer, so a memory-mapped snapshot is only read
+        from disk as its arrays are used
+    """
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        if len(self._buffer) < _HEADER.size:
+            raise ValueError("not a snapshot: too short")
+
+        magic, version, kind, _, count = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("not a snapshot: bad magic")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot version {version}, expected {FORMAT_VERSION}")
+        self.kind = kind
+
+        self._sections = {}
+        for i in range(count):
+            tag, typecode, offset, length = _SECTION.unpack_from(
+                self._buffer, _HEADER.size + i * _SECTION.size
+            )
+            if offset + length > len(self._buffer):
+                raise ValueError("truncated snapshot")
+            self._sections[tag.decode("ascii")] = (typecode, offset, length)
+
+        self._strings = {}
+        self._tuples = {}
+        self._string_offsets = self.array("STRO")
+        self._string_blob = self.bytes("STRB")
+        self._tuple_offsets = self.array("TUPO")
+        self._tuple_values = self.array("TUPV")
+
+    def has(self, tag: str) -> bool:
+        return tag in self._sections
+
+    def bytes(self, tag: str) -> memoryview:
+        _, offset, length = self._sections[tag]
+        return self._buffer[offset:offset + length]
+
+    def array(self, tag: str):
+        """ An int64 array section, as a sequence of ints """
+        data = self.bytes(tag)
+        if sys.byteorder == "little":
+            return data.cast("q")
+        values = array("q", data)
+        values.byteswap()
+        return values
+
+    def csr(self, tag: str) -> tuple:
+        """ (offsets, values) arrays of a section written with _Writer.csr """
+        return self.array(tag[:3] + "O"), self.array(tag[:3] + "V")
+
+    def string(self, i: int) -> str:
+        if i not in self._strings:
+            start, end = self._string_offsets[i], self._string_offsets[i + 1]
+            self._strings[i] = bytes(self._string_blob[start:end]).decode("utf-8")
+        return self._strings[i]
+
+    def _refs(self, i: int):
+        return self._tuple_values[self._tuple_offsets[i]:self._tuple_offsets[i + 1]]
+
+    def value(self, ref: int):
+        """ Decode a value reference """
+        tag, x = ref & 3, ref >> 2
+        if tag == _INT:
+            return x >> 1 if x & 1 == 0 else -((x + 1) >> 1)
+        if tag == _STR:
+            return self.string(x)
+
+        # decode the tuple and any tuples below it, innermost first
+        tuples = self._tuples
+        stack = [x]
+        while stack:
+            i = stack[-1]
+            if i in tuples:
+                stack.pop()
+                continue
+
+            pending = [r >> 2 for r in self._refs(i) if r & 3 == _TUPLE and r >> 2 not in tuples]
+            if pending:
+                stack.extend(pending)
+                continue
+
+            stack.pop()
+            tuples[i] = tuple(
+                tuples[r >> 2] if r & 3 == _TUPLE else self.value(r)
+                for r in self._refs(i)
+            )
+        return tuples[x]
+
+    def check_tokens(self):
+        """ Refuse snapshots written against other base tokens """
+        table = self.array("TOKN")
+        tokens = [(self.string(table[i]), self.string(table[i + 1])) for i in range(0, len(table), 2)]
+        if tokens != [(tok.name, tok.value.pattern) for tok in BaseTokens]:
+            raise ValueError("snapshot was written against different base tokens")
+
+class _FrozenSets(Sequence):
+    """ Label id sets of the edge slots of a loaded IDG, decoded on access """
+    def __init__(self, offsets, values):
+        self._offsets = offsets
+        self._values = values
+        self._sets = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, slot):
+        if slot < 0:
+            slot += len(self)
+        if not 0 <= slot < len(self):
+            raise IndexError(slot)
+        if slot not in self._sets:
+            self._sets[slot] = frozenset(
+                self._values[self._offsets[slot]:self._offsets[slot + 1]]
+            )
+        return self._sets[slot]
+
+class _Decoded(MutableSequence):
+    """ Values of an array of value references, decoded on first access
+
+        Labels, node labels and provenance of a loaded IDG. They stay
+        mutable, so a loaded graph can still be built on: values are
+        appended without decoding the rest, anything else decodes them all
+    """
+    _UNSET = object()
+
+    def __init__(self, refs, decode):
+        self._refs = refs
+        self._decode = decode
+        self._values = [self._UNSET] * len(refs)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, _Decoded)):
+            return self[:] == other[:]
+        return NotImplemented
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        value = self._values[i]
+        if value is self._UNSET:
+            if i < 0:
+                i += len(self)
+            value = self._values[i] = self._decode(self._refs[i])
+        return value
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            self._decode_all()
+        self._values[i] = value
+
+    def __delitem__(self, i):
+        self._decode_all()
+        del self._values[i]
+
+    def insert(self, i, value):
+        if i < len(self):
+            self._decode_all()
+        self._values.insert(i, value)
+
+    def _decode_all(self):
+        self._values = self[:]
+
+class _SnapshotMapping(Mapping):
+    """ {node: {successor: expressions}} of a loaded DAG
+
+        The expressions on the edges leaving a node are decoded the first
+        time the node is looked up
+    """
+    def __init__(self, reader: _Reader, nodes: list, positions: EXPRS.PositionTable):
+        self._reader = reader
+        self._nodes = nodes
+        self._index = {node: i for i, node in enumerate(nodes)}
+        self._positions = positions
+        self._offsets = reader.array("EOFF")
+        self._targets = reader.array("ETGT")
+        self._expr_offsets, self._expr_ids = reader.csr("EXPO")
+        self._expr_table = reader.array("EXPR")
+        self._pos_table = reader.array("POSX")
+        self._set_offsets, self._set_values = reader.csr("PSTO")
+        self._exprs = {}
+        self._pos = {}
+        self._out = {}
+
+    def _has_edges(self, i: int) -> bool:
+        return self._offsets[i] != self._offsets[i + 1]
+
+    def __getitem__(self, node):
+        i = self._index.get(node)
+        if i is None or not self._has_edges(i):
+            raise KeyError(node)
+        if i not in self._out:
+            self._out[i] = {
+                self._nodes[self._targets[slot]]: set(
+                    self._expr(e) for e in
+                    self._expr_ids[self._expr_offsets[slot]:self._expr_offsets[slot + 1]]
+                )
+                for slot in range(self._offsets[i], self._offsets[i + 1])
+            }
+        return self._out[i]
+
+    def __contains__(self, node):
+        i = self._index.get(node)
+        return i is not None and self._has_edges(i)
+
+    def __iter__(self):
+        for i, node in enumerate(self._nodes):
+            if self._has_edges(i):
+                yield node
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def _expr(self, e: int):
+        if e not in self._exprs:
+            kind, s, column, left, right = self._expr_table[5 * e:5 * e + 5]
+            if kind == _CONST_STR:
+                self._exprs[e] = EXPRS.ConstStringExpr(self._reader.string(s))
+            else:
+                self._exprs[e] = EXPRS.SubStringExpr(
+                    substr=self._reader.string(s),
+                    left=self._pos_set(left),
+                    right=self._pos_set(right),
+                    table=self._positions,
+                    column=column
+                )
+        return self._exprs[e]
+
+    def _pos_set(self, s: int) -> frozenset:
+        start, end = self._set_offsets[s], self._set_offsets[s + 1]
+        return frozenset(self._pos_expr(p) for p in self._set_values[start:end])
+
+    def _pos_expr(self, p: int):
+        if p not in self._pos:
+            kind, tok, idx, direction = self._pos_table[4 * p:4 * p + 4]
+            if kind == _CONST_POS:
+                self._pos[p] = EXPRS.ConstPosExpr(idx=self._reader.value(idx))
+            else:
+                self._pos[p] = EXPRS.PosExpr(
+                    tok=self._reader.string(tok),
+                    idx=self._reader.value(idx),
+                    direction=_DIRECTIONS[direction]
+                )
+        return self._pos[p]
+
+def _dump_idg(graph: InputDataGraph, w: _Writer):
+    graph._compact()
+    w.array("META", [graph._num_nodes, graph._id, graph._columns is not None])
+    w.array("OFFS", graph._offsets)
+    w.array("TARG", graph._targets)
+    w.csr("ELBO", (sorted(ids) for ids in graph._edge_label_ids))
+    w.array("LABL", [w.value(label) for label in graph._labels])
+    w.array("NLAB", [w.value(tuple(sorted(labels))) for labels in graph._node_labels])
+    w.array("PROV", [w.value(prov) for prov in graph._provenance])
+    if graph._columns is not None:
+        w.array("COLS", graph._columns)
+
+def _load_idg(r: _Reader) -> InputDataGraph:
+    num_nodes, _id, has_columns = r.array("META")
+    graph = InputDataGraph(_id)
+    graph._num_nodes = num_nodes
+    graph._offsets = r.array("OFFS")
+    graph._targets = r.array("TARG")
+    graph._edge_label_ids = _FrozenSets(*r.csr("ELBO"))
+    graph._labels = _Decoded(r.array("LABL"), r.value)
+    graph._label_ids = None
+    graph._node_labels = _Decoded(r.array("NLAB"), lambda ref: frozenset(r.value(ref)))
+    graph._provenance = _Decoded(r.array("PROV"), r.value)
+    if has_columns:
+        graph._columns = r.array("COLS")
+    return graph
+
+def _dump_dag(dag: DAG, w: _Writer):
+    if isinstance(dag, LazyDAG):
+        dag = dag.materialize()
+
+    # the declared nodes first, then any other node an edge touches
+    nodes = list(dag.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    for node in [dag.start_node, dag.final_node] + [
+        n for n1 in dag.mapping for n in (n1, *dag.mapping[n1])
+    ]:
+        if node not in index:
+            index[node] = len(nodes)
+            nodes.append(node)
+
+    exprs = {}
+    pos = {}
+    pos_sets = {}
+    expr_rows = []
+    pos_rows = []
+    set_rows = []
+
+    def _pos_id(p) -> int:
+        if p not in pos:
+            pos[p] = len(pos_rows)
+            if isinstance(p, EXPRS.ConstPosExpr):
+                pos_rows.append((_CONST_POS, 0, w.value(p.idx), 0))
+            else:
+                pos_rows.append((_POS, w.string(p.tok), w.value(p.idx), _DIRECTIONS.index(p.direction)))
+        return pos[p]
+
+    def _set_id(ps) -> int:
+        ids = tuple(sorted(_pos_id(p) for p in ps))
+        if ids not in pos_sets:
+            pos_sets[ids] = len(set_rows)
+            set_rows.append(ids)
+        return pos_sets[ids]
+
+    def _expr_id(e) -> int:
+        if e not in exprs:
+            exprs[e] = len(expr_rows)
+            if isinstance(e, EXPRS.ConstStringExpr):
+                expr_rows.append((_CONST_STR, w.string(e.const_str), 0, 0, 0))
+            else:
+                expr_rows.append((_SUB_STR, w.string(e.v), e.column, _set_id(e.pl), _set_id(e.pr)))
+        return exprs[e]
+
+    offsets = [0]
+    targets = []
+    edge_exprs = []
+    for node in nodes:
+        for n2, es in dag.mapping.get(node, {}).items():
+            targets.append(index[n2])
+            edge_exprs.append(sorted(_expr_id(e) for e in es))
+        offsets.append(len(targets))
+
+    w.array("META", [index[dag.start_node], index[dag.final_node], len(dag.nodes)])
+    w.array("NODE", [w.value(node) for node in nodes])
+    w.array("EOFF", offsets)
+    w.array("ETGT", targets)
+    w.csr("EXPO", edge_exprs)
+    w.array("EXPR", [x for row in expr_rows for x in row])
+    w.array("POSX", [x for row in pos_rows for x in row])
+    w.csr("PSTO", set_rows)
+
+def _load_dag(r: _Reader, string_to_id=None, positions=None) -> DAG:
+    start, final, declared = r.array("META")
+    nodes = [r.value(ref) for ref in r.array("NODE")]
+
+    dag = DAG(string_to_id=string_to_id, positions=positions)
+    dag.nodes = nodes[:declared]
+    dag.start_node = nodes[start]
+    dag.final_node = nodes[final]
+    dag._mapping = _SnapshotMapping(r, nodes, dag.positions)
+
+    offsets, edge_targets = r.array("EOFF"), r.array("ETGT")
+    for i, node in enumerate(nodes):
+        if offsets[i] != offsets[i + 1]:
+            dag.edges[node] = set(nodes[edge_targets[s]] for s in range(offsets[i], offsets[i + 1]))
+    return dag
+
+def dumps(graph) -> bytes:
+    """ Serialize an InputDataGraph or a DAG into a snapshot
+
+        A LazyDAG is materialized first
+    """
+    if isinstance(graph, InputDataGraph):
+        w = _Writer(KIND_IDG)
+        _dump_idg(graph, w)
+    elif isinstance(graph, DAG):
+        w = _Writer(KIND_DAG)
+        _dump_dag(graph, w)
+    else:
+        raise TypeError(f"cannot snapshot {type(graph).__name__}")
+    w.tokens()
+    return w.to_bytes()
+
+def loads(buffer, string_to_id=None, positions=None):
+    """ Load the graph of a snapshot from a bytes-like buffer
+
+        The buffer is not copied and must outlive the graph. The
+        expressions of a DAG are built over positions, a PositionTable,
+        so they intersect with those of a synthesis using the same table
+    """
+    r = _Reader(buffer)
+    r.check_tokens()
+    if r.kind == KIND_IDG:
+        return _load_idg(r)
+    if r.kind == KIND_DAG:
+        return _load_dag(r, string_to_id, positions)
+    raise ValueError(f"unknown snapshot kind {r.kind}")
+
+def dump(graph, path: str):
+    """ Write the snapshot of an InputDataGraph or a DAG to a file """
+    with open(path, "wb") as f:
+        f.write(dumps(graph))
+
+def load(path: str, string_to_id=None, positions=None, use_mmap: bool = True):
+    """ Load the graph of a snapshot file
+
+        With use_mmap the file is memory-mapped rather than read: only the
+        header and the string and tuple offsets are read up front. The edge
+        arrays are paged in as they are used, and the labels, node labels
+        and provenance of an IDG are decoded one entry at a time as they
+        are looked up
+    """
+    with open(path, "rb") as f:
+        if use_mmap:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+    return loads(buffer, string_to_id, positions)
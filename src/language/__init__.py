@@ -2,4 +2,5 @@
 # language/__init__.py
 
 from .base_tokens import BaseTokens
-from .expressions import SubStringExpr, ConstStringExpr, PosExpr, ConstPosExpr, Direction
+from .expressions import SubStringExpr, ConstStringExpr, PosExpr, ConstPosExpr, Direction, PositionTable
+from .compiler import CompiledProgram, compile_program
@@ -0,0 +1,182 @@
+""" Compile programs of the string transformation language to Python """
+# language/compiler.py
+from collections import OrderedDict
+from .base_tokens import BaseTokens
+from .expressions import StringExpr, SubStringExpr, ConstStringExpr, ConstPosExpr, Direction
+
+# kinds of compiled positions
+_CONST = 0      # (kind, position)
+_FROM_END = 1   # (kind, offset from len(s))
+_TOK_START = 2  # (kind, token slot, match index)
+_TOK_END = 3    # (kind, token slot, match index)
+
+class CompiledProgram:
+    """ A StringExpr compiled into a Python callable
+
+        Positions follow the input data graph: 1-indexed, so position p sits
+        before s[p-1], and the kth match of a token starts at its start + 1.
+        Each SubStringExpr is compiled to the position expressions
+        to_formula picks, and tokens are indexed by their kth match from the
+        left as in the formula.
+
+        Calling the program on a string returns the output string, or None
+        when a position does not exist in that string (too few matches, or
+        the positions are out of order). A program over several input
+        columns is called on a row, a sequence of one string per column.
+        num_columns is the number of columns of the spec it was learned
+        from, since a program need not read every one of them.
+        The program is compiled to a straight-line Python function that
+        scans every token once per string, only as far as the largest match
+        index the program asks for
+    """
+    def __init__(self, program: StringExpr, num_columns: int = 1):
+        # [column, tok, matches needed] of every token scan
+        self._scanners = []
+        slots = {}
+
+        def _slot(column: int, tok: str, k: int) -> int:
+            """ Register a token scan that needs at least k matches """
+            if (column, tok) not in slots:
+                slots[(column, tok)] = len(self._scanners)
+                self._scanners.append([column, tok, 0])
+            scanner = self._scanners[slots[(column, tok)]]
+            scanner[2] = max(scanner[2], k)
+            return slots[(column, tok)]
+
+        def _position(expr, column: int) -> tuple:
+            if isinstance(expr, ConstPosExpr):
+                return (_CONST, expr.idx)
+
+            start = expr.direction == Direction.Start
+            if expr.tok == BaseTokens.StartT.name:
+                return (_CONST, 0 if start else 1)
+            if expr.tok == BaseTokens.EndT.name:
+                return (_FROM_END, 1 if start else 2)
+
+            k = expr.idx if isinstance(expr.idx, int) else expr.idx[0]
+            return (_TOK_START if start else _TOK_END, _slot(column, expr.tok, k), k - 1)
+
+        # constant strings and (column, left, right) substrings
+        self._pieces = []
+        self.num_columns = num_columns
+        for expr in program.substr_exprs:
+            if isinstance(expr, ConstStringExpr):
+                self._pieces.append(expr.const_str)
+            elif isinstance(expr, SubStringExpr):
+                left, right = expr.best_positions()
+                self._pieces.append((
+                    expr.column,
+                    _position(left, expr.column),
+                    _position(right, expr.column)
+                ))
+                self.num_columns = max(self.num_columns, expr.column + 1)
+
+        self._program = self._codegen()
+
+    @staticmethod
+    def _source(pos: tuple, column: int) -> str:
+        """ Python expression for a compiled position """
+        kind = pos[0]
+        if kind == _CONST:
+            return str(pos[1])
+        if kind == _FROM_END:
+            return f"end{column} + {pos[1] - 1}"
+        return f"t{pos[1]}_{pos[2]}{'s' if kind == _TOK_START else 'e'} + 1"
+
+    def _codegen(self):
+        """ Generate the straight-line Python function of the program
+
+            Each token is matched left to right with its precompiled regex,
+            or str.find for a literal, stopping at the last match the
+            program asks for. A string with fewer matches cannot be
+            transformed, so it returns None as soon as a match is missing
+        """
+        namespace = {}
+        if self.num_columns == 1:
+            lines = ["def program(s0):"]
+        else:
+            lines = ["def program(row):"]
+            lines += [f"    s{c} = row[{c}]" for c in range(self.num_columns)]
+        lines += [f"    end{c} = len(s{c}) + 1" for c in range(self.num_columns)]
+
+        for i, (column, tok, count) in enumerate(self._scanners):
+            s = f"s{column}"
+            if tok in BaseTokens.__members__:
+                namespace[f"search{i}"] = BaseTokens[tok].value.search
+                for k in range(count):
+                    start = "" if k == 0 else ", m.end()"
+                    lines.append(f"    m = search{i}({s}{start})")
+                    lines.append("    if m is None: return None")
+                    lines.append(f"    t{i}_{k}s, t{i}_{k}e = m.span()")
+            else:
+                # overlapping occurrences of a literal, as in the IDG
+                namespace[f"lit{i}"] = tok
+                for k in range(count):
+                    start = "" if k == 0 else f", t{i}_{k-1}s + 1"
+                    lines.append(f"    t{i}_{k}s = {s}.find(lit{i}{start})")
+                    lines.append(f"    if t{i}_{k}s < 0: return None")
+                    lines.append(f"    t{i}_{k}e = t{i}_{k}s + {len(tok)}")
+
+        parts = []
+        for j, piece in enumerate(self._pieces):
+            if isinstance(piece, str):
+                namespace[f"c{j}"] = piece
+                parts.append(f"c{j}")
+                continue
+
+            column, left, right = piece
+            lines.append(f"    l{j} = {self._source(left, column)}")
+            lines.append(f"    r{j} = {self._source(right, column)}")
+            lines.append(f"    if not 1 <= l{j} <= r{j} <= end{column}: return None")
+            parts.append(f"s{column}[l{j}-1:r{j}-1]")
+
+        lines.append(f"    return ''.join(({', '.join(parts)},))" if parts else "    return ''")
+        exec("\n".join(lines), namespace)
+        return namespace["program"]
+
+    def __getstate__(self) -> dict:
+        # the generated function is rebuilt on unpickling, so a compiled
+        # program can be shipped to worker processes as is
+        return {
+            "scanners": self._scanners,
+            "pieces": self._pieces,
+            "num_columns": self.num_columns
+        }
+
+    def __setstate__(self, state: dict):
+        self._scanners = state["scanners"]
+        self._pieces = state["pieces"]
+        self.num_columns = state["num_columns"]
+        self._program = self._codegen()
+
+    def __call__(self, s):
+        """ Run the program on one string, or row of strings """
+        return self._program(s)
+
+    def apply_column(self, strings, memo: int = 4096) -> list:
+        """ Run the program on every string of a column, keeping their order
+
+            For a program over several columns, the column holds rows as
+            tuples. The outputs of the last memo distinct values used are
+            kept, so values repeated within them are only evaluated once;
+            memo=0 evaluates every value
+        """
+        program = self._program
+        if memo <= 0:
+            return [program(s) for s in strings]
+
+        seen = OrderedDict()
+        out = []
+        for s in strings:
+            if s in seen:
+                seen.move_to_end(s)
+            else:
+                seen[s] = program(s)
+                if len(seen) > memo:
+                    seen.popitem(last=False)
+            out.append(seen[s])
+        return out
+
+def compile_program(program: StringExpr, num_columns: int = 1) -> CompiledProgram:
+    """ Compile a program over num_columns input columns for evaluation in Python """
+    return CompiledProgram(program, num_columns)
@@ -1,6 +1,7 @@
 """ Definitions for the string transformation language """
 # src/language/expressions.py
 import pdb
+import weakref
 from typing import Union
 from enum import Enum
 from .base_tokens import BaseTokens
@@ -10,6 +11,28 @@ class Expr:
         """ Virtual method __repr__ """
         raise RuntimeError("Expressions must implement \"__repr__\"")
 
+class HashConsed(type):
+    """ Metaclass for hash-consed expressions
+
+        Constructing an expression that is structurally equal to a live one
+        returns the live object, so equal expressions share one instance and
+        memory follows the number of distinct expressions. Instances must be
+        immutable and define _key(), which their __hash__ and __eq__ use
+    """
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        cls._interned = weakref.WeakValueDictionary()
+
+    def __call__(cls, *args, **kwargs):
+        expr = super().__call__(*args, **kwargs)
+        key = expr._key()
+        interned = cls._interned.get(key)
+        if interned is not None:
+            return interned
+
+        cls._interned[key] = expr
+        return expr
+
 class StringExpr(Expr):
     """ top-level expression """
     def __init__(
@@ -28,25 +51,15 @@ class StringExpr(Expr):
         for expr in self.substr_exprs:
             if isinstance(expr, SubStringExpr):
                 substr = "MID(<input>,"
-                best = []
-                # check all left
-                for l in expr.pl:
-                    if len(l) > len(best):
-                        best = l
+                left, right = expr.best_positions()
 
-                left_index = best.to_formula()
+                left_index = left.to_formula()
                 substr += f"{left_index},"
 
-                # check all right
-                best = []
-                for r in expr.pr:
-                    if len(r) > len(best):
-                        best = r
-
-                right_index = best.to_formula()
+                right_index = right.to_formula()
 
                 substr += f"{right_index}-({left_index})"
-                formula += f"{substr})"
+                formula += f"{expr.column_placeholder(substr)})"
                 formula += ","
 
             elif isinstance(expr, ConstStringExpr):
@@ -61,7 +74,19 @@ class StringExpr(Expr):
         """ Output a BlinkFill-formatted formula """
         return f"{' '.join(se.__repr__() for se in self.substr_exprs)}"
 
-class ConstStringExpr(Expr):
+    def to_dict(self) -> dict:
+        """ Serialize to a JSON-compatible dict """
+        return {
+            "type": "Str",
+            "substrs": [expr.to_dict() for expr in self.substr_exprs]
+        }
+
+    @staticmethod
+    def from_dict(data: dict, table: 'PositionTable' = None) -> 'StringExpr':
+        """ Rebuild a StringExpr serialized with to_dict """
+        return StringExpr([expr_from_dict(d, table) for d in data["substrs"]])
+
+class ConstStringExpr(Expr, metaclass=HashConsed):
     """ Constant string sub expression """
     def __init__(
         self,
@@ -69,11 +94,11 @@ class ConstStringExpr(Expr):
     ):
         self.const_str = string
 
-    def __key(self):
+    def _key(self):
         return self.const_str
 
     def __hash__(self):
-        return hash(self.__key())
+        return hash(self._key())
 
     def __repr__(self) -> str:
         return f"ConstStr({self.const_str})"
@@ -89,54 +114,140 @@ class ConstStringExpr(Expr):
     def to_formula(self) -> str:
         return f"\"{self.const_str}\""
 
-class SubStringExpr(Expr):
-    """ Substring Expression """
+    def to_dict(self) -> dict:
+        return {"type": "ConstStr", "str": self.const_str}
+
+class SubStringExpr(Expr, metaclass=HashConsed):
+    """ Substring Expression
+
+        The left and right position sets are bitmasks over a PositionTable,
+        so intersecting two expressions is a bitwise and. The sets are only
+        decoded back into expressions through pl and pr. Identified by its
+        table, masks and substring v; v sets its rank weight, so
+        expressions that only differ in v are kept apart, as they were
+        before expressions were interned. Expressions over two tables are
+        never equal, intersect moves one over to the other's table.
+
+        column is the input column the substring is taken from. Positions
+        are only meaningful within their column, so expressions over
+        different columns never intersect
+    """
     def __init__(
         self,
         substr: str,
-        left: set['PosExpr'],
-        right: set['PosExpr']
+        left: Union[set['PosExpr'], int],
+        right: Union[set['PosExpr'], int],
+        table: 'PositionTable' = None,
+        column: int = 0
     ):
+        if table is None:
+            table = PositionTable.shared()
+
         self.v = substr
-        self.pl = left
-        self.pr = right
+        self.column = column
+        self.table = table
+        self.left = left if isinstance(left, int) else table.encode(left)
+        self.right = right if isinstance(right, int) else table.encode(right)
+        self._hash = hash(self._key())
 
     def __repr__(self) -> str:
+        if self.column:
+            return f"SubStr(v{self.column}, {self.pl.__repr__()}, {self.pr.__repr__()}"
         return f"SubStr({self.pl.__repr__()}, {self.pr.__repr__()}"
 
+    def _key(self):
+        return (self.table, self.left, self.right, self.column, self.v)
+
     def __hash__(self) -> int:
-        return id(self)
+        return self._hash
 
     def __eq__(self, other) -> bool:
+        if self is other:
+            return True
         if isinstance(other, SubStringExpr):
-            return self.pl == other.pl and self.pr == other.pr
+            # masks are only comparable over one table, and the hash
+            # covers the table, so expressions of two tables never match
+            return self.table is other.table and self.left == other.left and \
+                self.right == other.right and self.column == other.column and self.v == other.v
         return False
 
     def __len__(self) -> int:
         return len(self.v)
 
+    def to_dict(self) -> dict:
+        return {
+            "type": "SubStr",
+            "v": self.v,
+            "column": self.column,
+            "left": [p.to_dict() for p in sorted(self.pl, key=repr)],
+            "right": [p.to_dict() for p in sorted(self.pr, key=repr)]
+        }
+
+    @property
+    def pl(self) -> frozenset['PosExpr']:
+        """ left position expressions """
+        return self.table.decode(self.left)
+
+    @property
+    def pr(self) -> frozenset['PosExpr']:
+        """ right position expressions """
+        return self.table.decode(self.right)
+
+    def column_placeholder(self, formula: str) -> str:
+        """ Point the <input> placeholder of a formula at this column
+
+            The first column keeps <input>, column c > 0 becomes <input{c}>
+        """
+        if self.column:
+            return formula.replace("<input>", f"<input{self.column}>")
+        return formula
+
+    def best_positions(self) -> tuple:
+        """ The (left, right) position expressions a program commits to
+
+            The longest of each set, and of those the first by repr, so the
+            choice does not depend on set iteration order
+        """
+        def _best(exprs):
+            return min(exprs, key=lambda expr: (-len(expr), repr(expr)))
+
+        return _best(self.pl), _best(self.pr)
+
     @staticmethod
     def intersect(substr1, substr2) -> 'SubStringExpr':
         """ intersect two substring expressions """
-        if not hasattr(substr1, "pl") or not hasattr(substr2, "pl"):
+        if not isinstance(substr1, SubStringExpr) or \
+            not isinstance(substr2, SubStringExpr):
             return None
 
-        left = substr1.pl & substr2.pl
-        if len(left) == 0:
+        if substr1.column != substr2.column:
             return None
 
-        right = substr1.pr & substr2.pr
-        if len(right) == 0:
+        table = substr1.table
+        if substr2.table is table:
+            left, right = substr2.left, substr2.right
+        else:
+            # expressions from another synthesis, move them to this table
+            left, right = table.encode(substr2.pl), table.encode(substr2.pr)
+
+        left &= substr1.left
+        if not left:
+            return None
+
+        right &= substr1.right
+        if not right:
             return None
 
         max_substr = substr1.v if len(substr1.v) > len(substr2.v) else substr2.v
         return SubStringExpr(
                     substr = max_substr,
                     left=left,
-                    right=right
+                    right=right,
+                    table=table,
+                    column=substr1.column
                 )
 
-class PosExpr(Expr):
+class PosExpr(Expr, metaclass=HashConsed):
     """ Position Expression w/ Token """
     def __init__(self,
         tok,
@@ -150,11 +261,11 @@ class PosExpr(Expr):
     def __repr__(self) -> str:
         return f"PosExpr('{self.tok}',{self.idx},{self.direction.value})"
 
-    def __key(self):
+    def _key(self):
         return (self.tok,self.idx,self.direction.value)
 
     def __hash__(self):
-        return hash(self.__key())
+        return hash(self._key())
 
     def __eq__(self, other):
         if isinstance(other, PosExpr):
@@ -196,8 +307,16 @@ class PosExpr(Expr):
 
         return formula
 
+    def to_dict(self) -> dict:
+        return {
+            "type": "Pos",
+            "tok": self.tok,
+            "idx": self.idx if isinstance(self.idx, int) else list(self.idx),
+            "dir": self.direction.value
+        }
+
 
-class ConstPosExpr(Expr):
+class ConstPosExpr(Expr, metaclass=HashConsed):
     """ Constant Position Expression """
     def __init__(self,
         idx
@@ -207,11 +326,11 @@ class ConstPosExpr(Expr):
     def __repr__(self) -> str:
         return f"ConstPos({self.idx})"
 
-    def __key(self) -> int:
+    def _key(self) -> int:
         return self.idx
 
     def __hash__(self):
-        return hash(self.__key())
+        return hash(self._key())
 
     def __eq__(self, other):
         if isinstance(other, ConstPosExpr):
@@ -224,59 +343,163 @@ class ConstPosExpr(Expr):
     def to_formula(self) -> str:
         return str(self.idx)
 
+    def to_dict(self) -> dict:
+        return {"type": "ConstPos", "idx": self.idx}
+
 class Direction(Enum):
     Start = "Start"
     End = "End"
 
-def gen_sub_str_expr(vk, l, r, sid, idg: 'InputDataGraph'):
+class PositionTable:
+    """ Dense integer ids for position expressions
+
+        One table is shared by a synthesis run, so position sets can be
+        stored as int bitmasks (bit i set <=> expression i is in the set).
+        Python ints grow as needed, so large tables need no special case
+    """
+    # used by expressions built without a table of their own, started
+    # over once it holds DEFAULT_LIMIT expressions
+    default = None
+    DEFAULT_LIMIT = 1 << 16
+
+    def __init__(self):
+        self._ids = {}
+        self._exprs = []
+        self._masks = {}
+
+    def __len__(self) -> int:
+        return len(self._exprs)
+
+    @classmethod
+    def shared(cls) -> 'PositionTable':
+        """ The default table, replaced by a fresh one once it is full
+
+            Expressions keep the table they were built over, so replacing
+            the default only frees it once they are gone
+        """
+        if cls.default is None or len(cls.default) >= cls.DEFAULT_LIMIT:
+            cls.default = cls()
+        return cls.default
+
+    def id(self, expr: Expr) -> int:
+        """ Get the id of a position expression, adding it if new """
+        if expr not in self._ids:
+            self._ids[expr] = len(self._exprs)
+            self._exprs.append(expr)
+        return self._ids[expr]
+
+    def encode(self, exprs) -> int:
+        """ Encode a set of position expressions as a bitmask
+
+            Masks of frozensets are memoized, which makes re-encoding the
+            per-node sets memoized on an IDG a single lookup
+        """
+        if isinstance(exprs, frozenset) and exprs in self._masks:
+            return self._masks[exprs]
+
+        mask = 0
+        for expr in exprs:
+            mask |= 1 << self.id(expr)
+
+        if isinstance(exprs, frozenset):
+            self._masks[exprs] = mask
+        return mask
+
+    def decode(self, mask: int) -> frozenset:
+        """ Decode a bitmask back into position expressions """
+        exprs = []
+        while mask:
+            low = mask & -mask
+            exprs.append(self._exprs[low.bit_length() - 1])
+            mask ^= low
+        return frozenset(exprs)
+
+def expr_from_dict(data: dict, table: PositionTable = None) -> Expr:
+    """ Rebuild an expression serialized with its to_dict method """
+    kind = data["type"]
+    if kind == "Str":
+        return StringExpr.from_dict(data, table)
+    if kind == "ConstStr":
+        return ConstStringExpr(data["str"])
+    if kind == "SubStr":
+        return SubStringExpr(
+                    substr=data["v"],
+                    left=set(expr_from_dict(p) for p in data["left"]),
+                    right=set(expr_from_dict(p) for p in data["right"]),
+                    table=table,
+                    column=data.get("column", 0)
+                )
+    if kind == "Pos":
+        idx = data["idx"] if isinstance(data["idx"], int) else tuple(data["idx"])
+        return PosExpr(tok=data["tok"], idx=idx, direction=Direction(data["dir"]))
+    if kind == "ConstPos":
+        return ConstPosExpr(idx=data["idx"])
+    raise ValueError(f"Unknown expression type: {kind}")
+
+def gen_sub_str_expr(
+    vk, l, r, sid, idg: 'InputDataGraph', table: PositionTable = None, column: int = 0
+):
     """ Generate all substring expressions for the given string
 
     vk: string to generate SubStrExpr's for
     l: left position
     r: right position
     sid: unique string index
+    table: position table of the synthesis run
+    column: input column of the string
     """
-    def _to_exprs(node: tuple) -> set[PosExpr]:
-        """ Convert a node in the idg to expressions in the language """
+    if table is None:
+        table = PositionTable.shared()
+
+    def _to_exprs(node: int) -> set[PosExpr]:
+        """ Convert a node in the idg to expressions in the language
+
+            Memoized on the idg, since every output substring of every
+            example asks for the same few nodes
+        """
+        if node in idg.pos_exprs:
+            return idg.pos_exprs[node]
+
         start_edges = []
         end_edges = []
 
         # node is is left/start
-        if node in idg.edge_labels:
-            for r_edge in idg.edge_labels[node]:
-                for label in idg.edge_labels[node][r_edge]:
-                    pos = PosExpr(
-                                tok=label[0],
-                                idx=label[1],
-                                direction=Direction.Start
-                            )
-                    start_edges.append(pos)
+        for _, labels in idg.out_edges(node):
+            for label in labels:
+                pos = PosExpr(
+                            tok=label[0],
+                            idx=label[1],
+                            direction=Direction.Start
+                        )
+                start_edges.append(pos)
 
         # node is right/end
-        for l_edge in idg.edge_labels:
-            if node in idg.edge_labels[l_edge]:
-                for label in idg.edge_labels[l_edge][node]:
-                    pos = PosExpr(
-                                tok=label[0],
-                                idx=label[1],
-                                direction=Direction.End
-                            )
-                    end_edges.append(pos)
-        return set(start_edges + end_edges)
-
-    vl = set([])
-    vr = set([])
-    for v in idg.nodes:
-        if (sid, l) in idg.node_labels[v]:
-            vl |= _to_exprs(v)
-        if (sid, r) in idg.node_labels[v]:
-            vr |= _to_exprs(v)
-
-    vl.add(ConstPosExpr(idx=l))
-    vr.add(ConstPosExpr(idx=r))
+        for _, labels in idg.in_edges(node):
+            for label in labels:
+                pos = PosExpr(
+                            tok=label[0],
+                            idx=label[1],
+                            direction=Direction.End
+                        )
+                end_edges.append(pos)
+
+        idg.pos_exprs[node] = frozenset(start_edges + end_edges)
+        return idg.pos_exprs[node]
+
+    vl = 0
+    vr = 0
+    for v in idg.find_nodes((sid, l), column):
+        vl |= table.encode(_to_exprs(v))
+    for v in idg.find_nodes((sid, r), column):
+        vr |= table.encode(_to_exprs(v))
+
+    vl |= 1 << table.id(ConstPosExpr(idx=l))
+    vr |= 1 << table.id(ConstPosExpr(idx=r))
 
     return SubStringExpr(
                 substr=vk,
                 left=vl,
-                right=vr
+                right=vr,
+                table=table,
+                column=column
             )
@@ -0,0 +1,95 @@
+""" Single pass matching of the base tokens """
+# language/tokenizer.py
+import re
+from .base_tokens import BaseTokens
+
+# character classes of ASCII strings: Upper, Lower, Digit, Space, Other.
+# Whitespace is what \s matches among ASCII characters
+_CLASSES = str.maketrans({
+    chr(c): (
+        "U" if "A" <= chr(c) <= "Z" else
+        "L" if "a" <= chr(c) <= "z" else
+        "D" if "0" <= chr(c) <= "9" else
+        "S" if chr(c).isspace() else
+        "O"
+    )
+    for c in range(128)
+})
+_RUNS = re.compile(r"U+|L+|D+|S+|O+")
+
+# tokens matched by the tokenizer, in BaseTokens order
+TOKENS = [tok for tok in BaseTokens if tok not in (BaseTokens.StartT, BaseTokens.EndT)]
+
+def _chain(spans: list, space: dict) -> list:
+    """ Join spans separated by a single whitespace run, as (X)(\\s+X)* does """
+    chained = []
+    for start, end in spans:
+        if chained and space.get(chained[-1][1]) == start:
+            chained[-1] = (chained[-1][0], end)
+        else:
+            chained.append((start, end))
+    return chained
+
+def _ascii_spans(s: str) -> dict:
+    """ Token spans of an ASCII string from the runs of its character classes """
+    caps, lower, digits, space = [], [], [], {}
+    alphabets, alphanumeric, proper = [], [], []
+    prev = None
+    end = 0
+    for run in _RUNS.findall(s.translate(_CLASSES)):
+        cls = run[0]
+        start, end = end, end + len(run)
+        if cls == "U":
+            caps.append((start, end))
+        elif cls == "L":
+            lower.append((start, end))
+            # [A-Z][a-z]+ takes the last capital before a lowercase run
+            if prev == "U":
+                proper.append((start - 1, end))
+        elif cls == "D":
+            digits.append((start, end))
+        elif cls == "S":
+            space[start] = end
+        prev = cls
+
+        # letters and digits extend the run before them
+        if cls == "O" or cls == "S":
+            continue
+        if cls != "D":
+            if alphabets and alphabets[-1][1] == start:
+                alphabets[-1] = (alphabets[-1][0], end)
+            else:
+                alphabets.append((start, end))
+        if alphanumeric and alphanumeric[-1][1] == start:
+            alphanumeric[-1] = (alphanumeric[-1][0], end)
+        else:
+            alphanumeric.append((start, end))
+
+    # in BaseTokens order
+    return {
+        BaseTokens.ProperCase: proper,
+        BaseTokens.Caps: caps,
+        BaseTokens.LowerCase: lower,
+        BaseTokens.Digits: digits,
+        BaseTokens.Alphabets: alphabets,
+        BaseTokens.Alphanumeric: alphanumeric,
+        BaseTokens.Whitespace: [(start, end) for start, end in space.items()],
+        BaseTokens.ProperCaseWSpaces: _chain(proper, space),
+        BaseTokens.CapsWSpaces: _chain(caps, space),
+        BaseTokens.LowerCaseWSpaces: _chain(lower, space),
+        BaseTokens.AlphabetsWSpaces: _chain(alphabets, space),
+    }
+
+def token_spans(s: str) -> dict:
+    """ The spans of every base token in s, as finditer would give them
+
+        Returns {token: [(start, end), ...]} for every token but StartT and
+        EndT, in BaseTokens order. ASCII strings are translated into a
+        string of character classes and split into runs by one scan; every
+        token is then a run, a join of adjacent runs or a chain of them
+        across whitespace. Other strings fall back to the token regexes,
+        whose classes like \\d and \\s reach beyond ASCII
+    """
+    if s.isascii():
+        return _ascii_spans(s)
+    return {tok: [m.span() for m in tok.value.finditer(s)] for tok in TOKENS}
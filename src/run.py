@@ -3,9 +3,13 @@
 import pdb
 import os
 import sys
+import re
 import argparse
 import json
 from synthesizer import SynthDriver
+from cache import ProgramCache
+from language.compiler import compile_program
+from transform import transform_file
 
 input_data = [
     [
@@ -25,6 +29,20 @@ output_data = [
     "New Zeland"
 ]
 
+def positive_int(value: str) -> int:
+    """ argparse type of counts that must be at least 1 """
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {n}")
+    return n
+
+def non_negative_int(value: str) -> int:
+    """ argparse type of counts where 0 turns something off """
+    n = int(value)
+    if n < 0:
+        raise argparse.ArgumentTypeError(f"must be at least 0, got {n}")
+    return n
+
 def load_data(data: str) -> dict:
     """ Load I/O examples from file or command line """
     if os.path.exists(data):
@@ -40,13 +58,40 @@ def load_data(data: str) -> dict:
     data = {"input": [], "output": []}
     examples = raw_data["Examples"]
     for ex in examples:
-        data["input"] += ex["Input"]
         data["output"].append(ex["Output"])
 
-    # the idg generation process expects a 2d-list
-    data["input"] = [data["input"]]
+    # the idg generation process expects a 2d-list, one list per column
+    data["input"] = [list(column) for column in zip(*(ex["Input"] for ex in examples))]
     return data
 
+def parse_column(column: str):
+    """ A column index or key, or a comma-separated list of them """
+    columns = [int(c) if c.lstrip("-").isdigit() else c for c in column.split(",")]
+    return columns if len(columns) > 1 else columns[0]
+
+def fill_inputs(formula: str, input_cell: str) -> str:
+    """ Replace the input placeholders of a formula with cell references
+
+        <input> is the input cell and <inputN> the cell N columns to its right
+    """
+    letters = input_cell.rstrip("0123456789")
+    row = input_cell[len(letters):]
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - 64
+
+    def _cell(offset: int) -> str:
+        col = index + offset
+        name = ""
+        while col > 0:
+            col, rem = divmod(col - 1, 26)
+            name = chr(rem + 65) + name
+        return f"{name}{row}"
+
+    for column in sorted(set(re.findall(r"<input(\d+)>", formula)), key=int):
+        formula = formula.replace(f"<input{column}>", _cell(int(column)))
+    return formula.replace("<input>", input_cell)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
                         prog="run.py",
@@ -69,8 +114,122 @@ if __name__ == "__main__":
                 default="A1",
                 help="Input cell from table (default: \'A1\')"
             )
+    parser.add_argument(
+                "--cache-dir",
+                dest="cache_dir",
+                default=None,
+                help="Directory of a persistent cache of synthesized programs"
+            )
+    parser.add_argument(
+                "--stats",
+                dest="stats",
+                action="store_true",
+                help="Print per-phase timings and graph sizes"
+            )
+    parser.add_argument(
+                "--time-budget",
+                dest="time_budget",
+                type=float,
+                default=None,
+                help="Seconds synthesis may take before settling for the examples it got through"
+            )
+    parser.add_argument(
+                "--cegis",
+                dest="cegis",
+                action="store_true",
+                help="Learn from as few examples as it takes, checking the program on the rest"
+            )
+    parser.add_argument(
+                "--lazy",
+                dest="lazy",
+                action="store_true",
+                help="Intersect example DAGs lazily, only where the program search goes"
+            )
+    subparsers = parser.add_subparsers(dest="command")
+    transform = subparsers.add_parser(
+                "transform",
+                help="Transform a column of a CSV or JSONL file"
+            )
+    transform.add_argument(
+                "--examples",
+                dest="examples",
+                required=True,
+                help="Spec with the I/O examples to learn the program from"
+            )
+    transform.add_argument(
+                "--input",
+                dest="input",
+                required=True,
+                help="CSV or JSONL (.jsonl) file to transform"
+            )
+    transform.add_argument(
+                "--column",
+                dest="column",
+                required=True,
+                help="Input column: an index, or a key of JSONL objects; comma-separated for several"
+            )
+    transform.add_argument(
+                "--output",
+                dest="output",
+                required=True,
+                help="File to write the rows with their transformed value to"
+            )
+    transform.add_argument(
+                "--header",
+                dest="header",
+                action="store_true",
+                help="The CSV input starts with a header row"
+            )
+    transform.add_argument(
+                "--output-column",
+                dest="output_column",
+                default="output",
+                help="Header of the CSV output column, or JSONL key (default: 'output')"
+            )
+    transform.add_argument(
+                "--workers",
+                dest="workers",
+                type=non_negative_int,
+                default=0,
+                help="Worker processes to transform chunks in (default: 0, in process)"
+            )
+    transform.add_argument(
+                "--chunk-size",
+                dest="chunk_size",
+                type=positive_int,
+                default=10000,
+                help="Rows read, transformed and written at a time (default: 10000)"
+            )
     args = parser.parse_args()
 
+    if args.command == "transform":
+        try:
+            data = load_data(args.examples)
+            cache = ProgramCache(args.cache_dir) if args.cache_dir else None
+            synth = SynthDriver(stats=args.stats, time_budget=args.time_budget, cegis=args.cegis, lazy=args.lazy)
+            program = synth.synthesize_program(data["input"], data["output"], cache)
+            column = parse_column(args.column)
+            rows = transform_file(
+                        compile_program(program, len(data["input"])),
+                        args.input,
+                        args.output,
+                        column,
+                        header=args.header,
+                        output_column=args.output_column,
+                        workers=args.workers,
+                        chunk_size=args.chunk_size
+                    )
+            print(f"transformed {rows} rows into {args.output}")
+            if synth.uncovered:
+                print(f"warning: out of time, examples {synth.uncovered} were not used")
+            if args.stats:
+                print(synth.stats)
+
+        except Exception as e:
+            print(f"error: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
     if args.data:
         try:
             data = load_data(args.data)
@@ -84,13 +243,15 @@ if __name__ == "__main__":
         print("Running hard-coded example")
 
     try:
-        synth = SynthDriver()
-        IDG = synth.gen_input_data_graph(input_data)
-        DAG = synth.gen_dag(input_data, output_data, IDG)
-
-        formula = synth.extract_formula(DAG)
-        formula = formula.replace("<input>", args.input_cell)
+        cache = ProgramCache(args.cache_dir) if args.cache_dir else None
+        synth = SynthDriver(stats=args.stats, time_budget=args.time_budget, cegis=args.cegis, lazy=args.lazy)
+        formula = synth.synthesize(input_data, output_data, cache)
+        formula = fill_inputs(formula, args.input_cell)
         print(formula)
+        if synth.uncovered:
+            print(f"warning: out of time, examples {synth.uncovered} were not used")
+        if args.stats:
+            print(synth.stats)
 
     except Exception as e:
         print(f"error: {e}")
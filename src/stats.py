@@ -0,0 +1,84 @@
+""" Instrumentation for the synthesis pipeline """
+# src/stats.py
+import time
+from contextlib import nullcontext
+
+# pipeline phases, in the order they run
+PHASES = [
+    "gen_graph_str",
+    "IDG.intersect",
+    "DAG.learn",
+    "DAG.intersect",
+    "rank",
+    "extract_formula"
+]
+
+class _Phase:
+    """ Context manager timing one call of a phase """
+    def __init__(self, stats: 'SynthStats', name: str):
+        self._stats = stats
+        self._name = name
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        phase = self._stats.phases[self._name]
+        phase["time"] += time.perf_counter() - self._start
+        phase["calls"] += 1
+
+class SynthStats:
+    """ Per-phase wall time, call counts and graph sizes of a synthesis
+
+        phases: {phase: {"time": seconds, "calls": n}}
+        steps: graph sizes after each step, [{"step": phase, ...}, ...]
+        info: anything else a phase wants to report, e.g. example order
+    """
+    def __init__(self):
+        self.phases = {name: {"time": 0.0, "calls": 0} for name in PHASES}
+        self.steps = []
+        self.info = {}
+
+    def __repr__(self):
+        lines = ["phase              calls     time (s)"]
+        for name, phase in self.phases.items():
+            lines.append(f"{name:<18} {phase['calls']:>5} {phase['time']:>12.6f}")
+
+        for size in (self.last("IDG"), self.last("DAG")):
+            if size:
+                lines.append(", ".join(f"{k}={v}" for k, v in size.items()))
+
+        for key, value in self.info.items():
+            lines.append(f"{key}: {value}")
+        return "\n".join(lines)
+
+    def phase(self, name: str) -> _Phase:
+        """ Time one call of a phase: `with stats.phase(name): ...` """
+        if name not in self.phases:
+            self.phases[name] = {"time": 0.0, "calls": 0}
+        return _Phase(self, name)
+
+    def record(self, step: str, **sizes):
+        """ Record graph sizes after a step """
+        self.steps.append(dict(step=step, **sizes))
+
+    def last(self, prefix: str) -> dict:
+        """ Latest recorded sizes whose keys start with prefix """
+        for step in reversed(self.steps):
+            sizes = {k: v for k, v in step.items() if k.startswith(prefix)}
+            if sizes:
+                return sizes
+        return {}
+
+    def to_dict(self) -> dict:
+        """ Structured, JSON-compatible form of the stats """
+        return {
+            "phases": self.phases,
+            "steps": self.steps,
+            "info": self.info
+        }
+
+# shared no-op stand-in for a phase when instrumentation is off
+NO_PHASE = nullcontext()
@@ -2,9 +2,14 @@
 # src/synthesizer.py
 import pdb
 from graphs.input_data_graph import InputDataGraph as IDG
-from graphs.dag import DAG
-from language.expressions import StringExpr
+from graphs.dag import DAG, LazyDAG
+from graphs.graph_cache import GraphCache
+from language.expressions import StringExpr, PositionTable
+from language.compiler import CompiledProgram
 from language.base_tokens import BaseTokens
+from stats import SynthStats, NO_PHASE
+from budget import Budget, BudgetExceeded
+from itertools import islice
 import time
 
 class SynthDriver:
@@ -13,11 +18,50 @@ class SynthDriver:
         Note: The definition of this class is not complete and will include
         additional logic as we complete the project
     """
-    def __init__(self):
+    def __init__(
+        self,
+        stats: bool = False,
+        graph_cache: GraphCache = None,
+        time_budget: float = None,
+        memory_budget: int = None,
+        order_examples: bool = True,
+        cegis: bool = False,
+        lazy: bool = False
+    ):
         # string to unique id mechanism
         self._s_id = {}
         self._counter = 0
 
+        # position expression ids shared by every DAG of this synthesis
+        self.positions = PositionTable()
+
+        # single-string IDGs by content, shared across syntheses by default
+        self.graph_cache = GraphCache.default if graph_cache is None else graph_cache
+        # the cache's counters when this driver started, stats are its own
+        self._graph_cache_base = self.graph_cache.counters()
+
+        # per-phase timings and graph sizes, None when instrumentation is off
+        self.stats = SynthStats() if stats else None
+
+        # seconds and bytes each synthesis may spend, None for no limit. A
+        # synthesis that runs out returns the best program for the examples
+        # it got through and lists the indices of the others in uncovered
+        self.time_budget = time_budget
+        self.memory_budget = memory_budget
+        self.budget = None
+        self.uncovered = []
+        # False when the budget ran out while extracting the last program
+        self.extracted_best = True
+
+        # intersect the example DAGs smallest first rather than in row order
+        self.order_examples = order_examples
+
+        # learn from as few examples as it takes, see gen_dag_cegis
+        self.cegis = cegis
+
+        # intersect example DAGs into LazyDAGs, expanded as paths need them
+        self.lazy = lazy
+
     def string_to_id(self, s: str) -> int:
         """ Retrieve a unique ID for the string """
         if s not in self._s_id:
@@ -28,38 +72,85 @@ class SynthDriver:
         return self._s_id[s]
 
     # private
+    def _phase(self, name: str):
+        """ Time a phase of the pipeline when instrumentation is on """
+        if self.stats is None:
+            return NO_PHASE
+        return self.stats.phase(name)
+
+    def _record_idg(self, step: str, idg: IDG):
+        """ Record the size of an IDG after a step """
+        if self.stats is not None:
+            self.stats.record(step, IDGNodes=len(idg.nodes), IDGEdges=idg.num_edges)
+
+    def _record_dag(self, step: str, dag: DAG):
+        """ Record the size of a DAG after a step
+
+            Sizing a LazyDAG would expand all of it, so only the number of
+            node pairs expanded so far is recorded
+        """
+        if self.stats is not None and isinstance(dag, LazyDAG):
+            self.stats.record(step, DAGExpanded=dag.num_expanded)
+        elif self.stats is not None:
+            self.stats.record(
+                step,
+                DAGNodes=len(dag.nodes),
+                DAGEdges=dag.num_edges,
+                DAGExprs=dag.num_exprs
+            )
+
+    def _gen_graph_str(self, s: str) -> IDG:
+        """ Generate the IDG of a single string """
+        with self._phase("gen_graph_str"):
+            graph = self.graph_cache.graph(s, self.string_to_id(s))
+        self._record_idg("gen_graph_str", graph)
+        if self.stats is not None:
+            self.stats.info["graph_cache"] = self.graph_cache.counters(self._graph_cache_base)
+        return graph
+
+    def _intersect_idg(self, graph_1: IDG, graph_2: IDG) -> IDG:
+        """ Intersect two IDGs """
+        with self._phase("IDG.intersect"):
+            graph = IDG.intersect(graph_1, graph_2, self.budget)
+        self._record_idg("IDG.intersect", graph)
+        return graph
+
     def _gen_graph_column(self, data: list) -> IDG:
         """ Generate the input data graph for a spreadsheet column """
-        graph = IDG.gen_graph_str(data[0], self.string_to_id(data[0]))
+        graph = self._gen_graph_str(data[0])
         for i in range(1, len(data)):
-            graph = IDG.intersect(
-                graph,
-                IDG.gen_graph_str(
-                    data[i],
-                    self.string_to_id(data[i])
-                )
-            )
+            try:
+                graph = self._intersect_idg(graph, self._gen_graph_str(data[i]))
+            except BudgetExceeded:
+                # the rows intersected so far still make a valid, if less
+                # general, IDG; the first rows are the examples
+                break
         return graph
 
-    def _get_topological_sort(self, dag, start) -> list:
-        """ Helper to sort dag nodes topologically """
-        def _rec_topo_sort(v, visited, stack):
-            visited[v] = True
-            if v in dag.mapping:
-                for node in dag.mapping[v]:
-                    if not visited[node]:
-                        _rec_topo_sort(node, visited, stack)
-            stack.append(v)
+    def _learn(self, row: tuple, out: str, idg: IDG) -> DAG:
+        """ Learn the DAG of a single input/output example
 
-        visited = {node: False for node in dag.nodes}
-        stack = []
-
-        for node in dag.nodes:
-            if not visited[node]:
-                _rec_topo_sort(start, visited, stack)
+            row holds the input strings of the example, one per column
+        """
+        dag = DAG(
+                num_nodes=len(out),
+                string_to_id=self.string_to_id,
+                positions=self.positions
+            )
+        with self._phase("DAG.learn"):
+            dag.learn(list(row), out, idg)
+        self._record_dag("DAG.learn", dag)
+        return dag
 
-        stack.reverse()
-        return stack
+    def _intersect_dag(self, dag_1: DAG, dag_2: DAG) -> DAG:
+        """ Intersect two DAGs """
+        with self._phase("DAG.intersect"):
+            if self.lazy:
+                dag = LazyDAG(dag_1, dag_2, self.budget)
+            else:
+                dag = DAG.intersect(dag_1, dag_2, self.budget)
+        self._record_dag("DAG.intersect", dag)
+        return dag
 
     # public
     def gen_input_data_graph(self, data: list[list]) -> IDG:
@@ -70,64 +161,364 @@ class SynthDriver:
 
         return IDG.union(column_graphs)
 
+    @property
+    def mode(self) -> dict:
+        """ Settings that change which program a spec synthesizes to """
+        return {"order_examples": self.order_examples, "cegis": self.cegis, "lazy": self.lazy}
+
+    def start_session(self, inp_data: list = None) -> 'SynthSession':
+        """ Start an incremental synthesis session over a column """
+        return SynthSession(self, inp_data)
+
     def gen_dag(self, inp_data: list, output_data: list, idg: IDG) -> DAG:
-        """ Generate a DAG from a row of input/output example and IDG """
-        examples = list(zip(inp_data[0], output_data))
-        dag = DAG(
-                num_nodes=len(examples[0][1]),
-                string_to_id=self.string_to_id
-            )
+        """ Generate a DAG from a row of input/output example and IDG
+
+            inp_data is a list of input columns; the first len(output_data)
+            rows across the columns are the inputs of the examples. The
+            examples are intersected in the order of plan_examples
+        """
+        examples = list(zip(zip(*inp_data), output_data))
+        order = self._example_order(inp_data, output_data, idg)
+
+        inp, out = examples[order[0]]
+        dag = self._learn(inp, out, idg)
+
+        self.uncovered = []
+        for i in range(1, len(order)):
+            try:
+                if self.budget is not None:
+                    self.budget.check()
+                inp, out = examples[order[i]]
+                dag_p = self._learn(inp, out, idg)
+                dag_i = self._intersect_dag(dag_p, dag)
+                # a LazyDAG does its intersecting here, looking for a path
+                empty = dag_i.empty
+            except BudgetExceeded:
+                # keep the DAG of the examples before i
+                self.uncovered = sorted(order[i:])
+                break
+
+            dag = dag_i
+            if empty:
+                # no program agrees with every example seen so far
+                break
+
+        if self.stats is not None and self.budget is not None:
+            self.stats.info["uncovered"] = self.uncovered
+
+        with self._phase("rank"):
+            dag.rank()
+        return dag
+
+    def gen_dag_cegis(self, inp_data: list, output_data: list, idg: IDG, seed: int = 1) -> DAG:
+        """ Generate a DAG from as few of the examples as it takes
+
+            Counterexample guided: the DAG starts from the first seed
+            examples of the plan_examples order. Its best program is
+            compiled and run on the other examples, and only the first one
+            it gets wrong is learned and intersected in, until the program
+            is right on every example. The program found is consistent with
+            all of them, though it may rank differently from the one the
+            DAG of every example would give
+        """
+        examples = list(zip(zip(*inp_data), output_data))
+        order = self._example_order(inp_data, output_data, idg)
+
+        inp, out = examples[order[0]]
+        dag = self._learn(inp, out, idg)
+        used = [order[0]]
+        queue = order[1:seed]
+
+        self.uncovered = []
+        while not dag.empty:
+            if not queue:
+                with self._phase("rank"):
+                    dag.rank()
+                program = self.extract_program(dag)
+                with self._phase("validate"):
+                    failing = self._first_failing(program, examples, order, used)
+                if failing is None:
+                    break
+                queue = [failing]
+
+            i = queue.pop(0)
+            try:
+                if self.budget is not None:
+                    self.budget.check()
+                inp, out = examples[i]
+                dag_p = self._learn(inp, out, idg)
+                dag_i = self._intersect_dag(dag_p, dag)
+                # a LazyDAG does its intersecting here, looking for a path
+                dag_i.empty
+            except BudgetExceeded:
+                # keep the DAG of the examples used so far
+                self.uncovered = sorted(set(order) - set(used))
+                break
 
-        inp, out = examples[0]
-        dag.learn([inp], out, idg)
+            dag = dag_i
+            used.append(i)
 
-        for i in range(1, len(examples)):
-            dag_p = DAG(
-                        num_nodes=len(examples[i][1]),
-                        string_to_id=self.string_to_id
-                    )
-            inp, out = examples[i]
-            dag_p.learn([inp], out, idg)
-            dag = DAG.intersect(dag_p, dag)
+        if self.stats is not None:
+            self.stats.info["cegis_examples"] = used
+            if self.budget is not None:
+                self.stats.info["uncovered"] = self.uncovered
 
-        dag.rank()
+        with self._phase("rank"):
+            dag.rank()
         return dag
 
+    def _first_failing(self, program: StringExpr, examples: list, order: list, used: list):
+        """ Index of the first example in order, and not used, that program gets wrong """
+        compiled = CompiledProgram(program)
+        skip = set(used)
+        for i in order:
+            if i in skip:
+                continue
+            row, out = examples[i]
+            if compiled(row[0] if compiled.num_columns == 1 else row) != out:
+                return i
+        return None
+
+    def _example_order(self, inp_data: list, output_data: list, idg: IDG) -> list[int]:
+        """ The order examples are learned in, recorded in the stats
+
+            Rows whose output is None are not examples and are left out
+        """
+        if self.order_examples:
+            order = self.plan_examples(inp_data, output_data, idg)
+        else:
+            order = [i for i, out in enumerate(output_data) if out is not None]
+        if not order:
+            raise ValueError("the spec has no example with an output")
+        if self.stats is not None:
+            self.stats.info["example_order"] = order
+        return order
+
+    def plan_examples(self, inp_data: list, output_data: list, idg: IDG) -> list[int]:
+        """ Indices of the examples in the order their DAGs are intersected
+
+            Every product of DAG.intersect is bounded by the product of its
+            operands, so the examples whose DAGs are estimated smallest go
+            first. An example with an output of n characters has n(n+1)/2
+            constant expressions, plus a SubStr for every output substring
+            found in its inputs, with about density**2 pairs of positions,
+            where density is the mean out-degree of the IDG. Ties keep row
+            order. Rows whose output is None are not examples and are left
+            out
+        """
+        density = idg.num_edges / max(1, len(idg.nodes))
+
+        def estimate(row: tuple, out: str) -> float:
+            matched = 0
+            for i in range(len(out)):
+                for j in range(i + 1, len(out) + 1):
+                    # a longer substring cannot occur where a shorter one does not
+                    if not any(out[i:j] in vk for vk in row):
+                        break
+                    matched += 1
+            return len(out) * (len(out) + 1) / 2 + matched * density ** 2
+
+        sizes = {
+            i: estimate(row, out)
+            for i, (row, out) in enumerate(zip(zip(*inp_data), output_data))
+            if out is not None
+        }
+        return sorted(sizes, key=lambda i: sizes[i])
+
+    def synthesize(self, inp_data: list, output_data: list, cache=None) -> str:
+        """ Run the whole pipeline on a spec, returning the formula
+
+            With a ProgramCache, a spec that was synthesized before is
+            answered from the cache without building any graph. With a
+            budget, check uncovered afterwards for the examples the formula
+            was not synthesized from
+        """
+        formula, _ = self._synthesize(inp_data, output_data, cache)
+        return formula
+
+    def synthesize_program(self, inp_data: list, output_data: list, cache=None) -> StringExpr:
+        """ Run the whole pipeline on a spec, returning the program """
+        _, program = self._synthesize(inp_data, output_data, cache)
+        return program
+
+    def _synthesize(self, inp_data: list, output_data: list, cache=None) -> tuple:
+        """ (formula, program) of a spec, from the cache when possible """
+        self.uncovered = []
+        if cache is not None:
+            hit = cache.get(inp_data, output_data, self.positions, self.mode)
+            if hit is not None:
+                return hit
+
+        self.budget = None
+        if self.time_budget is not None or self.memory_budget is not None:
+            self.budget = Budget(self.time_budget, self.memory_budget)
+
+        dag = None
+        try:
+            idg = self.gen_input_data_graph(inp_data)
+            if self.cegis:
+                dag = self.gen_dag_cegis(inp_data, output_data, idg)
+            else:
+                dag = self.gen_dag(inp_data, output_data, idg)
+            program = self.extract_program(dag)
+        finally:
+            self.budget = None
+            if isinstance(dag, LazyDAG):
+                # anything later asked of the DAG runs outside the budget
+                dag.detach_budget()
+        formula = program.to_formula()
+
+        # only the best programs consistent with every example are worth keeping
+        if cache is not None and not self.uncovered and self.extracted_best:
+            cache.put(inp_data, output_data, formula, program, self.mode)
+        return formula, program
+
     def extract_formula(self, dag: DAG) -> str:
         """ Given a DAG of expressions, extract LibreOffice Formulaes """
-        start = dag.start_node
-        final = dag.final_node
+        return self.extract_program(dag).to_formula()
+
+    def extract_program(self, dag: DAG) -> StringExpr:
+        """ Given a DAG of expressions, extract the best program
+
+            A LazyDAG expands node pairs during the search, under the
+            budget it was built with. If that runs out, the program is the
+            one along the path that showed the DAG is not empty: consistent
+            with the same examples, though not the best ranked
+        """
+        with self._phase("extract_formula"):
+            self.extracted_best = True
+            try:
+                program = next(self.extract_programs(dag, 1), None)
+            except BudgetExceeded:
+                program = StringExpr(dag.witness())
+                self.extracted_best = False
+                if self.stats is not None:
+                    self.stats.info["extraction"] = "witness"
+
+        if program is None:
+            raise RuntimeError("no consistent program for the given examples")
+        return program
 
-        distances = {node: {"rank":0, "parent": None} for node in dag.nodes}
-        topo_sort = self._get_topological_sort(dag, start)
-        for n1 in topo_sort:
-            if n1 not in dag.mapping:
+    def extract_programs(self, dag: DAG, k: int):
+        """ Lazily yield the k best programs of a DAG, best first
+
+            Each program picks one expression per edge along a path from
+            the start to the final node, and is ranked by the summed
+            weights of those expressions
+        """
+        for path in islice(dag.best_paths(), k):
+            yield StringExpr(path)
+
+class SynthSession:
+    """ Incremental synthesis over one spreadsheet column
+
+        Keeps the IDG of the input rows seen so far and the running
+        intersection of the example DAGs, so adding a row or an example
+        only does the work for that row or example. Every add_example
+        pushes the previous DAG, so remove_last_example is a pop.
+
+        The DAGs are learned against the current IDG. Adding input rows
+        shrinks the IDG, which leaves the running DAG with positions the
+        new rows do not share. An example on a new input row is learned
+        against the new IDG, and intersecting it into the running DAG
+        drops those positions, so the DAG is brought up to date without
+        re-learning. Rows added on their own mark the DAG as stale, and the
+        examples are re-learned against the new IDG when it is next needed
+    """
+    def __init__(self, driver: SynthDriver, inp_data: list = None):
+        self._driver = driver
+        self._idg = None
+        self._rows = set()
+        # bumped whenever the IDG changes
+        self._generation = 0
+
+        # (input, output) examples and the (IDG generation, DAG) after each
+        self._examples = []
+        self._snapshots = []
+
+        if inp_data:
+            self.add_input_rows(inp_data)
+
+    @property
+    def idg(self) -> IDG:
+        """ IDG over every input row added so far """
+        return self._idg
+
+    @property
+    def examples(self) -> list:
+        """ (input, output) examples added so far """
+        return list(self._examples)
+
+    @property
+    def dag(self) -> DAG:
+        """ Intersection of the DAGs of every example, None without examples """
+        if len(self._snapshots) != len(self._examples) or \
+                (self._snapshots and self._snapshots[-1][0] != self._generation):
+            self._relearn()
+
+        if not self._snapshots:
+            return None
+        return self._snapshots[-1][1]
+
+    def _relearn(self):
+        """ Rebuild the DAG snapshots against the current IDG """
+        self._snapshots = []
+        for inp, out in self._examples:
+            self._push(inp, out)
+
+    def _push(self, inp: str, out: str):
+        """ Learn an example and intersect it into the running DAG """
+        dag = self._driver._learn((inp,), out, self._idg)
+        if self._snapshots:
+            dag = self._driver._intersect_dag(dag, self._snapshots[-1][1])
+        self._snapshots.append((self._generation, dag))
+
+    def add_input_rows(self, rows: list[str]):
+        """ Intersect new input strings into the IDG """
+        changed = False
+        for row in rows:
+            if row in self._rows:
+                # a string intersected with itself gives the same graph
                 continue
 
-            for n2 in dag.mapping[n1]:
-                new_dist = distances[n1]["rank"] + dag.ranks[n1][n2]
-                if distances[n2]["rank"] < new_dist:
-                    distances[n2]["rank"] = new_dist
-                    distances[n2]["parent"] = n1
+            self._rows.add(row)
+            graph = self._driver._gen_graph_str(row)
+            self._idg = graph if self._idg is None else self._driver._intersect_idg(self._idg, graph)
+            changed = True
+
+        if changed:
+            self._generation += 1
 
-        path = []
+    def add_example(self, inp: str, out: str) -> DAG:
+        """ Learn one more example and intersect it into the running DAG
 
-        # simple case
-        if final in dag.mapping[start]:
-            for expr in dag.mapping[start][final]:
-                path.append(expr)
-        # do Djikstra's
+            An unseen input is added to the IDG first; the running DAG is
+            intersected with the example's DAG rather than re-learned
+        """
+        # bring the snapshots up to date before extending them
+        dag = self.dag
+        if inp not in self._rows:
+            self.add_input_rows([inp])
+
+        self._examples.append((inp, out))
+        if dag is None or not dag.empty:
+            self._push(inp, out)
         else:
-            node = final
-            while node != start:
-                next_node = distances[node]["parent"]
-                for expr in dag.mapping[next_node][node]:
-                    path.append(expr)
-
-                node = next_node
-
-        # Then create a StringExpr and convert to formula
-        path.reverse()
-        #print(path)
-        expr = StringExpr(path)
-        return expr.to_formula()
+            # nothing can be consistent with the new example either
+            self._snapshots.append((self._generation, dag))
+        return self._snapshots[-1][1]
+
+    def remove_last_example(self) -> tuple:
+        """ Drop the most recent example, returning to the previous DAG """
+        if not self._examples:
+            return None
+
+        if len(self._snapshots) == len(self._examples):
+            self._snapshots.pop()
+        return self._examples.pop()
+
+    def extract_formula(self) -> str:
+        """ Extract the formula for the examples added so far """
+        if self.dag is None:
+            raise RuntimeError("no examples have been added to the session")
+        return self._driver.extract_formula(self.dag)
@@ -0,0 +1,151 @@
+""" Stream a column of a CSV or JSONL file through a learned program """
+# src/transform.py
+import csv
+import json
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from language.compiler import CompiledProgram
+
+# the program of a worker process, set once by the pool initializer
+_worker_program = None
+
+def _init_worker(program: CompiledProgram):
+    global _worker_program
+    _worker_program = program
+
+def _worker_apply(values: list) -> list:
+    return _worker_program.apply_column(values)
+
+def is_jsonl(path: str) -> bool:
+    """ JSONL files are told apart from CSV files by their extension """
+    return path.endswith(".jsonl")
+
+def read_rows(f, jsonl: bool):
+    """ Lazily read the rows of an open CSV or JSONL file """
+    if jsonl:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.reader(f)
+
+def chunked(rows, size: int):
+    """ Group an iterable of rows into lists of at most size rows """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _field(row, column):
+    """ The value of a row's column as a string, or None when the row has
+        no such column (a blank or short CSV line, a JSONL object without
+        the key)
+    """
+    try:
+        value = row[column]
+    except (IndexError, KeyError, TypeError):
+        return None
+    return "" if value is None else str(value)
+
+def transform_chunks(program: CompiledProgram, chunks, column, workers: int = 0):
+    """ Yield (chunk, outputs) for every chunk of rows, in input order
+
+        Rows missing one of the columns are not transformed and get a None
+        output. With workers, the values of each chunk are transformed in a
+        process pool. At most two chunks per worker are in flight, so memory
+        stays bounded however long the input is
+    """
+    def values(chunk):
+        if isinstance(column, list):
+            rows = [tuple(_field(row, c) for c in column) for row in chunk]
+            return [None if None in row else row for row in rows]
+        return [_field(row, column) for row in chunk]
+
+    def present(chunk_values):
+        return [value for value in chunk_values if value is not None]
+
+    def spread(chunk_values, outputs):
+        outputs = iter(outputs)
+        return [None if value is None else next(outputs) for value in chunk_values]
+
+    if workers <= 0:
+        for chunk in chunks:
+            chunk_values = values(chunk)
+            yield chunk, spread(chunk_values, program.apply_column(present(chunk_values)))
+        return
+
+    with Pool(workers, initializer=_init_worker, initargs=(program,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            chunk_values = values(chunk)
+            result = pool.apply_async(_worker_apply, (present(chunk_values),))
+            pending.append((chunk, chunk_values, result))
+            if len(pending) >= 2 * workers:
+                chunk, chunk_values, result = pending.popleft()
+                yield chunk, spread(chunk_values, result.get())
+
+        while pending:
+            chunk, chunk_values, result = pending.popleft()
+            yield chunk, spread(chunk_values, result.get())
+
+def transform_file(
+    program: CompiledProgram,
+    input_path: str,
+    output_path: str,
+    column,
+    header: bool = False,
+    output_column: str = "output",
+    workers: int = 0,
+    chunk_size: int = 10000
+) -> int:
+    """ Transform one column of a CSV or JSONL file, returning the row count
+
+        Every output row is its input row plus the transformed value: the
+        last field of a CSV row, or the output_column key of a JSONL
+        object. A CSV column is an index; a JSONL column is a key, or an
+        index for rows that are lists. A program over several input columns
+        takes a list of them. Rows the program cannot transform, or that
+        lack the column, get an empty value. Rows are written a chunk at a
+        time
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+    columns = len(column) if isinstance(column, list) else 1
+    if columns != program.num_columns:
+        raise ValueError(f"the program reads {program.num_columns} input columns, {columns} given")
+
+    jsonl = is_jsonl(input_path)
+    count = 0
+    with open(input_path, "r", encoding="utf-8", newline="") as inp, \
+         open(output_path, "w", encoding="utf-8", newline="") as out:
+        rows = read_rows(inp, jsonl)
+        writer = None if jsonl else csv.writer(out)
+
+        if header and not jsonl:
+            first = next(rows, None)
+            if first is not None:
+                writer.writerow(first + [output_column])
+
+        chunks = chunked(rows, chunk_size)
+        for chunk, outputs in transform_chunks(program, chunks, column, workers):
+            if jsonl:
+                lines = []
+                for row, value in zip(chunk, outputs):
+                    value = "" if value is None else value
+                    if isinstance(row, dict):
+                        row[output_column] = value
+                    else:
+                        row.append(value)
+                    lines.append(json.dumps(row, ensure_ascii=False))
+                out.write("\n".join(lines) + "\n")
+            else:
+                writer.writerows(
+                    row + ["" if value is None else value]
+                    for row, value in zip(chunk, outputs)
+                )
+            count += len(chunk)
+
+    return count
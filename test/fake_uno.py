@@ -0,0 +1,139 @@
+""" Stand-in for the UNO objects of a LibreOffice Calc document """
+# test/fake_uno.py
+import time
+
+class RangeAddress:
+    def __init__(self, start_column, start_row, end_column, end_row):
+        self.StartColumn = start_column
+        self.StartRow = start_row
+        self.EndColumn = end_column
+        self.EndRow = end_row
+
+class FakeSheet:
+    """ A sheet of cell strings, counting the UNO calls made against it
+
+        Every method call or property access on the sheet, a cell or a range
+        is one round trip over the UNO socket. They are counted in calls, and
+        a latency in seconds makes each of them sleep, so the cost of an
+        access pattern can be measured without LibreOffice
+    """
+    def __init__(self, cells: dict = None, latency: float = 0, values: dict = None):
+        # {(col, row): string}, missing cells are empty
+        self.cells = dict(cells or {})
+        # {(col, row): float} of number cells whose string is formatted
+        self.values = dict(values or {})
+        # {(col, row): formula} of the cells holding a formula
+        self.formulas = {}
+        self.latency = latency
+        self.calls = 0
+
+    @staticmethod
+    def from_columns(columns: list, start_column=0, start_row=0) -> 'FakeSheet':
+        """ A sheet holding the columns of strings at a top-left corner """
+        cells = {}
+        for i, column in enumerate(columns):
+            for j, value in enumerate(column):
+                if value != "":
+                    cells[(start_column + i, start_row + j)] = value
+        return FakeSheet(cells)
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def getCellByPosition(self, col, row):
+        self._call()
+        return FakeCell(self, col, row)
+
+    def getCellRangeByPosition(self, start_column, start_row, end_column, end_row):
+        self._call()
+        return FakeCellRange(self, RangeAddress(start_column, start_row, end_column, end_row))
+
+class FakeCell:
+    def __init__(self, sheet: FakeSheet, col, row):
+        self._sheet = sheet
+        self._pos = (col, row)
+
+    @property
+    def String(self):
+        self._sheet._call()
+        return self._sheet.cells.get(self._pos, "")
+
+class FakeCellRange:
+    """ A rectangular range of a sheet """
+    def __init__(self, sheet: FakeSheet, address: RangeAddress):
+        self._sheet = sheet
+        self.RangeAddress = address
+
+    def supportsService(self, name):
+        return name == "com.sun.star.sheet.SheetCellRange"
+
+    def _positions(self):
+        a = self.RangeAddress
+        return [
+            [(col, row) for col in range(a.StartColumn, a.EndColumn + 1)]
+            for row in range(a.StartRow, a.EndRow + 1)
+        ]
+
+    def getCellByPosition(self, col, row):
+        """ A cell by its position relative to the range """
+        self._sheet._call()
+        a = self.RangeAddress
+        return FakeCell(self._sheet, a.StartColumn + col, a.StartRow + row)
+
+    def getDataArray(self):
+        """ Rows of cell values; numbers come back as floats like in Calc """
+        self._sheet._call()
+        def _value(pos):
+            if pos in self._sheet.values:
+                return self._sheet.values[pos]
+            s = self._sheet.cells.get(pos, "")
+            try:
+                return float(s)
+            except ValueError:
+                return s
+        return tuple(tuple(_value(pos) for pos in row) for row in self._positions())
+
+    def _set(self, rows, store: dict):
+        positions = self._positions()
+        if len(rows) != len(positions) or any(len(r) != len(p) for r, p in zip(rows, positions)):
+            raise ValueError("array does not match the size of the range")
+        for row, values in zip(positions, rows):
+            for pos, value in zip(row, values):
+                store[pos] = value
+
+    def setDataArray(self, rows):
+        self._sheet._call()
+        self._set(rows, self._sheet.cells)
+
+    def setFormulaArray(self, rows):
+        self._sheet._call()
+        self._set(rows, self._sheet.formulas)
+
+class FakeController:
+    def __init__(self, sheet: FakeSheet, selection):
+        self.ActiveSheet = sheet
+        self._selection = selection
+
+    def getSelection(self):
+        self.ActiveSheet._call()
+        return self._selection
+
+class FakeSheets:
+    def __init__(self, sheet: FakeSheet):
+        self._sheet = sheet
+
+    def getByIndex(self, i):
+        self._sheet._call()
+        return self._sheet
+
+class FakeDocument:
+    """ A Calc document of one sheet with a selected range """
+    def __init__(self, sheet: FakeSheet, selection: tuple):
+        """ selection: (start_column, start_row, end_column, end_row) """
+        self.sheet = sheet
+        self.Sheets = FakeSheets(sheet)
+        self.CurrentController = FakeController(
+            sheet, FakeCellRange(sheet, RangeAddress(*selection))
+        )
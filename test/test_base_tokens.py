@@ -1,5 +1,7 @@
+import random
 import unittest
 from src.language import BaseTokens
+from src.language.tokenizer import token_spans, TOKENS
 
 class TestBaseTokens(unittest.TestCase):
     def test_singleton(self):
@@ -160,3 +162,31 @@ class TestBaseTokens(unittest.TestCase):
         match = BaseTokens.AlphabetsWSpaces.value.search(string)
         self.assertEqual(match.start(), 0)
         self.assertEqual(match.end(), len(string))
+
+class TestTokenizer(unittest.TestCase):
+    def _finditer_spans(self, string):
+        return {tok: [m.span() for m in tok.value.finditer(string)] for tok in TOKENS}
+
+    def _check(self, string):
+        spans = token_spans(string)
+        self.assertEqual(list(spans), TOKENS)
+        self.assertEqual(spans, self._finditer_spans(string), repr(string))
+
+    def test_examples(self):
+        for string in [
+            "", "Testcase", "test case", "Test Case", "TEST CASE", "ABc Def",
+            "New York, USA", "a1B2 c3", "  Mr.  Hone\tMukasine\n", "x\x1cY\x1fZz",
+            "CPT-00350", "ab  CD ef Gh"
+        ]:
+            self._check(string)
+
+    def test_random_ascii(self):
+        rng = random.Random(0)
+        alphabet = "aAbBzZ09 \t\n\x1c.-,_"
+        for _ in range(2000):
+            self._check("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 16))))
+
+    def test_unicode_fallback(self):
+        # \d and \s match beyond ASCII, [A-Z] does not
+        for string in ["Café au lait", "١٢٣ abc", "a\u2003B", "ÀB Cd"]:
+            self._check(string)
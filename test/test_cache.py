@@ -0,0 +1,78 @@
+import os
+import sys
+import sqlite3
+import tempfile
+import unittest
+
+# the cache imports its packages relative to src/
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+from cache import ProgramCache
+from synthesizer import SynthDriver
+from language.expressions import StringExpr, ConstStringExpr, SubStringExpr
+
+INPUTS = [["Newark, USA", "Mumbai, India", "New York, USA"]]
+OUTPUTS = ["USA", "India"]
+
+class TestProgramCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        with ProgramCache(self.dir.name) as cache:
+            formula = SynthDriver().synthesize(INPUTS, OUTPUTS, cache)
+            self.assertEqual(len(cache), 1)
+
+            mode = SynthDriver().mode
+            cached_formula, program = cache.get(INPUTS, OUTPUTS, mode=mode)
+            self.assertEqual(cached_formula, formula)
+            self.assertEqual(program.to_formula(), formula)
+
+            # positions are loaded over the table of the synthesis asking
+            synth = SynthDriver()
+            _, program = cache.get(INPUTS, OUTPUTS, synth.positions, mode)
+            substrs = [expr for expr in program.substr_exprs if isinstance(expr, SubStringExpr)]
+            self.assertTrue(substrs)
+            self.assertTrue(all(expr.table is synth.positions for expr in substrs))
+            self.assertIsNone(cache.get(INPUTS, ["USA", "Mumbai"], mode=mode))
+
+        # entries persist across processes
+        with ProgramCache(self.dir.name) as cache:
+            self.assertEqual(SynthDriver().synthesize(INPUTS, OUTPUTS, cache), formula)
+
+    def test_keyed_by_mode(self):
+        # the same spec synthesized under other settings is a different entry
+        with ProgramCache(self.dir.name) as cache:
+            SynthDriver().synthesize(INPUTS, OUTPUTS, cache)
+            self.assertIsNone(cache.get(INPUTS, OUTPUTS, mode=SynthDriver(cegis=True).mode))
+
+            SynthDriver(cegis=True).synthesize(INPUTS, OUTPUTS, cache)
+            self.assertEqual(len(cache), 2)
+
+    def test_lru_eviction(self):
+        program = StringExpr([ConstStringExpr("x")])
+        with ProgramCache(self.dir.name, max_bytes=5000) as cache:
+            for i in range(3):
+                cache.put([[str(i)]], [str(i)], "x" * 1500, program)
+            # touch the oldest entry so the second one is evicted instead
+            cache.get([["0"]], ["0"])
+            cache.put([["3"]], ["3"], "x" * 1500, program)
+
+            self.assertLessEqual(cache.size, 5000)
+            self.assertIsNotNone(cache.get([["0"]], ["0"]))
+            self.assertIsNone(cache.get([["1"]], ["1"]))
+
+    def test_version_mismatch(self):
+        with ProgramCache(self.dir.name) as cache:
+            SynthDriver().synthesize(INPUTS, OUTPUTS, cache)
+            path = cache.path
+
+        db = sqlite3.connect(path)
+        db.execute("UPDATE meta SET value = 'stale' WHERE key = 'version'")
+        db.commit()
+        db.close()
+
+        with ProgramCache(self.dir.name) as cache:
+            self.assertEqual(len(cache), 0)
@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+
+# the synthesizer imports its packages relative to src/, so the programs it
+# extracts are expressions of the top-level language package
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+from synthesizer import SynthDriver
+from language import (
+    SubStringExpr, ConstStringExpr, PosExpr, ConstPosExpr, Direction, compile_program
+)
+from language.expressions import StringExpr
+
+class TestCompiler(unittest.TestCase):
+    def test_reproduces_examples(self):
+        inputs = ["Mumbai, India", "Los Angeles, USA", "Wellington, New Zeland"]
+        outputs = ["India", "USA", "New Zeland"]
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([inputs])
+        dag = synth.gen_dag([inputs], outputs, idg)
+
+        program = compile_program(synth.extract_program(dag))
+        self.assertEqual(program.apply_column(inputs), outputs)
+        self.assertEqual(program("Paris, France"), "France")
+
+    def test_positions(self):
+        # second word, then a literal, then the text after the last "-"
+        program = compile_program(StringExpr([
+            SubStringExpr(
+                substr="b",
+                left={PosExpr(tok="LowerCase", idx=(2, -1), direction=Direction.Start)},
+                right={PosExpr(tok="LowerCase", idx=(2, -1), direction=Direction.End)}
+            ),
+            ConstStringExpr(":"),
+            SubStringExpr(
+                substr="1",
+                left={PosExpr(tok="-", idx=(2, -1), direction=Direction.End)},
+                right={PosExpr(tok="EndT", idx=1, direction=Direction.Start)}
+            )
+        ]))
+        self.assertEqual(program.apply_column(["a b-0-1", "xy zw-9-42"]), ["b:1", "zw:42"])
+
+        # too few matches of a token
+        self.assertIsNone(program("a-0-1"))
+
+    def test_apply_column_memo(self):
+        program = compile_program(StringExpr([
+            SubStringExpr(substr="bc", left={ConstPosExpr(idx=1)}, right={ConstPosExpr(idx=2)})
+        ]))
+        calls = []
+        run = program._program
+        program._program = lambda s: calls.append(s) or run(s)
+
+        column = ["ax", "bx", "ax", "cx", "ax", "bx"]
+        for memo, evaluated in [(4096, 3), (2, 4), (0, 6)]:
+            calls.clear()
+            self.assertEqual(program.apply_column(column, memo), ["a", "b", "a", "c", "a", "b"])
+            # "ax" stays recently used, "bx" is evicted when "cx" comes in
+            self.assertEqual(len(calls), evaluated)
+
+    def test_const_positions(self):
+        program = compile_program(StringExpr([
+            SubStringExpr(substr="bc", left={ConstPosExpr(idx=2)}, right={ConstPosExpr(idx=4)})
+        ]))
+        self.assertEqual(program("abcd"), "bc")
+        self.assertIsNone(program("a"))
+
+    def test_columns(self):
+        first = ["Hone", "Aysu"]
+        last = ["Mukasine", "Polat"]
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([first, last])
+        dag = synth.gen_dag([first, last], ["Mukasine, H", "Polat, A"], idg)
+
+        program = compile_program(synth.extract_program(dag))
+        self.assertEqual(program.num_columns, 2)
+        self.assertEqual(program(("Ravi", "Shankar")), "Shankar, R")
@@ -0,0 +1,188 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# graph modules import the language package relative to src/
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+from graphs.dag import DAG, LazyDAG
+from graphs import snapshot
+from synthesizer import SynthDriver
+from budget import Budget
+
+class TestDAG(unittest.TestCase):
+    def _learn(self, synth, idg, inp, out):
+        dag = DAG(num_nodes=len(out), string_to_id=synth.string_to_id)
+        dag.learn([inp], out, idg)
+        return dag
+
+    def test_learn(self):
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([["Newark, USA"]])
+        dag = self._learn(synth, idg, "Newark, USA", "USA")
+
+        self.assertEqual(dag.start_node, 1)
+        self.assertEqual(dag.final_node, 4)
+        self.assertFalse(dag.empty)
+
+    def test_intersect(self):
+        inputs = ["Newark, USA", "Mumbai, India"]
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([inputs])
+        dag = DAG.intersect(
+            self._learn(synth, idg, inputs[0], "USA"),
+            self._learn(synth, idg, inputs[1], "India")
+        )
+
+        self.assertFalse(dag.empty)
+        self.assertEqual((dag.start_node, dag.final_node), (0, 1))
+        self.assertIn(dag.final_node, dag.mapping[dag.start_node])
+
+        # every surviving node lies on a path to the final node
+        for node in dag.mapping:
+            self.assertTrue(dag.mapping[node])
+
+    def test_intersect_many(self):
+        # nodes stay flat however many examples are intersected
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([["Newark, USA"]])
+        example = self._learn(synth, idg, "Newark, USA", "USA")
+        dag = example
+        for _ in range(sys.getrecursionlimit() + 100):
+            dag = DAG.intersect(dag, example)
+
+        self.assertTrue(all(isinstance(node, int) for node in dag.nodes))
+        self.assertEqual(synth.extract_formula(dag), synth.extract_formula(example))
+
+    def test_intersect_empty(self):
+        inputs = ["Newark, USA", "Mumbai, India"]
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([inputs])
+        dag = DAG.intersect(
+            self._learn(synth, idg, inputs[0], "A"),
+            self._learn(synth, idg, inputs[1], "Mu")
+        )
+
+        self.assertTrue(dag.empty)
+        with self.assertRaises(RuntimeError):
+            synth.extract_formula(dag)
+
+class TestLazyDAG(unittest.TestCase):
+    INPUTS = ["Mumbai, India", "Los Angeles, USA", "Newark, USA", "New York, USA"]
+    OUTPUTS = ["India", "USA", "USA", "USA"]
+
+    def _dags(self):
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([self.INPUTS])
+        return synth, [
+            TestDAG._learn(None, synth, idg, inp, out)
+            for inp, out in zip(self.INPUTS, self.OUTPUTS)
+        ]
+
+    def test_chain_matches_intersect(self):
+        synth, dags = self._dags()
+        eager, lazy = dags[0], dags[0]
+        for dag in dags[1:]:
+            eager = DAG.intersect(eager, dag)
+            lazy = LazyDAG(lazy, dag)
+
+        self.assertFalse(lazy.empty)
+        self.assertEqual(synth.extract_formula(lazy), synth.extract_formula(eager))
+
+        full = lazy.materialize()
+        self.assertEqual(
+            {n: {m: len(e) for m, e in full.mapping[n].items()} for n in full.mapping},
+            {n: {m: len(e) for m, e in eager.mapping[n].items()} for n in eager.mapping}
+        )
+        self.assertEqual(lazy.num_edges, eager.num_edges)
+
+    def test_driver(self):
+        self.assertEqual(
+            SynthDriver(lazy=True).synthesize([self.INPUTS], self.OUTPUTS),
+            SynthDriver().synthesize([self.INPUTS], self.OUTPUTS)
+        )
+
+    def test_expands_on_demand(self):
+        synth, dags = self._dags()
+        lazy = LazyDAG(dags[1], dags[2])
+        self.assertEqual(lazy.num_expanded, 0)
+
+        # finding a path expands part of the product, materializing all of it
+        self.assertFalse(lazy.empty)
+        expanded = lazy.num_expanded
+        lazy.materialize()
+        self.assertLess(expanded, lazy.num_expanded)
+
+    def test_best_first(self):
+        synth, dags = self._dags()
+        lazy = LazyDAG(dags[1], dags[2])
+        formula = synth.extract_formula(lazy)
+        expanded = lazy.num_expanded
+
+        # the best path is found without expanding the whole product
+        full = lazy.materialize()
+        self.assertLess(expanded, lazy.num_expanded)
+        self.assertEqual(formula, synth.extract_formula(full))
+
+    def test_budget_witness(self):
+        synth = SynthDriver()
+        inputs = ["Mumbai, India", "Newark, USA"]
+        idg = synth.gen_input_data_graph([inputs])
+        budget = Budget()
+        lazy = LazyDAG(
+            TestDAG._learn(None, synth, idg, inputs[0], "India (Mumbai)"),
+            TestDAG._learn(None, synth, idg, inputs[1], "USA (Newark)"),
+            budget
+        )
+        self.assertFalse(lazy.empty)
+
+        # once the budget runs out, the path that proved the DAG not empty is kept
+        budget._exceeded = True
+        program = synth.extract_program(lazy)
+        self.assertEqual(program.substr_exprs, lazy.witness())
+        self.assertFalse(synth.extracted_best)
+
+    def test_empty(self):
+        synth = SynthDriver()
+        inputs = ["Newark, USA", "Mumbai, India"]
+        idg = synth.gen_input_data_graph([inputs])
+        lazy = LazyDAG(
+            TestDAG._learn(None, synth, idg, inputs[0], "A"),
+            TestDAG._learn(None, synth, idg, inputs[1], "Mu")
+        )
+
+        self.assertTrue(lazy.empty)
+        with self.assertRaises(RuntimeError):
+            synth.extract_formula(lazy)
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_round_trip(self):
+        synth, dags = TestLazyDAG._dags(TestLazyDAG())
+        dag = DAG.intersect(dags[0], dags[1])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "dag.snap")
+            snapshot.dump(dag, path)
+            for loaded in [
+                snapshot.loads(snapshot.dumps(dag), synth.string_to_id, dag.positions),
+                snapshot.load(path, synth.string_to_id, dag.positions)
+            ]:
+                self.assertEqual((loaded.start_node, loaded.final_node), (dag.start_node, dag.final_node))
+                self.assertEqual(loaded.edges, dag.edges)
+                self.assertEqual(
+                    {n: dict(loaded.mapping[n]) for n in loaded.mapping},
+                    {n: dict(dag.mapping[n]) for n in dag.mapping}
+                )
+                self.assertEqual(synth.extract_formula(loaded), synth.extract_formula(dag))
+
+                # and keeps intersecting with the DAGs of the same synthesis
+                self.assertEqual(
+                    synth.extract_formula(DAG.intersect(loaded, dags[2])),
+                    synth.extract_formula(DAG.intersect(dag, dags[2]))
+                )
+
+    def test_lazy(self):
+        synth, dags = TestLazyDAG._dags(TestLazyDAG())
+        lazy = LazyDAG(dags[0], dags[1])
+        loaded = snapshot.loads(snapshot.dumps(lazy), synth.string_to_id, lazy.positions)
+        self.assertEqual(synth.extract_formula(loaded), synth.extract_formula(lazy))
@@ -0,0 +1,81 @@
+import unittest
+from src.language import SubStringExpr, ConstStringExpr, PosExpr, ConstPosExpr, Direction, PositionTable
+
+class TestExpressions(unittest.TestCase):
+    def test_hash_consing(self):
+        pos1 = PosExpr(tok="Caps", idx=(1, -1), direction=Direction.Start)
+        pos2 = PosExpr(tok="Caps", idx=(1, -1), direction=Direction.Start)
+        self.assertIs(pos1, pos2)
+        self.assertIs(ConstPosExpr(idx=3), ConstPosExpr(idx=3))
+        self.assertIs(ConstStringExpr("USA"), ConstStringExpr("USA"))
+        self.assertIsNot(
+            pos1,
+            PosExpr(tok="Caps", idx=(1, -1), direction=Direction.End)
+        )
+
+    def test_substring_dedup(self):
+        left = {PosExpr(tok="Caps", idx=(1, -1), direction=Direction.Start)}
+        right = {ConstPosExpr(idx=4)}
+        sub1 = SubStringExpr(substr="USA", left=left, right=right)
+        sub2 = SubStringExpr(substr="USA", left=set(left), right=set(right))
+
+        self.assertIs(sub1, sub2)
+        self.assertEqual(len({sub1, sub2}), 1)
+
+        inter = SubStringExpr.intersect(sub1, sub2)
+        self.assertIs(inter, sub1)
+
+        # v weighs the expression, so it is part of its identity
+        sub3 = SubStringExpr(substr="USA, x", left=left, right=right)
+        self.assertIsNot(sub1, sub3)
+        self.assertEqual(len({sub1, sub3}), 2)
+
+    def test_position_table(self):
+        table = PositionTable()
+        caps = PosExpr(tok="Caps", idx=(1, -1), direction=Direction.Start)
+        digits = PosExpr(tok="Digits", idx=(2, -1), direction=Direction.End)
+
+        mask = table.encode({caps, digits})
+        self.assertEqual(mask, 0b11)
+        self.assertEqual(table.decode(mask), {caps, digits})
+        self.assertEqual(table.encode({digits}), 1 << table.id(digits))
+
+        sub1 = SubStringExpr("a", {caps, digits}, {ConstPosExpr(idx=2)}, table)
+        sub2 = SubStringExpr("ab", {digits}, {ConstPosExpr(idx=2)}, table)
+        inter = SubStringExpr.intersect(sub1, sub2)
+        self.assertEqual(inter.pl, {digits})
+        self.assertEqual(inter.v, "ab")
+
+        sub3 = SubStringExpr("a", {caps}, {ConstPosExpr(idx=3)}, table)
+        self.assertIsNone(SubStringExpr.intersect(sub1, sub3))
+
+    def test_tables(self):
+        caps = PosExpr(tok="Caps", idx=(1, -1), direction=Direction.Start)
+        ends = {ConstPosExpr(idx=3)}
+        sub1 = SubStringExpr("ab", {caps}, ends, PositionTable())
+        sub2 = SubStringExpr("ab", {caps}, ends, PositionTable())
+
+        # equal expressions hash alike, so two tables keep them apart
+        self.assertNotEqual(sub1, sub2)
+        self.assertEqual(len({sub1, sub2}), 2)
+
+        # and intersecting moves them onto one table
+        inter = SubStringExpr.intersect(sub1, sub2)
+        self.assertIs(inter, sub1)
+        self.assertEqual((inter.pl, inter.pr), ({caps}, ends))
+
+    def test_shared_table_bounded(self):
+        limit = PositionTable.DEFAULT_LIMIT
+        PositionTable.DEFAULT_LIMIT = 2
+        try:
+            PositionTable.default = None
+            first = SubStringExpr("a", {ConstPosExpr(idx=1)}, {ConstPosExpr(idx=2)})
+            self.assertIs(first.table, PositionTable.default)
+
+            # a full default table is left to the expressions built over it
+            second = SubStringExpr("a", {ConstPosExpr(idx=3)}, {ConstPosExpr(idx=4)})
+            self.assertIsNot(second.table, first.table)
+            self.assertEqual(len(first.table), 2)
+            self.assertEqual(first.pl, {ConstPosExpr(idx=1)})
+        finally:
+            PositionTable.DEFAULT_LIMIT = limit
@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+
+# the extension imports its packages relative to src/, the fake UNO
+# objects live next to the tests
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.append(os.path.dirname(__file__))
+from fake_uno import FakeSheet, FakeDocument
+from extension import CalcHandler
+
+INPUTS = ["Mumbai, India", "Los Angeles, USA", "Newark, USA", "Zip 66045"]
+OUTPUTS = ["India", "USA", "", "66045"]
+
+class TestCalcHandler(unittest.TestCase):
+    def _handler(self, sheet, selection):
+        return CalcHandler(document=FakeDocument(sheet, selection))
+
+    def test_read_selected_data(self):
+        sheet = FakeSheet.from_columns([INPUTS, OUTPUTS], start_row=1)
+        handler = self._handler(sheet, (0, 1, 1, len(INPUTS)))
+
+        self.assertEqual(handler.read_selected_data(), [INPUTS, OUTPUTS])
+        self.assertEqual(handler.incomplete_cells, [{"Input": (0, 4), "Output": (1, 4)}])
+
+        # the selection and its data, then the string of the one number cell
+        self.assertEqual(sheet.calls, 4)
+
+    def test_read_numbers(self):
+        sheet = FakeSheet.from_columns([["7", "2.5", "", "x"]])
+        handler = self._handler(sheet, (0, 0, 0, 3))
+        self.assertEqual(handler.read_selected_data(), [["7", "2.5", "", "x"]])
+
+    def test_read_formatted_numbers(self):
+        # number cells are read as Calc shows them, not as their raw value
+        shown = ["2026-10-18", "1,234.50", "12345678901234567890", "007"]
+        sheet = FakeSheet.from_columns([shown])
+        sheet.values = {(0, 0): 46313.0, (0, 1): 1234.5, (0, 2): 1.2345678901234567e19, (0, 3): 7.0}
+        handler = self._handler(sheet, (0, 0, 0, 3))
+        self.assertEqual(handler.read_selected_data(), [shown])
+        # a cell and its string for each number
+        self.assertEqual(sheet.calls, 2 + 2 * len(shown))
+
+    def test_column_letter(self):
+        letters = [CalcHandler.column_letter(col) for col in (0, 25, 26, 51, 701, 702)]
+        self.assertEqual(letters, ["A", "Z", "AA", "AZ", "ZZ", "AAA"])
+
+    def test_write_to_calc(self):
+        # two runs of empty outputs in column AB, inputs in column AA
+        inputs = ["a", "b", "c", "d", "e"]
+        outputs = ["", "", "C", "", ""]
+        sheet = FakeSheet.from_columns([inputs, outputs], start_column=26)
+        handler = self._handler(sheet, (26, 0, 27, 4))
+        handler.read_selected_data()
+        handler.formula = "CONCAT(MID(<input>,1,1))"
+
+        sheet.calls = 0
+        handler.write_to_calc()
+        self.assertEqual(sheet.cells[(27, 0)], "CONCAT(MID(AA1,1,1))")
+        self.assertEqual(sheet.cells[(27, 4)], "CONCAT(MID(AA5,1,1))")
+        self.assertEqual(sheet.cells[(27, 2)], "C")
+        # the sheet, then a range and a write for each run
+        self.assertEqual(sheet.calls, 5)
+
+        handler.write_to_calc(as_formula=True)
+        self.assertEqual(sheet.formulas[(27, 3)], "=CONCAT(MID(AA4,1,1))")
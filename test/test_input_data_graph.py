@@ -0,0 +1,246 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# graph modules import the language package relative to src/
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+from graphs.input_data_graph import InputDataGraph
+from graphs.graph_cache import GraphCache
+from graphs import snapshot
+
+class TestInputDataGraph(unittest.TestCase):
+    def _naive_occurrences(self, s):
+        occ = {}
+        for i in range(len(s)):
+            for j in range(i+1, len(s)+1):
+                matches = [p for p in range(len(s)) if s.startswith(s[i:j], p)]
+                occ[(i, j-i)] = (matches.index(i), len(matches))
+        return occ
+
+    def test_literal_occurrences(self):
+        for string in ["", "a", "aaaa", "abab a", "Mumbai, India", "New York, USA"]:
+            occ = InputDataGraph._literal_occurrences(string)
+            found = {
+                (i, span): occ[i][span]
+                for i in range(len(string))
+                for span in range(1, len(string) - i + 1)
+            }
+            self.assertEqual(found, self._naive_occurrences(string))
+
+    def test_literal_edges(self):
+        string = "abab"
+        graph = InputDataGraph.gen_graph_str(string, 0)
+
+        # "ab" occurs twice, at 1-indexed positions 1 and 3
+        self.assertIn(("ab", (1, -2)), graph.edge_labels[1][3])
+        self.assertIn(("ab", (2, -1)), graph.edge_labels[3][5])
+        self.assertIn(("abab", (1, -1)), graph.edge_labels[1][5])
+
+    def test_intersect(self):
+        graph = InputDataGraph.intersect(
+            InputDataGraph.gen_graph_str("Newark, USA", 0),
+            InputDataGraph.gen_graph_str("Mumbai, India", 1)
+        )
+
+        nodes = {frozenset(graph.node_labels[v]): v for v in graph.nodes}
+        comma_l = nodes[frozenset([(0, 7), (1, 7)])]
+        comma_r = nodes[frozenset([(0, 8), (1, 8)])]
+
+        # the comma is the first of one in both strings
+        self.assertIn((",", (1, -1)), graph.edge_labels[comma_l][comma_r])
+
+        # literal matches only survive when both strings share them
+        for v1 in graph.edge_labels:
+            for v2 in graph.edge_labels[v1]:
+                self.assertNotIn(("USA", (1, -1)), graph.edge_labels[v1][v2])
+
+    def test_builder(self):
+        graph = InputDataGraph(0)
+        for node in range(3):
+            graph.add_node(node)
+            graph.label_nodes(node, [(0, node)])
+        graph.label_edges((0, 1), [("Caps", (1, -1))])
+        graph.label_edges((1, 2), [("a", (1, -1)), ("LowerCase", (1, -1))])
+
+        self.assertEqual(list(graph.nodes), [0, 1, 2])
+        self.assertEqual(graph.edges[1], {2})
+        self.assertEqual(
+            graph.edge_labels[1][2],
+            {("a", (1, -1)), ("LowerCase", (1, -1))}
+        )
+        self.assertNotIn(2, graph.edge_labels)
+
+        # the graph can keep growing after it has been read
+        graph.add_node(3)
+        graph.label_edges((2, 3), [("b", (1, -1))])
+        self.assertEqual(graph.edges[2], {3})
+        self.assertEqual(graph.edges[0], {1})
+
+    def test_indexes(self):
+        graph = InputDataGraph.gen_graph_str("ab", 3)
+
+        self.assertEqual(graph.find_nodes((3, 2)), [2])
+        self.assertEqual(graph.find_nodes((4, 2)), [])
+
+        incoming = dict(graph.in_edges(3))
+        self.assertEqual(set(incoming), {1, 2})
+        self.assertIn(("b", (1, -1)), incoming[2])
+        self.assertIn(("ab", (1, -1)), incoming[1])
+
+        outgoing = dict(graph.out_edges(1))
+        self.assertEqual(set(outgoing), {2, 3})
+        self.assertEqual(outgoing, {v2: graph.edge_labels[1][v2] for v2 in outgoing})
+
+    def test_union(self):
+        # the same string in both columns keeps a node per column
+        col_0 = InputDataGraph.gen_graph_str("ab", 0)
+        col_1 = InputDataGraph.gen_graph_str("ab", 0)
+        col_2 = InputDataGraph.gen_graph_str("xyz", 1)
+        graph = InputDataGraph.union([col_0, col_1, col_2])
+
+        self.assertEqual(graph.num_columns, 3)
+        self.assertEqual(len(graph.nodes), len(col_0.nodes) + len(col_1.nodes) + len(col_2.nodes))
+        self.assertEqual(graph.num_edges, col_0.num_edges + col_1.num_edges + col_2.num_edges)
+
+        self.assertEqual(len(graph.find_nodes((0, 1))), 2)
+        first, = graph.find_nodes((0, 1), column=1)
+        self.assertEqual(first, len(col_0.nodes) + 1)
+        self.assertEqual(graph.find_nodes((0, 1), column=2), [])
+
+        # edges stay inside their column, with their own labels
+        base = len(col_0.nodes) + len(col_1.nodes)
+        self.assertEqual(graph.find_nodes((1, 1), column=2), [base + 1])
+        self.assertEqual(
+            dict(graph.edge_labels[base + 1]),
+            {v + base: labels for v, labels in col_2.edge_labels[1].items()}
+        )
+
+class TestGraphCache(unittest.TestCase):
+    def _same(self, graph_1, graph_2):
+        self.assertEqual(list(graph_1.nodes), list(graph_2.nodes))
+        self.assertEqual(graph_1.node_labels, graph_2.node_labels)
+        self.assertEqual(
+            {v1: dict(targets) for v1, targets in graph_1.edge_labels.items()},
+            {v1: dict(targets) for v1, targets in graph_2.edge_labels.items()}
+        )
+
+    def test_rebinds_id(self):
+        cache = GraphCache()
+        self._same(cache.graph("Mumbai, India", 0), InputDataGraph.gen_graph_str("Mumbai, India", 0))
+        graph = cache.graph("Mumbai, India", 5)
+        self._same(graph, InputDataGraph.gen_graph_str("Mumbai, India", 5))
+        self.assertEqual(graph.id, 5)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # graphs bound from one entry intersect like freshly built ones
+        self._same(
+            InputDataGraph.intersect(graph, cache.graph("Newark, USA", 1)),
+            InputDataGraph.intersect(
+                InputDataGraph.gen_graph_str("Mumbai, India", 5),
+                InputDataGraph.gen_graph_str("Newark, USA", 1)
+            )
+        )
+
+    def test_growing_a_hit_leaves_the_entry(self):
+        cache = GraphCache()
+        graph = cache.graph("ab", 0)
+        graph.add_node(4)
+        graph.label_edges((3, 4), [("c", (1, -1))])
+        self._same(cache.graph("ab", 0), InputDataGraph.gen_graph_str("ab", 0))
+
+    def test_eviction(self):
+        cache = GraphCache(max_entries=2)
+        for s in ["a", "b", "a", "c", "b"]:
+            cache.graph(s, 0)
+
+        # "b" was least recently used when "c" came in
+        counters = cache.counters()
+        self.assertEqual(
+            {key: counters[key] for key in ("hits", "misses", "evictions", "entries")},
+            {"hits": 1, "misses": 4, "evictions": 2, "entries": 2}
+        )
+        self.assertNotIn("a", cache)
+        self.assertIn("b", cache)
+
+    def test_size_bound(self):
+        short, long = "ab", "Mumbai, India " * 20
+        sizes = {}
+        for s in (short, long):
+            cache = GraphCache()
+            cache.graph(s, 0)
+            sizes[s] = cache.nbytes
+
+        # the long string's graph pushes the short one out
+        cache = GraphCache(max_bytes=sizes[short] + sizes[long] - 1)
+        cache.graph(short, 0)
+        cache.graph(long, 0)
+        self.assertNotIn(short, cache)
+        self.assertIn(long, cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.nbytes, sizes[long])
+
+        # and is not kept at all by a cache it does not fit in
+        cache = GraphCache(max_bytes=sizes[short])
+        cache.graph(long, 0)
+        cache.graph(short, 0)
+        self.assertEqual((len(cache), cache.nbytes), (1, sizes[short]))
+
+    def test_counters_since(self):
+        cache = GraphCache()
+        cache.graph("a", 0)
+        base = cache.counters()
+        cache.graph("a", 0)
+        cache.graph("b", 0)
+        counters = cache.counters(base)
+        self.assertEqual((counters["hits"], counters["misses"], counters["entries"]), (1, 1, 2))
+
+class TestSnapshot(unittest.TestCase):
+    def _graph(self):
+        return InputDataGraph.intersect(
+            InputDataGraph.gen_graph_str("Newark, USA", 0),
+            InputDataGraph.gen_graph_str("Mumbai, India", 1)
+        )
+
+    def test_round_trip(self):
+        graph = self._graph()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.snap")
+            snapshot.dump(graph, path)
+            for loaded in [snapshot.loads(snapshot.dumps(graph)), snapshot.load(path)]:
+                TestGraphCache._same(self, loaded, graph)
+                self.assertEqual(loaded.id, graph.id)
+
+                # a loaded graph intersects like the one it was written from
+                other = InputDataGraph.gen_graph_str("New York, USA", 2)
+                TestGraphCache._same(
+                    self,
+                    InputDataGraph.intersect(loaded, other),
+                    InputDataGraph.intersect(graph, other)
+                )
+
+    def test_decodes_on_access(self):
+        graph = self._graph()
+        num_nodes = len(graph.nodes)
+        loaded = snapshot.loads(snapshot.dumps(graph))
+        unset = snapshot._Decoded._UNSET
+        self.assertEqual(loaded._node_labels._values.count(unset), num_nodes)
+        self.assertEqual(loaded._provenance._values.count(unset), num_nodes)
+
+        self.assertEqual(loaded.node_labels[3], graph.node_labels[3])
+        self.assertEqual(loaded._node_labels._values.count(unset), num_nodes - 1)
+
+        # a loaded graph can still be built on
+        for g in (loaded, graph):
+            g.add_node(num_nodes)
+            g.label_nodes(num_nodes, [(7, 0)])
+            g.label_edges((0, num_nodes), [("x", 1)])
+        TestGraphCache._same(self, loaded, graph)
+
+    def test_bad_version(self):
+        data = bytearray(snapshot.dumps(self._graph()))
+        data[8] += 1
+        with self.assertRaises(ValueError):
+            snapshot.loads(bytes(data))
+        with self.assertRaises(ValueError):
+            snapshot.loads(b"not a snapshot")
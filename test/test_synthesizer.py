@@ -0,0 +1,221 @@
+import os
+import sys
+import unittest
+
+# the synthesizer imports its packages relative to src/
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+from synthesizer import SynthDriver
+from graphs.dag import DAG
+from budget import Budget
+from language.compiler import compile_program
+
+INPUTS = [
+    "Mumbai, India",
+    "Los Angeles, USA",
+    "Newark, USA",
+    "New York, USA",
+    "Wellington, New Zeland"
+]
+
+OUTPUTS = ["India", "USA", "USA", "USA", "New Zeland"]
+
+class TestSynthSession(unittest.TestCase):
+    def test_matches_batch(self):
+        # the session intersects the examples in the order they are added
+        batch = SynthDriver(order_examples=False)
+        idg = batch.gen_input_data_graph([INPUTS])
+        dag = batch.gen_dag([INPUTS], OUTPUTS, idg)
+
+        session = SynthDriver().start_session(INPUTS)
+        for inp, out in zip(INPUTS, OUTPUTS):
+            session.add_example(inp, out)
+
+        self.assertEqual(session.dag.final_node, dag.final_node)
+        for node in dag.mapping:
+            self.assertEqual(
+                {n: len(e) for n, e in session.dag.mapping[node].items()},
+                {n: len(e) for n, e in dag.mapping[node].items()}
+            )
+        self.assertTrue(session.extract_formula().startswith("CONCAT("))
+
+    def test_remove_last_example(self):
+        session = SynthDriver().start_session(INPUTS)
+        first = session.add_example(INPUTS[0], OUTPUTS[0])
+        session.add_example(INPUTS[1], OUTPUTS[1])
+
+        self.assertEqual(session.remove_last_example(), (INPUTS[1], OUTPUTS[1]))
+        self.assertIs(session.dag, first)
+
+    def test_add_input_rows(self):
+        session = SynthDriver().start_session(INPUTS[:2])
+        session.add_example(INPUTS[0], OUTPUTS[0])
+        session.add_example(INPUTS[1], OUTPUTS[1])
+        session.add_input_rows(INPUTS[2:])
+
+        # the examples are re-learned against the smaller IDG
+        self.assertEqual(len(session.examples), 2)
+        self.assertFalse(session.dag.empty)
+
+        with self.assertRaises(RuntimeError):
+            SynthDriver().start_session(INPUTS).extract_formula()
+
+    def test_example_on_new_row(self):
+        synth = SynthDriver(stats=True)
+        session = synth.start_session()
+        for inp, out in zip(INPUTS[:3], OUTPUTS):
+            session.add_example(inp, out)
+
+        # each example is learned once, nothing is re-learned for the new rows
+        self.assertEqual(synth.stats.phases["DAG.learn"]["calls"], 3)
+
+        full = SynthDriver().start_session(INPUTS[:3])
+        for inp, out in zip(INPUTS[:3], OUTPUTS):
+            full.add_example(inp, out)
+        for node in full.dag.mapping:
+            self.assertEqual(
+                {n: len(e) for n, e in session.dag.mapping[node].items()},
+                {n: len(e) for n, e in full.dag.mapping[node].items()}
+            )
+
+class TestSynthStats(unittest.TestCase):
+    def test_phases(self):
+        synth = SynthDriver(stats=True)
+        synth.synthesize([INPUTS], OUTPUTS)
+
+        phases = synth.stats.phases
+        self.assertEqual(phases["gen_graph_str"]["calls"], len(INPUTS))
+        self.assertEqual(phases["IDG.intersect"]["calls"], len(INPUTS) - 1)
+        self.assertEqual(phases["DAG.learn"]["calls"], len(OUTPUTS))
+        self.assertEqual(phases["extract_formula"]["calls"], 1)
+        self.assertEqual(set(synth.stats.last("DAG")), {"DAGNodes", "DAGEdges", "DAGExprs"})
+
+    def test_off_by_default(self):
+        synth = SynthDriver()
+        synth.synthesize([INPUTS], OUTPUTS)
+        self.assertIsNone(synth.stats)
+
+class TestBudget(unittest.TestCase):
+    def test_out_of_time(self):
+        synth = SynthDriver(time_budget=0, stats=True)
+        program = synth.synthesize_program([INPUTS], OUTPUTS)
+
+        # only the first example makes it in, and the program agrees with it
+        first = synth.stats.info["example_order"][0]
+        self.assertEqual(synth.uncovered, [i for i in range(len(OUTPUTS)) if i != first])
+        self.assertEqual(compile_program(program)(INPUTS[first]), OUTPUTS[first])
+
+    def test_within_budget(self):
+        synth = SynthDriver(time_budget=60, memory_budget=1 << 30)
+        formula = synth.synthesize([INPUTS], OUTPUTS)
+        self.assertEqual(synth.uncovered, [])
+        self.assertEqual(formula, SynthDriver().synthesize([INPUTS], OUTPUTS))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/statm"), "needs the current resident set size")
+    def test_memory_after_peak(self):
+        # a peak before the budget was created does not hide growth after it
+        peak = bytearray(64 << 20)
+        del peak
+        budget = Budget(memory=16 << 20)
+        grown = bytearray(32 << 20)
+        grown[::4096] = b"x" * len(grown[::4096])
+        self.assertTrue(any(budget.expired() for _ in range(Budget.MEMORY_CHECK_EVERY)))
+
+class TestPlanExamples(unittest.TestCase):
+    def test_short_outputs_first(self):
+        synth = SynthDriver(stats=True)
+        formula = synth.synthesize([INPUTS], OUTPUTS)
+
+        order = synth.stats.info["example_order"]
+        self.assertEqual(sorted(order), list(range(len(OUTPUTS))))
+        self.assertEqual(order[-1], OUTPUTS.index("New Zeland"))
+
+        # the order changes the work done, not the program found
+        self.assertEqual(formula, SynthDriver(order_examples=False).synthesize([INPUTS], OUTPUTS))
+
+    def test_null_outputs(self):
+        # rows without an output are not examples, in either order
+        outputs = [None, "USA", None, "USA", "New Zeland"]
+        for order_examples in (True, False):
+            synth = SynthDriver(stats=True, order_examples=order_examples)
+            program = synth.synthesize_program([INPUTS], outputs)
+            self.assertEqual(sorted(synth.stats.info["example_order"]), [1, 3, 4])
+            self.assertEqual(compile_program(program)(INPUTS[0]), "India")
+
+        with self.assertRaises(ValueError):
+            SynthDriver().synthesize([INPUTS], [None] * len(INPUTS))
+
+class TestCegis(unittest.TestCase):
+    def test_consistent_with_every_example(self):
+        synth = SynthDriver(stats=True, cegis=True)
+        program = synth.synthesize_program([INPUTS], OUTPUTS)
+
+        self.assertEqual(compile_program(program).apply_column(INPUTS), OUTPUTS)
+        used = synth.stats.info["cegis_examples"]
+        self.assertLess(len(used), len(OUTPUTS))
+        self.assertEqual(synth.stats.phases["DAG.intersect"]["calls"], len(used) - 1)
+
+    def test_seed(self):
+        synth = SynthDriver(stats=True)
+        idg = synth.gen_input_data_graph([INPUTS])
+        dag = synth.gen_dag_cegis([INPUTS], OUTPUTS, idg, seed=len(OUTPUTS))
+
+        # a seed of every example is the plain intersection
+        self.assertEqual(len(synth.stats.info["cegis_examples"]), len(OUTPUTS))
+        self.assertEqual(
+            synth.extract_formula(dag),
+            SynthDriver().synthesize([INPUTS], OUTPUTS)
+        )
+
+class TestMultiColumn(unittest.TestCase):
+    def test_gen_dag(self):
+        first = ["Hone", "Aysu", "Ravi"]
+        last = ["Mukasine", "Polat", "Shankar"]
+        outputs = ["Mukasine, H", "Polat, A"]
+
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([first, last])
+        dag = synth.gen_dag([first, last], outputs, idg)
+        formula = synth.extract_formula(dag)
+
+        # the last name comes from the second column
+        self.assertIn("<input1>", formula)
+        self.assertIn("<input>", formula)
+
+class TestExtractPrograms(unittest.TestCase):
+    def test_k_best(self):
+        # a single example leaves many programs
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([INPUTS])
+        dag = synth.gen_dag([INPUTS], OUTPUTS[:1], idg)
+
+        programs = list(synth.extract_programs(dag, 20))
+        self.assertEqual(len(programs), 20)
+        self.assertEqual(len(set(map(repr, programs))), 20)
+        self.assertEqual(repr(programs[0]), repr(synth.extract_program(dag)))
+
+        # single expressions for the whole output first, then by weight
+        # and the number of pieces
+        scores = [
+            (len(p.substr_exprs) > 1, -round(sum(map(DAG.weight, p.substr_exprs)), 9), len(p.substr_exprs))
+            for p in programs
+        ]
+        self.assertEqual(scores, sorted(scores))
+
+    def test_prefers_single_expression(self):
+        # splitting USA into pieces weighs more, but the single token
+        # substring is the program that generalizes
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([["Newark, USA", "Mumbai, India"]])
+        dag = synth.gen_dag([["Newark, USA", "Mumbai, India"]], ["USA", "India"], idg)
+        program = synth.extract_program(dag)
+
+        self.assertEqual(len(program.substr_exprs), 1)
+        self.assertEqual(compile_program(program).apply_column(["Amsterdam, Netherlands"]), ["Netherlands"])
+
+    def test_fewer_than_k(self):
+        synth = SynthDriver()
+        idg = synth.gen_input_data_graph([["ab"]])
+        dag = synth.gen_dag([["ab"]], ["x"], idg)
+
+        # the constant is the only program
+        self.assertEqual([p.to_formula() for p in synth.extract_programs(dag, 5)], ['CONCAT("x")'])
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+# the synthesizer imports its packages relative to src/
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+from synthesizer import SynthDriver
+from language import compile_program
+from transform import transform_file
+
+INPUTS = ["Mumbai, India", "Los Angeles, USA", "Wellington, New Zeland"]
+OUTPUTS = ["India", "USA", "New Zeland"]
+
+class TestTransform(unittest.TestCase):
+    def setUp(self):
+        synth = SynthDriver()
+        self.program = compile_program(synth.synthesize_program([INPUTS], OUTPUTS))
+        self.dir = tempfile.TemporaryDirectory()
+        self.rows = [f"Town {i}, Land{chr(65 + i % 26)}" for i in range(50)]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def test_csv(self):
+        with open(self._path("in.csv"), "w", encoding="utf-8") as f:
+            f.write("id,city\n")
+            f.writelines(f"{i},\"{row}\"\n" for i, row in enumerate(self.rows))
+
+        expected = None
+        for workers in (0, 2):
+            out = self._path(f"out{workers}.csv")
+            count = transform_file(
+                        self.program, self._path("in.csv"), out, 1,
+                        header=True, workers=workers, chunk_size=7
+                    )
+            self.assertEqual(count, len(self.rows))
+            with open(out, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+
+            # row order is kept whether or not chunks go to a pool
+            if expected is None:
+                expected = lines
+            self.assertEqual(lines, expected)
+        self.assertEqual(expected[0], "id,city,output")
+        self.assertEqual(expected[2], "1,\"Town 1, LandB\",LandB")
+
+    def test_jsonl(self):
+        with open(self._path("in.jsonl"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps({"city": row}) + "\n" for row in self.rows[:3])
+            f.write(json.dumps({"city": "no comma"}) + "\n")
+
+        transform_file(self.program, self._path("in.jsonl"), self._path("out.jsonl"), "city")
+        with open(self._path("out.jsonl"), encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["output"] for row in rows], ["LandA", "LandB", "LandC", ""])
+
+    def test_unread_column(self):
+        # the second column of the spec plays no part in the program
+        synth = SynthDriver()
+        program = compile_program(
+            synth.synthesize_program([INPUTS, ["x", "y", "z"]], OUTPUTS), num_columns=2
+        )
+        self.assertEqual(program.num_columns, 2)
+
+        with open(self._path("in.csv"), "w", encoding="utf-8") as f:
+            f.writelines(f"\"{row}\",n\n" for row in self.rows[:2])
+        transform_file(program, self._path("in.csv"), self._path("out.csv"), [0, 1])
+        with open(self._path("out.csv"), encoding="utf-8") as f:
+            self.assertEqual(f.read().splitlines(), ["\"Town 0, LandA\",n,LandA", "\"Town 1, LandB\",n,LandB"])
+
+        with self.assertRaises(ValueError):
+            transform_file(program, self._path("in.csv"), self._path("out.csv"), 0)
+
+    def test_chunk_size(self):
+        with open(self._path("in.csv"), "w", encoding="utf-8") as f:
+            f.write("\"Town 0, LandA\"\n")
+        with self.assertRaises(ValueError):
+            transform_file(self.program, self._path("in.csv"), self._path("out.csv"), 0, chunk_size=0)
+
+    def test_missing_column(self):
+        # a blank line and a short row in CSV, a missing key in JSONL
+        with open(self._path("in.csv"), "w", encoding="utf-8") as f:
+            f.write("0,\"Town 0, LandA\"\n\n2\n3,\"Town 3, LandD\"\n")
+        for workers in (0, 2):
+            transform_file(self.program, self._path("in.csv"), self._path("out.csv"), 1, workers=workers)
+            with open(self._path("out.csv"), encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            self.assertEqual(lines, ["0,\"Town 0, LandA\",LandA", "\"\"", "2,", "3,\"Town 3, LandD\",LandD"])
+
+        with open(self._path("in.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps({"city": self.rows[0]}) + "\n" + json.dumps({"town": "x"}) + "\n")
+        transform_file(self.program, self._path("in.jsonl"), self._path("out.jsonl"), "city")
+        with open(self._path("out.jsonl"), encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["output"] for line in f], ["LandA", ""])
+